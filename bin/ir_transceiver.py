@@ -32,23 +32,46 @@ import time
 JSON Message structure, keys :
     - 'header' : according to wsserver specifications : 'header' :{{'type',  'idws', 'idmsg', 'ip', 'timestamp' }} see wsserver.py
     - header type = 'req-ack' : Client request with ack
+        - 'channel' : optional IR channel name (see 'getChannels' and option --channel) of IR requests (sendIRCode, sendIRCodes,
+                getQueueState, getMemIRCode, set/getTolerances, getState, set/getAckTimeouts, getCacheStats, getHistory,
+                getCaptureStats, set/getCaptureFilter), default channel if missing. Each channel has its own send queue : sends to
+                different channels run concurrently, sends to the same channel stay in order. Unknown channel ack error : "Unknown channel : <name>".
         - 'resquest' : Client resquest a WebSocket server action.
             - 'server-hbeat' : recept an hbeat
                     Value set : nothing
                     Value ack returned : 
                         {"error" : "", "request": "server-hbeat",
                           "data" : {"error" : ""}}
-            - 'sendIRCode' : sending an IR code through RpiIRTrans
+            - 'sendIRCode' : sending an IR code through RpiIRTrans, the code is queued for the emitter worker.
                     Value set : 
                         {"datatype": "", "code": "", "encoder": ""}
-                    Value ack returned :                   
-                        {"error": "if, Global message", "request": "sendircode",
-                          "data": {"encoder": "", "code": "", "error": "if, encoder message" or ""}}
-            - 'getMemircode' : return (by ack) the last (current) code in memory.
+                    Value ack returned immediately :
+                        {"error": "" or "Send queue full.", "request": "sendIRCode",
+                          "data": {"status": "queued", "jobid": 12, "depth": 1, "channel": "main", "error": ""}}
+                    Value ack returned when code is sent (for 'req' type, published as 'codesent' pub) :
+                        {"error": "if, Global message", "request": "sendIRCode",
+                          "data": {"status": "sent" or "failed", "jobid": 12, "channel": "main", "encoder": "", "code": "", "error": "if, encoder message" or ""}}
+            - 'sendIRCodes' : sending a list of IR codes (max 16) in one queued job, emitted back to back in one hardware
+                    session, optional "gap" in ms before a code. Last sent code is saved once. Acks as 'sendIRCode'.
+                    Value set :
+                        {"codes": [{"datatype": "", "code": "", "encoder": "", "gap": 0}, ...]}
+                    Value immediate ack returned :
+                        {"error": "" or "Send queue full.", "request": "sendIRCodes", "data": {"status": "queued", "jobid": 13, "depth": 0, "error": ""}}
+                    Value final ack returned, per code results in codes order :
+                        {"error": "if, Global message", "request": "sendIRCodes",
+                          "data": {"status": "sent" or "failed", "jobid": 13, "sent": 2, "failed": 1, "error": "1/3 codes failed." or "",
+                                      "results": [{"encoder": "", "code": "", "error": ""}, ...]}}
+            - 'getQueueState' : return send queue state.
                     Value set : nothing
+                    Value ack returned :
+                        {"error": "", "request": "getQueueState",
+                          "data": {"depth": 0, "maxdepth": 3, "current": 0, "submitted": 10, "sent": 9, "failed": 1, "rejected": 0, "cancelled": 0,
+                                   "wait": {"last": 0.0, "max": 2.1, "avg": 0.4}, "error": ""}}
+            - 'getMemircode' : return (by ack) the last (current) code in memory, optional "datatype": "HEX" for HEX code.
+                    Value set : nothing or {"datatype": "HEX"}
                     Value ack returned :
                         {"error": "if, Global message", "request": "getMemIRCode",
-                          "data": {"encoder": "", "code": "", "error": "if, encoder message" or ""}}
+                          "data": {"encoder": "", "code": "", "datatype": "HEX" (if HEX), "error": "if, encoder message" or ""}}
             - 'setTolerances'
                     Value set : 
                         {"tolerances": {<A dict Function of encoder, DAIKIN example> "large": 300, "maxout": 10, "tolerance": 150}, "encoder": ""}
@@ -65,17 +88,106 @@ JSON Message structure, keys :
                     Value ack returned :
                         {"error": "" message if no pin set for state capability.", 
                           "data": {"state": 0 or 1 for on/ off status, 0 if no capability, "error": "message if no pin set for state capability." or ""}}
+            - 'setAckTimeouts' : set max times (s) waiting hardware ack after emission and after a received code.
+                    Value set :
+                        {"timeouts": {"emit": 1.0, "receive": 3.5}}
+                    Value ack returned :
+                        {"error": "if, Global message", "request": "setAckTimeouts", "data": {"error": "if, bad parameters" or ""}}
+            - 'getAckTimeouts'
+                    Value set : nothing
+                    Value ack returned :
+                        {"error": "", "request": "getAckTimeouts", "data": {"timeouts": {"emit": 1.0, "receive": 3.5}, "error": ""}}
+            - 'getCacheStats' : return encoded codes cache counters.
+                    Value set : nothing
+                    Value ack returned :
+                        {"error": "", "request": "getCacheStats",
+                          "data": {"size": 3, "maxsize": 32, "hits": 120, "misses": 3, "evictions": 0, "error": ""}}
+            - 'setLogLevel' : set runtime log level ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL") of a logger,
+                    project ones are "irtrans" (all) or "irtrans.trans", "irtrans.daikin", "irtrans.wsserver", "irtrans.manager"...
+                    and "ws4py" for WebSocket server log file.
+                    Value set :
+                        {"level": "DEBUG", "logger": "irtrans.trans"}   ("logger" optional, default "irtrans")
+                    Value ack returned :
+                        {"error": "if, Global message", "request": "setLogLevel", "data": {"logger": "irtrans.trans", "level": "DEBUG", "error": ""}}
+            - 'getLogLevels'
+                    Value set : nothing
+                    Value ack returned :
+                        {"error": "", "request": "getLogLevels", "data": {"levels": {"irtrans": "INFO", "ws4py": "INFO", ...}, "error": ""}}
+            - 'getHistory' : return received and sent IR codes after timestamp "since" (s), oldest first, at most "limit",
+                    optional "encoder" filter. If "more" is true, ask next events with "since" = returned "last".
+                    "origin" is "remote" for a received code or WS client idws for a sent one, "state" is hard state.
+                    Value set :
+                        {"since": 1394795765.29, "limit": 100, "encoder": "DAIKIN"}   (all optional)
+                    Value ack returned :
+                        {"error": "", "request": "getHistory",
+                          "data": {"events": [{"timestamp": 1394795770.1, "type": "received" or "sent", "origin": "remote",
+                                                         "state": 1, "encoder": "DAIKIN", "code": "", "error": ""}, ...],
+                                      "last": 1394795770.1, "more": false, "error": ""}}
+            - 'getChannels' : return IR channels, "queue" is send queue depth.
+                    Value set : nothing
+                    Value ack returned :
+                        {"error": "", "request": "getChannels",
+                          "data": {"default": "main", "channels": [{"name": "main", "emitter": 18, "receiver": 25, "ack": 17, "mode": "pwm",
+                                                                                    "encoders": ["DAIKIN"], "queue": 0}, ...], "error": ""}}
+            - 'getStats' : return latency (ms histograms) and throughput metrics, "reset": true clears them after report.
+                    Histograms : "capture.todecode", "decode.<encoder>", "emit.duration", "ack.latency", "broadcast.duration",
+                                       "decode.<encoder>.rejectat" (pairs decoded before stream decoder rejects a capture, not ms).
+                    Counters : "ack.timeouts", "emit.retries", "capture.filtered", "broadcast.sent", "broadcast.failed", "broadcast.filtered" (clients skipped by topics).
+                    Value set :
+                        {"reset": false}   (optional)
+                    Value ack returned :
+                        {"error": "", "request": "getStats",
+                          "data": {"uptime": 3600.2, "clients": 3, "queue": 0 (all channels),
+                                      "persist": {"saved": 12, "written": 4, "errors": 0, "pending": false} (default channel),
+                                      "channels": {"main": {"queue": 0, "persist": {...}, "history": {...}}, ...}, "counters": {"ack.timeouts": 1, ...},
+                                      "histograms": {"emit.duration": {"count": 12, "min": 180.2, "max": 190.5, "avg": 184.1,
+                                                                "p50": 200, "p95": 200, "p99": 200, "bounds": [0.05, ...], "buckets": [0, ...]}, ...},
+                                      "error": ""}}
+            - 'getCaptureStats' : return received captures ring buffer counters, overruns are captures dropped when buffer is full.
+                    Value set : nothing
+                    Value ack returned :
+                        {"error": "", "request": "getCaptureStats",
+                          "data": {"slots": 16, "maxpairs": 512, "depth": 0, "maxdepth": 2, "captured": 40, "decoded": 40,
+                                      "overruns": 0, "truncated": 0,
+                                      "filter": {"passed": 40, "short": 120, "weak": 3, "ratelimited": 0, "glitches": 12}, "error": ""}}
+            - 'setCaptureFilter' : set pre-decode filter of received captures (see capture.py), dropped captures are not decoded nor
+                    broadcast : pulses and pauses shorter than "glitch" us are merged, captures with less than "minpairs" pairs or
+                    "minenergy" us of pulses are dropped, over "rate" captures by second (after a burst of "burst") are dropped.
+                    Value set :
+                        {"filter": {"enabled": true, "glitch": 100, "minpairs": 8, "minenergy": 2000, "rate": 5.0, "burst": 10}} (keys optional)
+                    Value ack returned :
+                        {"error": "if, Global message", "request": "setCaptureFilter", "data": {"error": "if, bad parameters" or ""}}
+            - 'getCaptureFilter'
+                    Value set : nothing
+                    Value ack returned :
+                        {"error": "", "request": "getCaptureFilter",
+                          "data": {"filter": {"enabled": true, "glitch": 100, "minpairs": 8, "minenergy": 2000, "rate": 5.0, "burst": 10}, "error": ""}}
                       
-    - header type = 'pub' : Message broadcast for all client
+            - 'subscribe' / 'unsubscribe' : handled by WebSocket server (see wsserver.py), select pubs received by client
+                    with topics filters on pub type, encoder and channel. Without subscription a client receives all pubs.
+                    Value set :
+                        {"topics": [{"type": "codereceived", "encoder": "DAIKIN", "channel": "main"}, {"type": "hardState"}]}
+                    Value ack returned :
+                        {"error": "" or "Bad topic ...", "request": "subscribe", "data": {"topics": [...], "all": false, "error": ""}}
+    - header type = 'pub' : Message broadcast for all client (or subscribed ones)
         - "host": "<Name of server host>",
         - "type" : The type of plushed message
             - 'codereceived' : an ir code if received by IRTrans.
-                - "data": {"encoder": "", "code": ""', "error": "if, encoder message" or ""}}
+                - "data": {"channel": "main", "encoder": "", "code": ""', "error": "if, encoder message" or ""}}
             - 'hardState' : if capability and codereceived is not reconized publish hard state.
-                - "data": {"state": 0 or 1, "error":""}
+                - "data": {"channel": "main", "state": 0 or 1, "error":""}
+            - 'stats' : periodic metrics (option --stats-period), same data as 'getStats' request.
+            - 'codesent' : result of a queued 'sendIRCode' 'req' request (without ack).
+                - "data": {"status": "sent" or "failed", "jobid": 12, "channel": "main", "encoder": "", "code": "", "error": ""}
+            - 'rawcapture' : every capture of receivers with its pulse pairs, only for clients subscribed to it.
+                Binary frame for clients which negotiated binary frames at 'ack-connect' (see wsserver.py, binframe.py).
+                - "data": {"channel": "main", "pulses": [[2, 10000], [3448, 1720], ...], "encoder": "", "code": "", "error": ""}
             
 
- 'datatype' : Encoding type of data ("RAW", "BinTimings", "HEX")
+ 'datatype' : Encoding type of data ("RAW", "BinTimings", "HEX"), "RAW" code is a pulse pairs list,
+                   or the pulse train of a binary frame (see binframe.py). "HEX" code is data and checksum bytes in hexadecimal
+                   (DAIKIN : 19 bytes, "11da27000242..."), a "HEX" sendIRCode has its results codes in HEX.
+                   Client asking 'datatype': "HEX" at 'ack-connect' receives all codes in HEX (see wsserver.py).
  'encoder' : Encoder protocole ("DAIKIN", "RC5", ...)
  'code', 'code' : Infrared code
  'tolerances': A dict depending of encoder, type for example DAIKIN : {"tolerance": 150, "large": 300, "maxout": 10}
@@ -142,12 +254,21 @@ JSON Message structure, keys :
 import sys
 import os
 import time
+import argparse
+import tempfile
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from lib.rpi_irtrans import RpiIRTrans
+from lib.channels import ChannelManager, ChannelException, CHANNELDEFAULT, CODEFILE
 from lib.daikincode import DaikinCode
-from lib.wsserver import BroadcastServer
+from lib.wsserver import BroadcastServer, codeVariant
+from lib.logqueue import getLogger, startLogging, stopLogging, setLogLevel, getLogLevels, LOGLEVELS
+from lib.stats import STATS
+from lib.irbackend import SimulatedBackend
+from lib.persist import PERSISTDELAY
+from lib.history import HISTORYSIZE
+
+log = getLogger("manager")
 
 class RpiTransceiverException(Exception):
     """Rpi Transceiver generic exception class.
@@ -162,81 +283,212 @@ class RpiTransceiverException(Exception):
         """String format objet"""
         return repr(self.msg+' '+self.value)
 
+WSBACKENDS = ["wsgiref", "asyncio"]
+
+# Requests using a channel, optional 'channel' key, default channel if missing
+CHANNELREQUESTS = ["sendIRCode", "sendIRCodes", "getQueueState", "getMemIRCode", "setTolerances", "getTolerances", "getState",
+                                "setAckTimeouts", "getAckTimeouts", "getCacheStats", "getHistory", "getCaptureStats",
+                                "setCaptureFilter", "getCaptureFilter"]
+
 class RpiTransceiver():
     
-    def __init__(self,  wsPort):
-        self._irTrans = RpiIRTrans(self, 18, 25, 17, 38000)
-        self._irTrans.register_Encoder("DAIKIN",  DaikinCode())
+    def __init__(self,  wsPort,  wsBackend = "wsgiref",  statsPeriod = 0,  backend = None,  persistDelay = PERSISTDELAY,
+                        historySize = HISTORYSIZE,  historyFile = None,  channels = [CHANNELDEFAULT],  codeFile = CODEFILE):
+        self._channels = ChannelManager(self, backend, persistDelay, historySize, historyFile, codeFile)
+        try :
+            self._channels.register_Encoder("DAIKIN",  DaikinCode)
+            for spec in channels : self._channels.addChannelSpec(spec)
+        except ChannelException :
+            self._channels.close()
+            raise
         self._log = None
-        self._wsServer =  BroadcastServer(wsPort,  self.cb_ServerWS,  self._log) # demarre le websocket server
+        self._statsPeriod = statsPeriod
+        if wsBackend == "asyncio" :
+            from lib.wsasyncserver import AsyncBroadcastServer
+            self._wsServer =  AsyncBroadcastServer(wsPort,  self.cb_ServerWS,  self._log) # demarre le websocket server
+        elif wsBackend == "wsgiref" :
+            self._wsServer =  BroadcastServer(wsPort,  self.cb_ServerWS,  self._log) # demarre le websocket server
+        else :
+            self._channels.close()
+            raise RpiTransceiverException("Unknown WebSocket backend : {0}".format(wsBackend))
         self._run()
     
     def cb_ServerWS(self, message):
         """Callback en provenance d'un client via server Websocket (resquest avec ou sans ack)"""
         blockAck = False
         report = {'error':  'Message not handle.'}
-        ackMsg = {}
         erAck = ''
-        self._irTrans.getState()
-        print "WS - Client Request",  message
+        log.debug("WS - Client Request %s",  message)
         if message.has_key('header') :
             if message['header']['type'] in ('req', 'req-ack'):
-                if message['request'] == 'server-hbeat' :
+                channel = self._channels.getChannel(message.get('channel'))
+                if channel is not None : channel.trans.getState()    # refresh hardware state (ackState) of replies
+                if channel is None and message['request'] in CHANNELREQUESTS :
+                    erAck = 'Client request Fail.'
+                    report['error'] = "Unknown channel : {0}".format(message.get('channel'))
+                elif message['request'] == 'server-hbeat' :
                     report['error'] =''
                 elif message['request'] == 'sendIRCode' :
-                    erAck = "IR emitter don't confirm final reception."
-                    report = self._irTrans.sendIRCode(message['encoder'],  message['datatype'], message['code'])
+                    erAck = "Fail to queue IR code."
+                    job = channel.queue.submit(channel.trans.sendIRCode, (message['encoder'],  message['datatype'], message['code'],
+                                                                message['header']['idws']), self.cb_SendJob, (message, channel.name))
+                    if job :
+                        report = {'error': '', 'status': job.status, 'jobid': job.id, 'depth': channel.queue.getState()['depth'],
+                                      'channel': channel.name}
+                    else :
+                        report = {'error': 'Send queue full.', 'status': 'failed', 'jobid': 0}
+                elif message['request'] == 'sendIRCodes' :
+                    erAck = "Fail to queue IR codes."
+                    job = channel.queue.submit(channel.trans.sendIRCodes, (message['codes'], message['header']['idws']), self.cb_SendJob,
+                                                                (message, channel.name))
+                    if job :
+                        report = {'error': '', 'status': job.status, 'jobid': job.id, 'depth': channel.queue.getState()['depth'],
+                                      'channel': channel.name}
+                    else :
+                        report = {'error': 'Send queue full.', 'status': 'failed', 'jobid': 0}
+                elif message['request'] == 'getQueueState' :
+                    erAck = 'Fail to get queue state.'
+                    report = channel.queue.getState()
                 elif message['request'] == 'getMemIRCode' :
                     erAck = 'Fail to get IR Code in memory.'
-                    report = self._irTrans.getMemIRcode()
+                    report = channel.trans.getMemIRcode(message.get('datatype'))
                 elif message['request'] == 'setTolerances' :
                     erAck = 'Fail to set tolerances.'
-                    report = self._irTrans.setTolerances(message['encoder'],  message['tolerances'])
+                    report = channel.trans.setTolerances(message['encoder'],  message['tolerances'])
                 elif message['request'] == 'getTolerances' :
                     erAck = 'Fail to get tolerances.'
-                    report = self._irTrans.getTolerances(message['encoder'])
+                    report = channel.trans.getTolerances(message['encoder'])
                 elif message['request'] == 'getState' :
                     erAck = 'Fail to get state.'
-                    report = self._irTrans.getState()
+                    report = channel.trans.getState()
+                elif message['request'] == 'setAckTimeouts' :
+                    erAck = 'Fail to set ack timeouts.'
+                    report = channel.trans.setAckTimeouts(message['timeouts'])
+                elif message['request'] == 'getAckTimeouts' :
+                    erAck = 'Fail to get ack timeouts.'
+                    report = channel.trans.getAckTimeouts()
+                elif message['request'] == 'getCacheStats' :
+                    erAck = 'Fail to get cache stats.'
+                    report = channel.trans.getCacheStats()
+                elif message['request'] == 'setLogLevel' :
+                    erAck = 'Fail to set log level.'
+                    report = setLogLevel(message['level'], message.get('logger', 'irtrans'))
+                elif message['request'] == 'getLogLevels' :
+                    erAck = 'Fail to get log levels.'
+                    report = getLogLevels()
+                elif message['request'] == 'getHistory' :
+                    erAck = 'Fail to get history.'
+                    report = channel.trans.getHistory(message.get('since', 0), message.get('limit', 100), message.get('encoder'))
+                elif message['request'] == 'getStats' :
+                    erAck = 'Fail to get stats.'
+                    report = self.getStats()
+                    if message.get('reset', False) : STATS.reset()
+                elif message['request'] == 'getChannels' :
+                    erAck = 'Fail to get channels.'
+                    report = self._channels.getChannels()
+                elif message['request'] == 'getCaptureStats' :
+                    erAck = 'Fail to get capture stats.'
+                    report = channel.trans.getCaptureStats()
+                elif message['request'] == 'setCaptureFilter' :
+                    erAck = 'Fail to set capture filter.'
+                    report = channel.trans.setCaptureFilter(message['filter'])
+                elif message['request'] == 'getCaptureFilter' :
+                    erAck = 'Fail to get capture filter.'
+                    report = channel.trans.getCaptureFilter()
                 else :
                     erAck = 'Client request Fail.'
                     report['error'] ='Unknown request.'
-                    print "commande inconnue"
+                    log.warning("Unknown request : %s", message['request'])
             if message['header']['type'] == 'req-ack' and not blockAck :
-                ackMsg['header'] = {'type': 'ack',  'idws' : message['header']['idws'], 'idmsg' : message['header']['idmsg'],
-                                               'ip' : message['header']['ip'] , 'timestamp' : long(time.time()*100)}
-                ackMsg['request'] = message['request']
-                if report :
-                    if report['error'] != '':
-                        ackMsg['error'] = erAck
-                    else :
-                        ackMsg['error'] = ''
-                    ackMsg['data'] = report
-                else : 
-                    ackMsg['error'] = 'No data report.'
-                self._wsServer.sendAck(ackMsg)
+                self.sendAckToWSClient(message, report, erAck)
         else :
             raise RpiTransceiverException("WS request bad format : {0}".format(message))
+
+    def cb_SendJob(self, job):
+        """Callback from send queue worker, report final job status to requesting client."""
+        message, channel = job.context
+        report = dict(job.result)
+        report.update({'status': job.status, 'jobid': job.id, 'channel': channel})
+        if message['header']['type'] == 'req-ack' :
+            if message.get('datatype') == 'HEX' : report = codeVariant(report, True)    # HEX request, HEX result
+            self.sendAckToWSClient(message, report, "IR emitter don't confirm final reception.")
+        else :
+            self.sendToWSClients('codesent', report)
+
+    def sendAckToWSClient(self, message, report, erAck):
+        """Send ack of client request message with report."""
+        ackMsg = {}
+        ackMsg['header'] = {'type': 'ack',  'idws' : message['header']['idws'], 'idmsg' : message['header']['idmsg'],
+                                       'ip' : message['header']['ip'] , 'timestamp' : long(time.time()*100)}
+        ackMsg['request'] = message['request']
+        if report :
+            if report['error'] != '':
+                ackMsg['error'] = erAck
+            else :
+                ackMsg['error'] = ''
+            ackMsg['data'] = report
+        else : 
+            ackMsg['error'] = 'No data report.'
+        self._wsServer.sendAck(ackMsg)
         
     def _run(self):
-        print "Manager Started"
+        log.info("Manager Started")
+        tStats = time.time()
         try:
             while 1 :
                 time.sleep(1)
+                if self._statsPeriod and time.time() - tStats >= self._statsPeriod :
+                    tStats = time.time()
+                    self.sendToWSClients('stats', self.getStats())
         finally:  # when you CTRL+C exit, we clean up 
-            self._irTrans.close()
+            self._channels.close()
             self._wsServer.close()
-            print" *** Clean up exit :)"
+            log.info("Clean up exit :)")
    
+    def getStats(self):
+        """Return metrics of STATS registry with connected clients and send queue depth."""
+        stats = STATS.getStats()
+        stats['clients'] = len(self._wsServer.clients)
+        stats['queue'] = self._channels.getQueueDepth()
+        stats['persist'] = self._channels.default.trans.getPersistStats()
+        stats['history'] = self._channels.default.trans.history.getStats()
+        stats['channels'] = dict((c.name, {'queue': c.queue.getState()['depth'], 'persist': c.trans.getPersistStats(),
+                                                            'history': c.trans.history.getStats()}) for c in self._channels.channels.values())
+        return stats
+
     def sendToWSClients(self, type,  message):
         msg = {"host" : os.uname()[1], 'type': type,  'data': message}
-        print "message to clients : {0}".format(msg)
+        log.debug("message to clients : %s", msg)
         if  self._wsServer : self._wsServer.broadcastMessage(msg)
 
 def main():
-    RpiTransceiver(5590)
+    parser = argparse.ArgumentParser(description = "Raspberry IR transceiver WebSocket server.")
+    parser.add_argument("--port", type = int, default = 5590, help = "WebSocket server port.")
+    parser.add_argument("--ws-backend", choices = WSBACKENDS, default = "wsgiref", help = "WebSocket server backend.")
+    parser.add_argument("--stats-period", type = int, default = 0, help = "Period (s) of 'stats' pub, 0 for none.")
+    parser.add_argument("--simulate", action = "store_true", help = "Run without Raspberry hardware, on simulated GPIO backend.")
+    parser.add_argument("--sim-ack-delay", type = float, default = 0.05, help = "Simulated hardware ack delay (s).")
+    parser.add_argument("--sim-ack-loss", type = float, default = 0.0, help = "Simulated hardware ack loss probability (0 to 1).")
+    parser.add_argument("--sim-no-loopback", action = "store_true", help = "Simulated emitted codes are not received by channel receiver.")
+    parser.add_argument("--persist-delay", type = float, default = PERSISTDELAY, help = "Debounce window (s) of last code file writes.")
+    parser.add_argument("--history-size", type = int, default = HISTORYSIZE, help = "Number of IR events kept in history.")
+    parser.add_argument("--history-file", help = "Memory mapped history file, keeps history over restarts.")
+    parser.add_argument("--code-file", help = "Last code backup file, suffixed by channel name for other channels. Default {0}, "
+                                              "in temp directory with --simulate.".format(CODEFILE))
+    parser.add_argument("--channel", action = "append", dest = "channels",
+                                    help = "IR channel 'name:emitter:receiver:ack[:pwm|gpio]' (0 or - for none), repeat for several, first is default. Default '{0}'.".format(CHANNELDEFAULT))
+    parser.add_argument("--log-level", choices = LOGLEVELS, default = "INFO", help = "Initial log level, can be changed by 'setLogLevel' request.")
+    args = parser.parse_args()
+    startLogging(args.log_level)
+    try :
+        backend = SimulatedBackend(args.sim_ack_delay, args.sim_ack_loss, loopback = not args.sim_no_loopback) if args.simulate else None
+        codeFile = args.code_file
+        if codeFile is None : codeFile = os.path.join(tempfile.gettempdir(), os.path.basename(CODEFILE)) if args.simulate else CODEFILE
+        RpiTransceiver(args.port,  args.ws_backend,  args.stats_period,  backend,  args.persist_delay,
+                              args.history_size,  args.history_file,  args.channels or [CHANNELDEFAULT],  codeFile)
+    finally :
+        stopLogging()
     print" *** Clean up exit :)"    
     
 if __name__ == "__main__":
-    RpiTransceiver(5590)
-    print" *** Clean up exit :)"
+    main()
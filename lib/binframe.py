@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of DAIKIN PAC Controler project $
+
+License
+=======
+
+B(Rpi_IR_Transceiver} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Rpi_IR_Transceiver} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Program purpose
+==============
+
+Binary WebSocket frames carrying pulse trains, negotiated by client at 'ack-connect' (see wsserver.py).
+
+Implements
+==========
+
+Frame : header, JSON meta (message without pulse train) and packed pulse train :
+    - header (12 bytes, little endian) : magic "IR", version (1), width of values (2 or 4 bytes),
+      meta length (uint16), number of pairs (uint32).
+    - meta : UTF-8 JSON object, same keys as text message ('header', 'request', 'type', 'data'...).
+    - pulse train : pulse, pause, pulse, pause... as uint16 (all values < 65536) or uint32.
+Pulse trains stay flat arrays on the server, PulsePairs gives them the [pulse, pause] pairs list interface
+used by encoders and backends without building nested lists.
+"""
+
+import sys
+import json
+import struct
+import itertools
+from array import array
+
+BINMAGIC = b"IR"
+BINVERSION = 1
+_header = struct.Struct("<2sBBHI")
+_typecodes = {2: 'H', 4: 'I'}
+if array('I').itemsize != 4 : _typecodes[4] = 'L'   # 'I' is 2 bytes on some platforms
+_swap = sys.byteorder != "little"
+
+class BinFrameException(Exception):
+    """"Binary frame exception class.
+    """
+    def __init__(self, value):
+        """Initialisation"""
+        Exception.__init__(self)
+        self.msg = "Binary frame exception:"
+        self.value = value
+
+    def __str__(self):
+        """String format objet"""
+        return repr(self.msg+' '+self.value)
+
+class PulsePairs(object):
+    """Read only sequence of (pulse, pause) pairs over a flat array (pulse, pause, ...)."""
+    __slots__ = ('flat', )
+
+    def __init__(self, flat):
+        self.flat = flat
+
+    def __len__(self):
+        return len(self.flat) // 2
+
+    def __getitem__(self, i):
+        n = len(self.flat) // 2
+        if isinstance(i, slice) :
+            start, stop, step = i.indices(n)
+            if step == 1 : return PulsePairs(self.flat[2 * start:2 * max(start, stop)])
+            return [self[j] for j in xrange(start, stop, step)]
+        if i < 0 : i += n
+        if not 0 <= i < n : raise IndexError("pulse pair index out of range")
+        return (self.flat[2 * i], self.flat[2 * i + 1])
+
+    def __iter__(self):
+        it = iter(self.flat)
+        return itertools.izip(it, it)
+
+    def toList(self):
+        """Return [[pulse, pause], ...] for JSON."""
+        return [[p, q] for p, q in self]
+
+    def __repr__(self):
+        return "PulsePairs({0} pairs)".format(len(self))
+
+def packFrame(meta, pulsePairs):
+    """Return binary frame of meta dict and pulse pairs (PulsePairs or list of pairs)."""
+    flat = pulsePairs.flat if isinstance(pulsePairs, PulsePairs) else [v for p in pulsePairs for v in p[:2]]
+    n = len(flat) // 2
+    try :   # struct checks range, uint32 only if a value doesn't fit in uint16
+        width, values = 2, struct.pack("<{0}H".format(2 * n), *flat)
+    except struct.error :
+        try :
+            width, values = 4, struct.pack("<{0}I".format(2 * n), *flat)
+        except struct.error :
+            raise BinFrameException("Pulse values out of uint32 range")
+    body = json.dumps(meta, separators = (',', ':'))
+    if len(body) > 0xFFFF : raise BinFrameException("Meta too long : {0} bytes".format(len(body)))
+    return _header.pack(BINMAGIC, BINVERSION, width, len(body), n) + body + values
+
+def unpackFrame(data):
+    """Return (meta dict, PulsePairs) of binary frame data (str or bytearray)."""
+    view = memoryview(data)
+    if len(view) < _header.size : raise BinFrameException("Frame too short : {0} bytes".format(len(view)))
+    magic, version, width, lMeta, nPairs = _header.unpack(view[:_header.size].tobytes())
+    if magic != BINMAGIC or version != BINVERSION or width not in _typecodes :
+        raise BinFrameException("Bad frame header {0!r} version {1} width {2}".format(magic, version, width))
+    o = _header.size + lMeta
+    if len(view) != o + nPairs * 2 * width :
+        raise BinFrameException("Frame length {0} don't match header".format(len(view)))
+    try :
+        meta = json.loads(view[_header.size:o].tobytes())
+    except ValueError as e :
+        raise BinFrameException("Bad frame meta : {0}".format(e))
+    if not isinstance(meta, dict) : raise BinFrameException("Frame meta is not an object")
+    values = array(_typecodes[width])
+    values.fromstring(view[o:].tobytes())
+    if _swap : values.byteswap()
+    return meta, PulsePairs(values)
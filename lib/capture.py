@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of DAIKIN PAC Controler project $
+
+License
+=======
+
+B(Rpi_IR_Transceiver} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Rpi_IR_Transceiver} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Program purpose
+==============
+
+Ring buffer of captured IR pulse pairs, between GPIO capture and decoding.
+
+Implements
+==========
+
+GPIO callback threads only copy captured pulse pairs in a preallocated slot and return to watch edges,
+a decoder thread drains slots in capture order. Several producers (receivers of several channels, simulated
+edges) reserve their slot under lock, copy concurrently and commit in reservation order. When all slots are used the new capture is dropped and
+counted as overrun, captures longer than a slot are truncated and counted.
+CaptureFilter drops implausible captures (light noise, spurious triggers) before decoding :
+    - in capture callback (cheap) : captures with too few pairs, all captures while spurious triggers (dropped captures)
+      are over rate limit (token bucket spent by dropped captures only).
+    - in decoder thread : glitches (pulse or pause shorter than glitch us) merged in surrounding pause or pulse,
+      then captures with too few pairs or too little energy (sum of pulses, us) are dropped.
+Dropped captures are not decoded, not acked, saved nor broadcast, filter counters give what was discarded.
+"""
+
+import threading
+import time
+from array import array
+
+from lib.binframe import PulsePairs
+
+CAPTURESLOTS = 16         # Number of captures waiting decoding
+CAPTUREMAXPAIRS = 512   # Max pulse pairs by capture (Daikin frame is 220)
+
+FILTERGLITCH = 100        # Pulses and pauses shorter (us) are merged
+FILTERMINPAIRS = 8        # Min pulse pairs by capture
+FILTERMINENERGY = 2000   # Min sum of pulses (us) by capture
+FILTERRATE = 5.0           # Spurious triggers by second before rate limiting, 0 for no limit
+FILTERBURST = 10          # Spurious triggers in a burst over rate
+
+class PulseRingBuffer(object):
+    """Fixed size ring of captures, producer (capture) threads and one consumer (decoder) thread.
+       Pulse pairs are stored flat (pulse, pause, ...) in one preallocated int array (items read back as int, not long)."""
+
+    def __init__(self, slots = CAPTURESLOTS, maxPairs = CAPTUREMAXPAIRS):
+        self.slots = slots
+        self.maxPairs = maxPairs
+        self._pairs = array('i', [0]) * (slots * maxPairs * 2)
+        self._lengths = [0] * slots
+        self._ackSeqs = [0] * slots
+        self._times = [0.0] * slots
+        self._reserved = 0  # Total slots reserved by producers
+        self._written = 0   # Total captures committed
+        self._read = 0      # Total captures released by consumer
+        self._cond = threading.Condition()
+        self.closed = False
+        self.overruns = 0
+        self.truncated = 0
+        self.invalid = 0    # Captures with bad pairs, committed empty and skipped by consumer
+        self.maxDepth = 0
+
+    def put(self, codeIR, ackSeq = 0):
+        """Copy capture codeIR (pulse pairs) in next free slot, return False if dropped (ring full)."""
+        with self._cond :
+            if self._reserved - self._read >= self.slots :
+                self.overruns += 1
+                return False
+            seq = self._reserved
+            self._reserved += 1
+            n = len(codeIR)
+            if n > self.maxPairs :
+                n = self.maxPairs
+                self.truncated += 1
+        slot = seq % self.slots
+        # Slot is owned by producer until committed, copy without lock. Slot is always committed (empty if copy fails),
+        # else next producers would wait it forever.
+        copied = 0
+        try :
+            buf = self._pairs
+            o = slot * self.maxPairs * 2
+            for i in xrange(n) :
+                p = codeIR[i]
+                buf[o] = int(p[0])
+                buf[o + 1] = int(p[1])
+                o += 2
+            copied = n
+        finally :
+            self._lengths[slot] = copied
+            self._ackSeqs[slot] = ackSeq
+            self._times[slot] = time.time()
+            with self._cond :
+                while self._written != seq : self._cond.wait()    # commit after previous reservations
+                self._written += 1
+                if copied != n : self.invalid += 1
+                self.maxDepth = max(self.maxDepth, self._written - self._read)
+                self._cond.notify_all()
+        return True
+
+    def get(self, timeout = None):
+        """Wait and return oldest capture (PulsePairs, ackSeq, capture time), None if closed or timeout. Empty slots are skipped."""
+        with self._cond :
+            while self._written > self._read and not self._lengths[self._read % self.slots] : self._read += 1
+            if self._written == self._read and not self.closed :
+                self._cond.wait(timeout)
+                while self._written > self._read and not self._lengths[self._read % self.slots] : self._read += 1
+            if self._written == self._read : return None
+            slot = self._read % self.slots
+        o = slot * self.maxPairs * 2
+        capture = (PulsePairs(self._pairs[o:o + self._lengths[slot] * 2]), self._ackSeqs[slot], self._times[slot])
+        with self._cond :
+            self._read += 1
+        return capture
+
+    def close(self):
+        """Wake up consumer, get returns None when ring is empty."""
+        with self._cond :
+            self.closed = True
+            self._cond.notify_all()
+
+    def getStats(self):
+        with self._cond :
+            return {'error': '', 'slots': self.slots, 'maxpairs': self.maxPairs, 'depth': self._written - self._read,
+                    'maxdepth': self.maxDepth, 'captured': self._written, 'overruns': self.overruns, 'truncated': self.truncated,
+                    'invalid': self.invalid}
+
+def mergeGlitches(flat, glitch):
+    """Return (flat array, merged pairs number) of flat pulse pairs with pulses and pauses shorter than glitch merged :
+       a short pause continues previous pulse, a short pulse continues previous pause. First pair is kept (start pulse)."""
+    out = array(flat.typecode, flat[:2])
+    merged = 0
+    for i in xrange(2, len(flat) - 1, 2) :
+        pulse, pause = flat[i], flat[i + 1]
+        if out[-1] < glitch :
+            out[-2] += out[-1] + pulse
+            out[-1] = pause
+        elif pulse < glitch :
+            out[-1] += pulse + pause
+        else :
+            out.append(pulse)
+            out.append(pause)
+            continue
+        merged += 1
+    return out, merged
+
+class CaptureFilter(object):
+    """Pre-decode filter of captures, see module doc. accept is called by capture callback, clean by decoder thread."""
+
+    def __init__(self, glitch = FILTERGLITCH, minPairs = FILTERMINPAIRS, minEnergy = FILTERMINENERGY, rate = FILTERRATE,
+                 burst = FILTERBURST, enabled = True):
+        self._lock = threading.Lock()
+        self.enabled = enabled
+        self.glitch = glitch
+        self.minPairs = minPairs
+        self.minEnergy = minEnergy
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._tTokens = time.time()
+        self.passed = 0
+        self.short = 0
+        self.weak = 0
+        self.rateLimited = 0
+        self.glitches = 0
+
+    def _refill(self):
+        """Refill token bucket, call with lock."""
+        t = time.time()
+        self._tokens = min(float(self.burst), self._tokens + (t - self._tTokens) * self.rate)
+        self._tTokens = t
+
+    def _spurious(self):
+        """Spend a token for a dropped capture, call with lock."""
+        if self.rate :
+            self._refill()
+            self._tokens = max(0.0, self._tokens - 1)
+
+    def accept(self, codeIR):
+        """Return False if capture codeIR must be dropped before buffering : too few pairs or spurious triggers over rate limit."""
+        if not self.enabled : return True
+        with self._lock :
+            if self.rate :
+                self._refill()
+                if self._tokens < 1 :
+                    self.rateLimited += 1
+                    return False
+            if len(codeIR) < self.minPairs :
+                self.short += 1
+                self._spurious()
+                return False
+        return True
+
+    def clean(self, pulsePairs):
+        """Return pulse pairs with glitches merged, None if capture is dropped (too few pairs or energy)."""
+        if not self.enabled : return pulsePairs
+        flat = pulsePairs.flat if isinstance(pulsePairs, PulsePairs) else array('i', [int(v) for p in pulsePairs for v in p[:2]])
+        merged = 0
+        if self.glitch and len(flat) > 3 and min(flat[1:-1]) < self.glitch :
+            flat, merged = mergeGlitches(flat, self.glitch)
+            pulsePairs = PulsePairs(flat)
+        with self._lock :
+            self.glitches += merged
+            if len(flat) // 2 < self.minPairs :
+                self.short += 1
+                self._spurious()
+                return None
+            if sum(flat[0::2]) < self.minEnergy :
+                self.weak += 1
+                self._spurious()
+                return None
+            self.passed += 1
+        return pulsePairs
+
+    def configure(self, params):
+        """Set filter parameters : 'enabled', 'glitch' (us), 'minpairs', 'minenergy' (us), 'rate' (captures/s), 'burst'."""
+        try :
+            enabled = bool(params.get('enabled', self.enabled))
+            glitch = int(params.get('glitch', self.glitch))
+            minPairs = int(params.get('minpairs', self.minPairs))
+            minEnergy = int(params.get('minenergy', self.minEnergy))
+            rate = float(params.get('rate', self.rate))
+            burst = int(params.get('burst', self.burst))
+        except :
+            return {'error': 'Bad capture filter format.'}
+        if min(glitch, minPairs, minEnergy, rate) < 0 or burst < 1 :
+            return {'error': 'Bad capture filter format.'}
+        with self._lock :
+            self.enabled, self.glitch, self.minPairs, self.minEnergy = enabled, glitch, minPairs, minEnergy
+            self.rate, self.burst = rate, burst
+            self._tokens = min(self._tokens, float(burst))
+        return {'error': ""}
+
+    def getConfig(self):
+        return {'enabled': self.enabled, 'glitch': self.glitch, 'minpairs': self.minPairs, 'minenergy': self.minEnergy,
+                'rate': self.rate, 'burst': self.burst}
+
+    def getStats(self):
+        with self._lock :
+            return {'passed': self.passed, 'short': self.short, 'weak': self.weak, 'ratelimited': self.rateLimited,
+                    'glitches': self.glitches}
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of DAIKIN PAC Controler project $
+
+License
+=======
+
+B(Rpi_IR_Transceiver} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Rpi_IR_Transceiver} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Program purpose
+==============
+
+Several IR transceiver channels (one by AC unit) managed by one server.
+
+Implements
+==========
+
+A channel is a RpiIRTrans (emitter pin, optional receiver pin, optional ack pin) with its own send queue worker :
+sends to different channels run concurrently, sends to the same channel stay in order.
+Emitter is hardware PWM (pins 12/18 on PWM channel 0, 13/19 on PWM channel 1, one emitter by PWM channel)
+or software GPIO (any other pin). All channels share one hardware backend.
+Channel spec (bin option --channel) : "name:emitter:receiver:ack[:pwm|gpio]", 0 or "-" for no receiver / no ack,
+    default : "main:18:25:17:pwm"
+"""
+
+import os
+
+from lib.rpi_irtrans import RpiIRTrans
+from lib.irbackend import GPIOBackend
+from lib.irqueue import IRSendQueue
+from lib.persist import PERSISTDELAY
+from lib.history import HISTORYSIZE
+from lib.logqueue import getLogger
+
+log = getLogger("channels")
+
+CHANNELDEFAULT = "main:18:25:17:pwm"
+PWMPINS = {12: 0, 18: 0, 13: 1, 19: 1}  # Hardware PWM channel by GPIO pin
+CODEFILE = "/var/local/irtranslast.txt"
+
+class ChannelException(Exception):
+    """"Channel manager generic exception class.
+    """
+    def __init__(self, value):
+        """Initialisation"""
+        Exception.__init__(self)
+        self.msg = "Channel manager generic exception:"
+        self.value = value
+
+    def __str__(self):
+        """String format objet"""
+        return repr(self.msg+' '+self.value)
+
+def parseChannel(spec):
+    """Return channel parameters dict of spec "name:emitter:receiver:ack[:pwm|gpio]"."""
+    fields = spec.split(":")
+    if len(fields) not in (4, 5) or not fields[0] :
+        raise ChannelException("Bad channel spec '{0}', format is name:emitter:receiver:ack[:pwm|gpio]".format(spec))
+    mode = fields[4] if len(fields) == 5 else "pwm"
+    if mode not in ("pwm", "gpio") :
+        raise ChannelException("Bad channel '{0}' emitter mode '{1}', pwm or gpio".format(fields[0], mode))
+    try :
+        pins = [int(f) if f not in ("", "-") else 0 for f in fields[1:4]]
+    except ValueError :
+        raise ChannelException("Bad channel spec '{0}', pins must be GPIO numbers".format(spec))
+    return {'name': fields[0], 'emitter': pins[0], 'receiver': pins[1], 'ack': pins[2], 'usePWM': mode == "pwm"}
+
+def channelFile(fileName, name, first):
+    """Return file of channel name, fileName itself for first channel, else suffixed by channel name."""
+    if not fileName or first : return fileName
+    base, ext = os.path.splitext(fileName)
+    return "{0}-{1}{2}".format(base, name, ext)
+
+class IRChannel(object):
+    """A transceiver and its send queue."""
+
+    def __init__(self, name, trans, queue, usePWM):
+        self.name = name
+        self.trans = trans
+        self.queue = queue
+        self.usePWM = usePWM
+
+    def getInfos(self):
+        return {'name': self.name, 'emitter': self.trans.irEmitter, 'receiver': self.trans.irReceiver, 'ack': self.trans.irAck,
+                'mode': "pwm" if self.usePWM else "gpio", 'encoders': sorted(self.trans.encoders),
+                'queue': self.queue.getState()['depth']}
+
+class ChannelManager(object):
+    """Channels by name, first added is the default one (requests without 'channel')."""
+
+    def __init__(self, manager, backend = None, persistDelay = PERSISTDELAY, historySize = HISTORYSIZE, historyFile = None,
+                 codeFile = CODEFILE):
+        """@param codeFile: last code backup file of default channel, other channels files are suffixed by channel name"""
+        self._manager = manager
+        self.backend = backend if backend is not None else GPIOBackend()
+        self._persistDelay = persistDelay
+        self._historySize = historySize
+        self._historyFile = historyFile
+        self._codeFile = codeFile
+        self._encoders = []     # (name, factory) registered on all channels
+        self.channels = {}
+        self.default = None
+
+    def addChannel(self, name, pinIREmitter, pinIRReceiver = 0, pinIRAck = 0, usePWM = True):
+        """Create channel name, return it. Raise ChannelException if name or a pin is already used."""
+        if name in self.channels :
+            raise ChannelException("Channel '{0}' already exists".format(name))
+        pins = [p for p in (pinIREmitter, pinIRReceiver, pinIRAck) if p]
+        for channel in self.channels.values() :
+            used = set([channel.trans.irEmitter, channel.trans.irReceiver, channel.trans.irAck])
+            if used.intersection(pins) :
+                raise ChannelException("Channel '{0}' pins {1} already used by channel '{2}'".format(name, pins, channel.name))
+        pwmChannel = 0
+        if usePWM :
+            if pinIREmitter not in PWMPINS :
+                raise ChannelException("Channel '{0}' GPIO {1} has no hardware PWM, use gpio mode".format(name, pinIREmitter))
+            pwmChannel = PWMPINS[pinIREmitter]
+            for channel in self.channels.values() :
+                if channel.usePWM and PWMPINS[channel.trans.irEmitter] == pwmChannel :
+                    raise ChannelException("Channel '{0}' PWM channel {1} already used by channel '{2}'".format(name, pwmChannel, channel.name))
+        first = self.default is None
+        trans = RpiIRTrans(self._manager, pinIREmitter, pinIRReceiver, pinIRAck, usePWM = usePWM, backend = self.backend,
+                                   fileBackup = channelFile(self._codeFile, name, first), persistDelay = self._persistDelay,
+                                   historySize = self._historySize, historyFile = channelFile(self._historyFile, name, first),
+                                   channel = name, pwmChannel = pwmChannel)
+        for encoderName, factory in self._encoders : trans.register_Encoder(encoderName, factory())
+        channel = IRChannel(name, trans, IRSendQueue(name = "th_IR_send_" + name), usePWM)
+        self.channels[name] = channel
+        if first : self.default = channel
+        log.info("Channel %s added : emitter %d (%s), receiver %d, ack %d", name, pinIREmitter, "pwm" if usePWM else "gpio",
+                 pinIRReceiver, pinIRAck)
+        return channel
+
+    def addChannelSpec(self, spec):
+        p = parseChannel(spec)
+        return self.addChannel(p['name'], p['emitter'], p['receiver'], p['ack'], p['usePWM'])
+
+    def register_Encoder(self, name, factory):
+        """Register encoder name on all channels, factory() returns a new encoder instance (tolerances are by channel)."""
+        self._encoders.append((name, factory))
+        for channel in self.channels.values() : channel.trans.register_Encoder(name, factory())
+
+    def getChannel(self, name = None):
+        """Return channel name, default one if name is None, None if unknown."""
+        if name is None : return self.default
+        return self.channels.get(name)
+
+    def getChannels(self):
+        return {'error': '', 'default': self.default.name if self.default else '',
+                'channels': [self.channels[n].getInfos() for n in sorted(self.channels)]}
+
+    def getQueueDepth(self):
+        return sum(c.queue.getState()['depth'] for c in self.channels.values())
+
+    def close(self):
+        """Stop send queues then close transceivers, backend is released with last one."""
+        for channel in self.channels.values() : channel.queue.close()
+        for channel in self.channels.values() : channel.trans.close()
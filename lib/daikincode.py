@@ -26,13 +26,20 @@ Can receive/send IR code RAW (pulse/pause pairs) and communicate with client by
 Implements
 ==========
 
-
+Daikin AC protocol : DaikinFrame (data bytes and checksum) and DaikinCode encoder, the IRProtocol (see irprotocol.py)
+of DAIKINSPEC.
 """
 
+import binascii
+
+from lib.irprotocol import ProtocolSpec, IRProtocol, SYMBOL, BYTES, CHECKSUM, bitsToBytes, bytesToBits
+
 DAIKINTIMINGS = {0: [440, 448], 1:[440,1288], 2: [3448, 1720], 3:[408, 29616]}
 DAIKINHEADER = "210001000010110111110010000001111000000000000000000000000010000003"
 DAIKINCODELENGHT = 145
 DAIKINCKSLENGHT = 8
+DAIKINDATALENGHT = (DAIKINCODELENGHT - 1) / 8   # Data bytes in code part, after start symbol
+DAIKINTRAILER = "0"             # Trailer symbol of HEX codes emission, its pulse ends the last bit pause
 
 TOLERANCE = 150                # pulse/pause +-TOLERANCE range
 LARGETOL = 2                     # Coefficient for large pulse/pause tolerance
@@ -51,114 +58,121 @@ class DaikinCodeException(Exception):
     def __str__(self):
         """String format objet"""
         return repr(self.msg+' '+self.value)
-        
-class DaikinCode:
-    
-    STARTPULSE = [2,  10000]  #  Pulse Start bit [pulse, pause]
-    ENDPULSE = [416,  40000]  #  Pulse Start bit [pulse, pause]
-    
-    def __init__(self,  timings = DAIKINTIMINGS,  tol =TOLERANCE,  lTol = LARGETOL,  maxOut = NBOUTTOL,  startP= True,  endP = False):
-        self.timings = timings
-        self.tol = tol
-        self.lTol = tol * lTol
-        self.maxOut = maxOut
-        self.code =""
-        self.startP = startP
-        self.endP = endP
-    
-    def setTolerances(self,  tolerances):
+
+class DaikinFrame(object):
+    """Daikin command frame, data bytes (LSB first as transmitted), checksum byte and optional trailer symbols.
+       Frames are immutable, hashable and comparable, legacy symbols string is only build on demand."""
+    __slots__ = ('data', 'checksum', 'trailer')
+
+    def __init__(self, data, checksum = None, trailer = ""):
+        self.data = bytes(data)
+        if checksum is None : checksum = self.computeChecksum(self.data)
+        self.checksum = checksum
+        self.trailer = trailer
+
+    @staticmethod
+    def computeChecksum(data):
+        """Checksum is the sum of data bytes modulo 256."""
+        return sum(bytearray(data)) & 0xFF
+
+    def isValid(self):
+        return self.checksum == self.computeChecksum(self.data)
+
+    @classmethod
+    def fromString(cls, code):
+        """Create frame from legacy symbols string (header, code part, checksum and trailer symbols)."""
+        lenH = len(DAIKINHEADER)
+        lenF = lenH + DAIKINCODELENGHT + DAIKINCKSLENGHT
+        if len(code) < lenF or not code.startswith(DAIKINHEADER + "2") or code[lenF:].strip("0123") :
+            raise DaikinCodeException("Not a Daikin frame string.")
         try :
-            if tolerances.has_key('tolerance'):
-                tol = int(tolerances['tolerance'])
-            if tolerances.has_key('large'):
-                lTol = int(tolerances['large'])
-            if tolerances.has_key('maxout'):
-                maxOut = int(tolerances['maxout'])
-        except : 
-            return {'error': 'Bad tolerances format.'}
-        self.tol = tol
-        self.lTol = lTol
-        self.maxOut = maxOut
-        return {'error' : ""}
-    
-    def getTolerances(self):
-        return {'tolerance' : self.tol, 'large': self.lTol, 'maxout': self.maxOut}
-    
+            return cls(bitsToBytes(code[lenH + 1:lenH + DAIKINCODELENGHT]),  ord(bitsToBytes(code[lenH + DAIKINCODELENGHT:lenF])),  code[lenF:])
+        except ValueError :
+            raise DaikinCodeException("Bad bits in Daikin frame string.")
+
+    def toString(self):
+        """Return legacy symbols string (header, code part and checksum)."""
+        return DAIKINHEADER + "2" + bytesToBits(self.data) + bytesToBits(chr(self.checksum)) + self.trailer
+
+    def toBytes(self):
+        return self.data + chr(self.checksum)
+
+    @classmethod
+    def fromHex(cls, hexCode, trailer = ""):
+        """Create frame from HEX string of data bytes and checksum byte (see toHex)."""
+        try :
+            data = binascii.unhexlify(hexCode)
+        except (TypeError, ValueError) :
+            raise DaikinCodeException("Bad HEX Daikin code.")
+        if len(data) != DAIKINDATALENGHT + 1 : raise DaikinCodeException("HEX Daikin code must be {0} bytes.".format(DAIKINDATALENGHT + 1))
+        return cls(data[:-1], ord(data[-1]), trailer)
+
+    def toHex(self):
+        """Return HEX string of data bytes and checksum byte, trailer is not included."""
+        return binascii.hexlify(self.toBytes())
+
+    def __eq__(self, other):
+        return isinstance(other, DaikinFrame) and (self.data, self.checksum, self.trailer) == (other.data, other.checksum, other.trailer)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self.data, self.checksum, self.trailer))
+
+    def __repr__(self):
+        return "DaikinFrame({0}, 0x{1:02x}, {2!r})".format(binascii.hexlify(self.data), self.checksum, self.trailer)
+
+DAIKINSPEC = ProtocolSpec("DAIKIN", DAIKINTIMINGS, header = DAIKINHEADER,
+                          fields = [(SYMBOL, "2"), (BYTES, DAIKINDATALENGHT), (CHECKSUM, DAIKINCKSLENGHT / 8)],
+                          checksum = DaikinFrame.computeChecksum, startPulse = [2,  10000], endPulse = [416,  40000],
+                          trailer = DAIKINTRAILER, label = "Daikin", tolerance = TOLERANCE, largeTol = LARGETOL, maxOut = NBOUTTOL)
+
+class DaikinCode(IRProtocol):
+    """Daikin encoder, IRProtocol of DAIKINSPEC, decoded codes are also given as DaikinFrame."""
+
+    STARTPULSE = DAIKINSPEC.startPulse  #  Pulse Start bit [pulse, pause]
+    ENDPULSE = DAIKINSPEC.endPulse  #  Pulse End bit [pulse, pause]
+
+    def __init__(self,  timings = DAIKINTIMINGS,  tol =TOLERANCE,  lTol = LARGETOL,  maxOut = NBOUTTOL,  startP= True,  endP = False,  useNumpy = True):
+        IRProtocol.__init__(self, DAIKINSPEC, timings, tol, lTol, maxOut, startP, endP, useNumpy)
+        self.code =""
+
     def irCodeToRAW(self, code):
-        pulsePairs = []
+        """Convert a DaikinFrame or a symbols string to pulse pairs."""
+        if isinstance(code, DaikinFrame) : return self.frameToRAW(code)
+        return IRProtocol.irCodeToRAW(self, code)
+
+    def frameToRAW(self, frame):
+        """Convert a DaikinFrame to pulse pairs."""
+        return self.payloadToRAW(frame.toBytes(), frame.trailer)
+
+    def toFrame(self, code, hexFormat = False):
+        """Return DaikinFrame of a frame, a symbols string or a HEX code (hexFormat, emitted with trailer symbol), None if not a frame.
+           Codes from WebSocket clients are converted here, then sent, cached and kept as frames (see RpiIRTrans)."""
+        if isinstance(code, DaikinFrame) : return code
+        if not isinstance(code, basestring) : return None
         try :
-            for c in code :
-                pulsePairs.append(self.timings[int(c)])
-            if self.startP : pulsePairs.insert(0,  self.STARTPULSE)
-            if self.endP : pulsePairs.append(self.ENDPULSE)
-        except :
-            DaikinCodeException("IR code bad format to Raw converting.")
-        return pulsePairs
-
-    def findTiming(self, pair,  outTol = False ):
-        numT = []
-        outT = False
-        for t in self.timings :
-            if (pair[0] >= self.timings[t][0] - self.tol) and (pair[0] <= self.timings[t][0] + self.tol) and (pair[1] >= self.timings[t][1] - self.tol) and (pair[1] <= self.timings[t][1] + self.tol) :
-                numT.append(t)
-        if  (len(numT) == 0) and (outTol) :
-            for t in self.timings :
-                if (pair[0] >= self.timings[t][0] - self.lTol) and (pair[0] <= self.timings[t][0] + self.lTol) and (pair[1] >= self.timings[t][1] - self.lTol) and (pair[1] <= self.timings[t][1] + self.lTol) :
-                    numT.append(t)
-                    outT = True
-        if len(numT) == 1:
-            return {"id": numT[0],  "largeTol" : outT}
-        elif len(numT) == 0 :
-            return {"id": -1, "largeTol" : outT}
-        else :
-            return {"id": -2, "largeTol" : outT}
-        
+            if hexFormat : return DaikinFrame.fromHex(code, self.spec.trailer)
+            return DaikinFrame.fromString(code)
+        except DaikinCodeException :
+            return None
+
     def validateChecksum(self,  code,  checksum):
-        chk = 0
-        for i  in range (1, len(code), 8):             # extraction par pas de 8 bits
-            chk=chk + int (code[i:i+8][::-1], 2)    # addition des bytes après reverse bits
-        checkV =  bin(chk)[::-1][0:8]                 # reconstruction de code checksum
-        print checkV
-        if checkV == checksum : return 1
-        else : return 0
-
-    def rawToIRCode(self,  pulsePairs):
-        codeIR = ""
-        error = ""
-        largeTol = True
-        outTol = 0
-        if (pulsePairs[0][0] <= self.STARTPULSE[0] + self.tol) and (pulsePairs[0][1] >= self.STARTPULSE[1] - self.tol) :  # a long pulse for start bit detected
-            print ("long pulse start bit detected")
-            print pulsePairs.pop(0)
-        for pair in pulsePairs:
-            numT = self.findTiming(pair, largeTol)
-            if numT["id"] >= 0 : 
-                codeIR = codeIR + "{0}".format(numT["id"])
-            else : codeIR = codeIR + "E"
-            if numT["largeTol"] : 
-                outTol += 1
-                print ("pair in large tolerance")
-                if outTol > self.maxOut :
-                    print "Error, to much Large tolerance"
-                    error = "Error, to much Large tolerance"
-                    largeTol = False
-        if codeIR :
-            lenH = len(DAIKINHEADER)
-            header = codeIR[:lenH]
-            if header == DAIKINHEADER : 
-                code = codeIR[lenH:lenH+DAIKINCODELENGHT]
-                if code.find("E") >= 0 :  
-                    error = "Code part error"
-                else :
-                    checksum = codeIR[lenH + DAIKINCODELENGHT: lenH + DAIKINCODELENGHT + DAIKINCKSLENGHT]
-                    print checksum
-                    if not self.validateChecksum(code,  checksum) :
-                        error = "Invalide Checksum"
-                    else :
-                        codeIR = header + code + checksum
-            else :  error = "Invalide Daikin header"
-        print error
-        print codeIR
-        return {"code": codeIR,  "error": error}
-            
-        
+        """Validate checksum bits string of code part string (start symbol and data bits)."""
+        try :
+            return int(DaikinFrame(bitsToBytes(code[1:]),  ord(bitsToBytes(checksum))).isValid())
+        except (ValueError, TypeError) :
+            return 0
+
+    def _result(self, codeIR, error, payload):
+        """Decoding result, with 'frame' DaikinFrame of a valid frame."""
+        r = {"code": codeIR,  "error": error}
+        if payload is not None and not error : r["frame"] = DaikinFrame(payload[:-1], ord(payload[-1]))
+        return r
+
+    def rawToFrame(self,  pulsePairs):
+        """Decode pulse pairs capture, return a valid DaikinFrame or None."""
+        payload = self.rawToPayload(pulsePairs)
+        if payload is None : return None
+        return DaikinFrame(payload[:-1], ord(payload[-1]))
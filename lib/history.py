@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of DAIKIN PAC Controler project $
+
+License
+=======
+
+B(Rpi_IR_Transceiver} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Rpi_IR_Transceiver} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Program purpose
+==============
+
+History of received and sent IR codes (request 'getHistory').
+
+Implements
+==========
+
+Bounded ring of fixed size records packed in one buffer : a bytearray in memory, or a memory mapped file
+which keeps history over restarts. Record : timestamp, kind (received/sent), hard state, origin
+(0 for remote, else WS client id), encoder, error and code (truncated to HISTCODESIZE).
+Timestamps are strictly increasing (ties are shifted by HISTTSSTEP), queries since a timestamp find first record
+by binary search and paging with since = 'last' never skips an event.
+"""
+
+import threading
+import struct
+import mmap
+import time
+import os
+
+from lib.logqueue import getLogger
+
+log = getLogger("history")
+
+HISTORYSIZE = 1024      # Default number of records
+HISTCODESIZE = 256      # Max code length stored
+HISTKINDS = ["received", "sent"]
+HISTTSSTEP = 1e-6       # Min step (s) between records timestamps
+
+_record = struct.Struct("<dBbiBBH16s58s{0}s".format(HISTCODESIZE))   # ts, kind, state, origin, len encoder, len error, len code, ...
+_fileHeader = struct.Struct("<4sIIQ12x")    # magic, capacity, record size, records count
+HISTMAGIC = b"IRH1"
+
+def historyOrigin(origin):
+    """Return origin (WS client id) as record int, 0 (remote) if not an int in record range."""
+    try :
+        origin = int(origin)
+    except (TypeError, ValueError) :
+        return 0
+    return origin if -0x80000000 <= origin <= 0x7FFFFFFF else 0
+
+class IRHistory(object):
+    """Ring of IR events, in memory or on memory mapped fileName."""
+
+    def __init__(self, capacity = HISTORYSIZE, fileName = None):
+        self.capacity = capacity
+        self.fileName = fileName
+        self._lock = threading.Lock()
+        self._file = None
+        self.count = 0      # total records added, ring position is count % capacity
+        size = capacity * _record.size
+        if fileName :
+            self._offset = _fileHeader.size
+            self._buf = self._openFile(fileName, size)
+        else :
+            self._offset = 0
+            self._buf = bytearray(size)
+        self._lastTs = self._timestamp(self.count - 1) if self.count else 0.0
+
+    def _openFile(self, fileName, size):
+        """Map history file, create it (or recreate if layout changed), records count is read from header."""
+        total = _fileHeader.size + size
+        exists = os.path.isfile(fileName) and os.path.getsize(fileName) == total
+        self._file = open(fileName, "r+b" if exists else "w+b")
+        if not exists :
+            self._file.truncate(total)
+        buf = mmap.mmap(self._file.fileno(), total)
+        magic, capacity, recSize, count = _fileHeader.unpack_from(buf, 0)
+        if magic == HISTMAGIC and capacity == self.capacity and recSize == _record.size :
+            self.count = count
+            log.info("History file %s loaded, %d records", fileName, min(count, capacity))
+        else :
+            _fileHeader.pack_into(buf, 0, HISTMAGIC, self.capacity, _record.size, 0)
+        return buf
+
+    def _timestamp(self, n):
+        return struct.unpack_from("<d", self._buf, self._offset + (n % self.capacity) * _record.size)[0]
+
+    def add(self, kind, result, origin = 0, state = -1, ts = None):
+        """Add event kind ("received" or "sent") of result dict {'code', 'encoder', 'error'}."""
+        encoder = str(result.get('encoder', ''))[:16]
+        error = str(result.get('error', ''))[:58]
+        code = str(result.get('code', ''))[:HISTCODESIZE]
+        with self._lock :
+            if ts is None : ts = time.time()
+            if ts <= self._lastTs : ts = self._lastTs + HISTTSSTEP   # keep timestamps strictly increasing for binary search and paging
+            _record.pack_into(self._buf, self._offset + (self.count % self.capacity) * _record.size,
+                              ts, HISTKINDS.index(kind), state, historyOrigin(origin), len(encoder), len(error), len(code), encoder, error, code)
+            self._lastTs = ts
+            self.count += 1
+            if self._file : _fileHeader.pack_into(self._buf, 0, HISTMAGIC, self.capacity, _record.size, self.count)
+
+    def _read(self, n):
+        ts, kind, state, origin, lEnc, lErr, lCode, encoder, error, code = _record.unpack_from(self._buf, self._offset + (n % self.capacity) * _record.size)
+        return {'timestamp': ts, 'type': HISTKINDS[kind], 'state': state, 'origin': origin if origin else 'remote',
+                'encoder': encoder[:lEnc], 'error': error[:lErr], 'code': code[:lCode]}
+
+    def query(self, since = 0, limit = 100, encoder = None, kind = None):
+        """Return events after timestamp since, oldest first, at most limit.
+           'more' is True if other events follow, ask them again with since = 'last'."""
+        events = []
+        with self._lock :
+            first = max(0, self.count - self.capacity)
+            lo, hi = first, self.count
+            while lo < hi :     # first record with timestamp > since
+                mid = (lo + hi) // 2
+                if self._timestamp(mid) <= since : lo = mid + 1
+                else : hi = mid
+            n = lo
+            more = False
+            while n < self.count :
+                event = self._read(n)
+                n += 1
+                if (encoder and event['encoder'] != encoder) or (kind and event['type'] != kind) : continue
+                if len(events) >= limit :
+                    more = True
+                    break
+                events.append(event)
+        return {'error': '', 'events': events, 'last': events[-1]['timestamp'] if events else since, 'more': more}
+
+    def getStats(self):
+        return {'error': '', 'capacity': self.capacity, 'size': min(self.count, self.capacity), 'total': self.count,
+                'file': self.fileName or ""}
+
+    def close(self):
+        with self._lock :
+            if self._file :
+                self._buf.flush()
+                self._buf.close()
+                self._file.close()
+                self._file = None
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of DAIKIN PAC Controler project $
+
+License
+=======
+
+B(Rpi_IR_Transceiver} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Rpi_IR_Transceiver} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Program purpose
+==============
+
+Hardware backends of IR transceiver.
+
+Implements
+==========
+
+RpiIRTrans uses hardware only through a backend :
+    - GPIOBackend : Raspberry GPIO, modified RPi.GPIO with BCM2835 functions (PWM2835, BCMWatchPulsePairsGPIO, ...).
+    - SimulatedBackend : no hardware, emission takes pulse pairs duration, emitted pulse pairs are looped back
+      (returned, and received by the receiver of emitter if loopback), ack edges are fired after a delay with a loss rate,
+      remote captures are injected by inject().
+      Used to run and load test the whole server anywhere (bin option --simulate).
+A backend is shared by all channels of a ChannelManager (see channels.py), open/close are counted.
+"""
+
+import threading
+import random
+import time
+import collections
+
+from lib.logqueue import getLogger
+
+log = getLogger("backend")
+
+ACKPULSE = 0.05     # Simulated ack pin high level duration (s)
+
+class IRBackendException(Exception):
+    """"IR backend generic exception class.
+    """
+    def __init__(self, value):
+        """Initialisation"""
+        Exception.__init__(self)
+        self.msg = "IR backend generic exception:"
+        self.value = value
+
+    def __str__(self):
+        """String format objet"""
+        return repr(self.msg+' '+self.value)
+
+class GPIOBackend(object):
+    """Raspberry GPIO backend, RPi.GPIO is imported at creation."""
+
+    def __init__(self):
+        try:
+            import RPi.GPIO as GPIO
+        except (ImportError, RuntimeError) as e:
+            raise IRBackendException("Error importing RPi.GPIO ({0}), you need the modified RPi.GPIO and superuser privileges, or use simulated backend.".format(e))
+        self.GPIO = GPIO
+        self.revision = GPIO.RPI_REVISION
+        self.version = GPIO.VERSION
+        self.useGPIO = False
+        self.opened = 0     # Channels sharing backend, BCM is released by last one
+        self._lock = threading.Lock()
+
+    def open(self):
+        with self._lock :
+            if not self.opened : self.GPIO.BCMInit()
+            self.opened += 1
+
+    def close(self):
+        with self._lock :
+            if not self.opened : return
+            self.opened -= 1
+            if self.opened : return
+            self.GPIO.BCMClose()
+            if self.useGPIO : self.GPIO.cleanup()
+
+    def bindAck(self, pin, ackPin):
+        """Declare ackPin as hardware ack of emitter or receiver pin, nothing to do with real hardware."""
+        pass
+
+    def bindReceiver(self, pin, receiverPin):
+        """Declare receiverPin as receiver seeing emitter pin, nothing to do with real hardware."""
+        pass
+
+    def setupReceiver(self, pin, callback):
+        """Call callback(pin) on each edge of receiver pin."""
+        self.useGPIO = True
+        self.GPIO.setmode(self.GPIO.BCM)
+        self.GPIO.setup(pin, self.GPIO.IN)
+        self.GPIO.add_event_detect(pin, self.GPIO.BOTH)
+        self.GPIO.add_event_callback(pin, callback)
+
+    def setupAck(self, pin, callback):
+        """Call callback(pin) on rising edge of ack pin, return current pin state."""
+        self.useGPIO = True
+        self.GPIO.setup(pin, self.GPIO.IN, pull_up_down= self.GPIO.PUD_DOWN)
+        self.GPIO.add_event_detect(pin, self.GPIO.RISING)#, bouncetime = 200)
+        self.GPIO.add_event_callback(pin, callback)
+        return self.GPIO.input(pin)
+
+    def input(self, pin):
+        return self.GPIO.input(pin)
+
+    def setModeGPIO(self, pin, mode):
+        """BCM mode of pin, 0 input, 1 output."""
+        self.GPIO.BCMsetModeGPIO(pin, mode)
+
+    def createPWM(self, channel, pin, clock, range):
+        """Return hardware PWM emitter (SendPulsePairs, GetFrequence)."""
+        return self.GPIO.PWM2835(channel, pin, clock, range)
+
+    def pulsePairsGPIO(self, pulsePairs, pin):
+        """Software emission of pulse pairs on pin, return read back pulse pairs."""
+        return self.GPIO.BCMPulsePairsGPIO(pulsePairs, pin)
+
+    def watchPulsePairs(self, pin):
+        """Capture pulse pairs on receiver pin."""
+        return self.GPIO.BCMWatchPulsePairsGPIO(pin)
+
+class SimulatedPWM(object):
+    """Hardware PWM emitter of SimulatedBackend."""
+
+    def __init__(self, backend, pin, clock, range):
+        self._backend = backend
+        self.pin = pin
+        self.freq = 19200000.0 / (clock * range)
+
+    def GetFrequence(self):
+        return self.freq
+
+    def SendPulsePairs(self, pulsePairs, dutyCycle):
+        return self._backend.emit(pulsePairs, self.pin)
+
+class SimulatedBackend(object):
+    """Backend without hardware.
+       @param ackDelay: delay (s) of ack edge after emission or received code.
+       @param ackLoss: probability of a missing ack (0 to 1).
+       @param jitter: max +- us on looped back pulse pairs.
+       @param timeScale: emission duration factor, 0 for no wait.
+       @param loopback: emitted pulse pairs are received by the receiver of emitter (see bindReceiver), its ack is the emission one."""
+
+    def __init__(self, ackDelay = 0.05, ackLoss = 0.0, jitter = 0, timeScale = 1.0, seed = None, loopback = True):
+        self.revision = 0
+        self.version = "simulated"
+        self.ackDelay = ackDelay
+        self.ackLoss = ackLoss
+        self.jitter = jitter
+        self.timeScale = timeScale
+        self.loopback = loopback
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self._levels = {}
+        self._callbacks = {}
+        self._acks = {}                     # ack pin by emitter/receiver pin
+        self._loopbacks = {}                # receiver pin by emitter pin
+        self._receivers = []
+        self._captures = collections.defaultdict(collections.deque)  # injected captures by receiver pin
+        self._capturesCond = threading.Condition()
+        self.opened = 0
+        self.emitted = 0
+        self.injected = 0
+        self.acksSent = 0
+        self.acksLost = 0
+
+    def open(self):
+        self.opened += 1
+
+    def close(self):
+        if self.opened : self.opened -= 1
+        with self._capturesCond :
+            self._capturesCond.notify_all()
+
+    def bindAck(self, pin, ackPin):
+        if ackPin : self._acks[pin] = ackPin
+
+    def bindReceiver(self, pin, receiverPin):
+        if receiverPin : self._loopbacks[pin] = receiverPin
+
+    def setupReceiver(self, pin, callback):
+        self._callbacks[pin] = callback
+        if pin not in self._receivers : self._receivers.append(pin)
+
+    def setupAck(self, pin, callback):
+        self._callbacks[pin] = callback
+        return self._levels.setdefault(pin, 0)
+
+    def input(self, pin):
+        return self._levels.get(pin, 0)
+
+    def setModeGPIO(self, pin, mode):
+        self._levels.setdefault(pin, 0)
+        if mode == 0 and pin not in self._receivers : self._receivers.append(pin)
+
+    def createPWM(self, channel, pin, clock, range):
+        return SimulatedPWM(self, pin, clock, range)
+
+    def pulsePairsGPIO(self, pulsePairs, pin):
+        return self.emit(pulsePairs, pin)
+
+    def emit(self, pulsePairs, pin):
+        """Wait emission duration, schedule ack of emitter pin and return pulse pairs looped back, also received by receiver if loopback."""
+        duration = sum(p[0] + p[1] for p in pulsePairs) / 1e6 * self.timeScale
+        if duration > 0 : time.sleep(duration)
+        with self._lock :
+            self.emitted += 1
+            j, rnd = self.jitter, self._rnd
+            if j : codeIR = [[p[0] + rnd.randint(-j, j), p[1] + rnd.randint(-j, j)] for p in pulsePairs]
+            else : codeIR = [[p[0], p[1]] for p in pulsePairs]
+        self._scheduleAck(pin)
+        if self.loopback and pin in self._loopbacks : self.inject(codeIR, self._loopbacks[pin], False)
+        return codeIR
+
+    def inject(self, pulsePairs, pin = None, ack = True):
+        """Simulate a remote code received on receiver pin (first registered if None), its ack is scheduled if ack."""
+        if pin is None :
+            if not self._receivers : raise IRBackendException("No receiver pin to inject capture.")
+            pin = self._receivers[0]
+        with self._capturesCond :
+            self._captures[pin].append([[p[0], p[1]] for p in pulsePairs])
+            self.injected += 1
+            self._capturesCond.notify_all()
+        callback = self._callbacks.get(pin)
+        if callback : threading.Thread(None, callback, "th_sim_edge", (pin, ), {}).start()
+        if ack : self._scheduleAck(pin)
+
+    def watchPulsePairs(self, pin):
+        """Return next injected capture of pin, None if nothing after a short wait."""
+        with self._capturesCond :
+            if not self._captures[pin] : self._capturesCond.wait(0.1)
+            if self._captures[pin] : return self._captures[pin].popleft()
+        return None
+
+    def _scheduleAck(self, pin):
+        ackPin = self._acks.get(pin)
+        if not ackPin : return
+        with self._lock :
+            lost = self._rnd.random() < self.ackLoss
+            if lost : self.acksLost += 1
+        if lost :
+            log.debug("Simulated ack lost for pin %d", pin)
+            return
+        timer = threading.Timer(self.ackDelay, self._ackEdge, (ackPin, 1))
+        timer.daemon = True
+        timer.start()
+
+    def _ackEdge(self, ackPin, level):
+        """Set ack pin level and call its callback, falling edge follows after ACKPULSE (callback is also
+           called, so RpiIRTrans ack state goes back to low before next ack)."""
+        self._levels[ackPin] = level
+        if level :
+            with self._lock :
+                self.acksSent += 1
+            timer = threading.Timer(ACKPULSE, self._ackEdge, (ackPin, 0))
+            timer.daemon = True
+            timer.start()
+        callback = self._callbacks.get(ackPin)
+        if callback : callback(ackPin)
+
+    def getStats(self):
+        return {'error': '', 'emitted': self.emitted, 'injected': self.injected, 'ackssent': self.acksSent, 'ackslost': self.acksLost}
@@ -0,0 +1,604 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of DAIKIN PAC Controler project $
+
+License
+=======
+
+B(Rpi_IR_Transceiver} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Rpi_IR_Transceiver} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Program purpose
+==============
+
+Generic IR protocol engine, an encoder (see RpiIRTrans.register_Encoder) compiled from a declarative spec.
+
+Implements
+==========
+
+ProtocolSpec describes a protocol :
+    - timings : symbols table {symbol: [pulse, pause]}, symbols are digits, zero and one symbols code bits.
+    - startPulse / endPulse : optional pairs before / after frame, start pulse is skipped by decoder.
+    - header : fixed symbols string checked by decoder (leader and preamble).
+    - fields : frame body layout after header, list of :
+        (SYMBOL, "2")   a fixed symbol, emitted, not checked by decoder.
+        (BYTES, n)      n data bytes, 8 bit symbols by byte, LSB first.
+        (CHECKSUM, 1)   checksum byte of data bytes, computed by spec checksum function.
+    - trailer : symbols emitted after frame built from bytes (HEX codes), ignored by decoder.
+    - repeat / repeatGap : frame emitted repeat times, separated by gap pair, decoder reads first frame.
+    - maxPairs : optional max pairs of a capture dispatched to encoder (see fingerprint), None for no limit.
+IRProtocol compiles spec in timing index lookups (and NumPy classify), a byte to 8 pairs table for encoding
+and a decoder plan of the frame regions. A capture is classified in symbols, then the plan checks regions
+in order : header, code part (no unknown symbol), checksum. Code is the symbols string, or payload bytes
+(data and checksum) in HEX.
+Example :
+    NECLIKE = ProtocolSpec("NEC", {0: [560, 560], 1: [560, 1690], 2: [9000, 4500]}, header = "2",
+                           fields = [(BYTES, 4)], trailer = "0")
+    trans.register_Encoder("NEC", IRProtocol(NECLIKE))
+"""
+
+import bisect
+import binascii
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from lib.logqueue import getLogger
+from lib.binframe import PulsePairs
+
+log = getLogger("protocol")
+
+SYMBOL = "symbol"
+BYTES = "bytes"
+CHECKSUM = "checksum"
+FPHEADER = 8           # Number of header symbols checked by fingerprint
+STREAMPREFIX = 12   # Pairs fed one by one by StreamDecoder.feedPairs before vectorized classify
+
+TOLERANCE = 150                # pulse/pause +-TOLERANCE range
+LARGETOL = 2                     # Coefficient for large pulse/pause tolerance
+NBOUTTOL = 10                   # Max number of pair in Large tolerance
+
+class IRProtocolException(Exception):
+    """"IR protocol exception class.
+    """
+
+    def __init__(self, value):
+        """Initialisation"""
+        Exception.__init__(self)
+        self.msg = "IR protocol exception:"
+        self.value = value
+
+    def __str__(self):
+        """String format objet"""
+        return repr(self.msg+' '+self.value)
+
+def bitsToBytes(bits):
+    """Convert a '0'/'1' string, LSB first by byte as transmitted, to bytes. Raise ValueError if not bits."""
+    n = len(bits) / 8
+    if n == 0 or len(bits) != n * 8 : raise ValueError("Bits length {0} not multiple of 8".format(len(bits)))
+    return binascii.unhexlify("%0*x" % (2 * n, int(bits[::-1], 2)))[::-1]
+
+def bytesToBits(data):
+    """Convert bytes to a '0'/'1' string, LSB first by byte as transmitted."""
+    if not data : return ""
+    return format(int(binascii.hexlify(data[::-1]), 16), "0{0}b".format(8 * len(data)))[::-1]
+
+def sumChecksum(data):
+    """Sum of data bytes modulo 256."""
+    return sum(bytearray(data)) & 0xFF
+
+class TimingIndex:
+    """Interval index of a timings table for one tolerance.
+       Each axis (pulse, pause) is cut in segments where the set of matching timings is constant,
+       stored as a bit mask. Axis values are quantized in buckets of 2**QUANTUM us, a bucket without
+       segment edge gives directly the mask, else the sorted edges are bisected."""
+
+    QUANTUM = 4
+
+    def __init__(self, timings, tol):
+        self.ids = sorted(timings)
+        self.pulse = self._buildAxis([timings[t][0] for t in self.ids], tol)
+        self.pause = self._buildAxis([timings[t][1] for t in self.ids], tol)
+        self.bitIds = {}
+        for n, t in enumerate(self.ids) : self.bitIds[1 << n] = t
+
+    def _buildAxis(self, values, tol):
+        """Return (buckets masks, edges, masks on edges, masks between edges) for one axis."""
+        def mask(v):
+            m = 0
+            for n, t in enumerate(values) :
+                if (v >= t - tol) and (v <= t + tol) : m |= 1 << n
+            return m
+        edges = sorted(set([t - tol for t in values] + [t + tol for t in values]))
+        onEdge = dict((e, mask(e)) for e in edges)
+        between = [0]    # segment k is ]edges[k-1], edges[k][
+        for k in range(1, len(edges)) : between.append(mask((edges[k-1] + edges[k]) / 2.0))
+        between.append(0)
+        buckets = []
+        for b in range((int(edges[-1]) >> self.QUANTUM) + 1) :
+            lo = b << self.QUANTUM
+            hi = lo + (1 << self.QUANTUM)
+            k = bisect.bisect_left(edges, lo)
+            if k < len(edges) and edges[k] < hi : buckets.append(None)   # mixed bucket
+            else : buckets.append(between[k])
+        return (buckets, edges, onEdge, between)
+
+    def _axisMask(self, axis, v):
+        """Mask of timings matching v on a mixed bucket."""
+        m = axis[2].get(v)
+        if m is None : m = axis[3][bisect.bisect_right(axis[1], v)]
+        return m
+
+    def find(self, pair):
+        """Return timing id matching pair, -1 if none, -2 if many."""
+        pulse, pause = self.pulse, self.pause
+        b = int(pair[0]) >> self.QUANTUM
+        if b < 0 or b >= len(pulse[0]) : return -1
+        m = pulse[0][b]
+        if m is None : m = self._axisMask(pulse, pair[0])
+        if m == 0 : return -1
+        b = int(pair[1]) >> self.QUANTUM
+        if b < 0 or b >= len(pause[0]) : return -1
+        mP = pause[0][b]
+        if mP is None : mP = self._axisMask(pause, pair[1])
+        m &= mP
+        if m == 0 : return -1
+        return self.bitIds.get(m, -2)
+
+class ProtocolSpec(object):
+    """Declarative description of an IR protocol, see module doc."""
+
+    def __init__(self, name, timings, header = "", fields = (), checksum = sumChecksum, startPulse = None, endPulse = None,
+                 trailer = "", repeat = 1, repeatGap = None, label = None, tolerance = TOLERANCE, largeTol = LARGETOL, maxOut = NBOUTTOL,
+                 maxPairs = None):
+        self.name = name
+        self.label = label or name      # name in error messages
+        self.timings = timings
+        self.header = header
+        self.fields = list(fields)
+        self.checksum = checksum
+        self.startPulse = startPulse
+        self.endPulse = endPulse
+        self.trailer = trailer
+        self.repeat = repeat
+        self.repeatGap = repeatGap
+        self.tolerance = tolerance
+        self.largeTol = largeTol
+        self.maxOut = maxOut
+        self.maxPairs = maxPairs
+        symbols = set("{0}".format(t) for t in timings)
+        for c in header + trailer :
+            if c not in symbols : raise IRProtocolException("Protocol {0} symbol '{1}' has no timing".format(name, c))
+        for kind, arg in self.fields :
+            if kind == SYMBOL and arg not in symbols : raise IRProtocolException("Protocol {0} symbol '{1}' has no timing".format(name, arg))
+            if kind not in (SYMBOL, BYTES, CHECKSUM) : raise IRProtocolException("Protocol {0} unknown field '{1}'".format(name, kind))
+        if (BYTES in [f[0] for f in self.fields] or CHECKSUM in [f[0] for f in self.fields]) and not ("0" in symbols and "1" in symbols) :
+            raise IRProtocolException("Protocol {0} bytes fields need 0 and 1 symbols".format(name))
+        if repeat > 1 and not repeatGap : raise IRProtocolException("Protocol {0} repeat needs a repeatGap pair".format(name))
+
+class IRProtocol(object):
+    """Encoder / decoder of a ProtocolSpec, same interface as other encoders (irCodeToRAW, rawToIRCode, tolerances, fingerprint)."""
+
+    def __init__(self, spec, timings = None, tol = None, lTol = None, maxOut = None, startP = True, endP = True, useNumpy = True):
+        """@param timings: replace spec timings
+           @param lTol: large tolerance coefficient of tol
+           @param startP, endP: emit spec start / end pulse"""
+        self.spec = spec
+        self.timings = timings if timings is not None else spec.timings
+        self.tol = tol if tol is not None else spec.tolerance
+        self.lTol = self.tol * (lTol if lTol is not None else spec.largeTol)
+        self.maxOut = maxOut if maxOut is not None else spec.maxOut
+        self.startP = startP and spec.startPulse is not None
+        self.endP = endP and spec.endPulse is not None
+        self.useNumpy = useNumpy and numpy is not None
+        self.revision = 0           # Incremented on timings change, invalidate encoded codes cache
+        self._compilePlan()
+        self._buildTimingIndex()
+
+    def _compilePlan(self):
+        """Compile frame layout in symbols offsets : header, code part, checksum, payload bytes fields."""
+        spec = self.spec
+        self._lenH = len(spec.header)
+        o = self._lenH
+        self._bytesFields = []      # (offset, bytes number, is checksum)
+        self._lenCode = self._lenH  # end of code part (fields before checksum)
+        for kind, arg in spec.fields :
+            if kind == SYMBOL :
+                o += 1
+            else :
+                self._bytesFields.append((o, arg, kind == CHECKSUM))
+                o += 8 * arg
+            if kind != CHECKSUM : self._lenCode = o
+        self._lenF = o
+        self._headerError = "Invalide {0} header".format(spec.label)
+
+    def _buildTimingIndex(self):
+        """Compile timings table in lookup index for tolerance and large tolerance, and encoding tables."""
+        self._index = TimingIndex(self.timings, self.tol)
+        self._lIndex = TimingIndex(self.timings, self.lTol)
+        self._symbols = dict((t, "{0}".format(t)) for t in self.timings)
+        self._pairs = dict(("{0}".format(t), self.timings[t]) for t in self.timings)
+        self._headerPairs = tuple(self._pairs[c] for c in self.spec.header)
+        if "0" in self._pairs and "1" in self._pairs :
+            zero, one = self._pairs["0"], self._pairs["1"]
+            self._bytePairs = [tuple(one if (b >> bit) & 1 else zero for bit in range(8)) for b in range(256)]  # 8 pairs by byte value, LSB first
+        if numpy is not None :
+            ids = sorted(self.timings)
+            self._npTimings = numpy.array([self.timings[t] for t in ids], dtype=numpy.float64)
+            self._npSymbols = numpy.array([self._symbols[t] for t in ids] + ["E"])
+
+    def setTimings(self,  timings):
+        """Change timings table {symbol: [pulse, pause]}."""
+        self.timings = timings
+        self.revision += 1
+        self._buildTimingIndex()
+
+    def setTolerances(self,  tolerances):
+        tol, lTol, maxOut = self.tol, self.lTol, self.maxOut
+        try :
+            if tolerances.has_key('tolerance'):
+                tol = int(tolerances['tolerance'])
+            if tolerances.has_key('large'):
+                lTol = int(tolerances['large'])
+            if tolerances.has_key('maxout'):
+                maxOut = int(tolerances['maxout'])
+        except :
+            return {'error': 'Bad tolerances format.'}
+        if (tol, lTol) != (self.tol, self.lTol) :
+            self.tol = tol
+            self.lTol = lTol
+            self._buildTimingIndex()
+        self.maxOut = maxOut
+        return {'error' : ""}
+
+    def getTolerances(self):
+        return {'tolerance' : self.tol, 'large': self.lTol, 'maxout': self.maxOut}
+
+    def fingerprint(self):
+        """Return cheap identification of a capture for encoders dispatch (see EncoderIndex) :
+            - 'leader' : first pair of frame, 'header' : next pairs of frame,
+            - 'preamble' : max pairs (start pulse) before leader, 'minPairs', 'maxPairs' : frame length range (maxPairs None : no limit),
+            - 'tol' : pulse/pause tolerance for leader and header."""
+        if not self.spec.header : return None
+        header = self.spec.header
+        return {'leader': self._pairs[header[0]], 'header': [self._pairs[c] for c in header[1:FPHEADER]],
+                'preamble': 1 if self.spec.startPulse else 0, 'minPairs': self._lenF, 'maxPairs': self.spec.maxPairs, 'tol': self.lTol}
+
+    # Encoding
+
+    def irCodeToRAW(self, code):
+        """Convert a symbols string to pulse pairs, a valid frame string is encoded from its payload bytes."""
+        payload, trailer = self.parseCode(code)
+        if payload is not None : return self.payloadToRAW(payload, trailer)
+        pulsePairs = []
+        try :
+            for c in code :
+                pulsePairs.append(self.timings[int(c)])
+            if self.startP : pulsePairs.insert(0,  self.spec.startPulse)
+            if self.endP : pulsePairs.append(self.spec.endPulse)
+        except (KeyError, TypeError, ValueError) :
+            log.debug("IR code bad format to Raw converting : %s", code)
+        return pulsePairs
+
+    def payloadToRAW(self, payload, trailer = None):
+        """Convert payload bytes (bytes and checksum fields in layout order) to pulse pairs, header pairs are shared,
+           each byte expands by one table lookup. Frame is repeated by spec repeat rule."""
+        spec = self.spec
+        if trailer is None : trailer = spec.trailer
+        bytePairs = self._bytePairs
+        data = bytearray(payload)
+        frame = list(self._headerPairs)
+        o = 0
+        for kind, arg in spec.fields :
+            if kind == SYMBOL :
+                frame.append(self._pairs[arg])
+            else :
+                for b in data[o:o + arg] : frame.extend(bytePairs[b])
+                o += arg
+        for c in trailer : frame.append(self._pairs[c])
+        pulsePairs = [spec.startPulse] if self.startP else []
+        for r in range(spec.repeat) :
+            if r : pulsePairs.append(spec.repeatGap)
+            pulsePairs.extend(frame)
+        if self.endP : pulsePairs.append(spec.endPulse)
+        return pulsePairs
+
+    def dataToRAW(self, data):
+        """Convert data bytes (bytes fields) to pulse pairs, checksum is computed."""
+        return self.payloadToRAW(self.dataToPayload(data))
+
+    def dataToPayload(self, data):
+        """Return payload of data bytes with checksum bytes inserted."""
+        payload, o = b"", 0
+        data = bytes(data)
+        for kind, arg in self.spec.fields :
+            if kind == BYTES :
+                payload += data[o:o + arg]
+                o += arg
+            elif kind == CHECKSUM :
+                payload += chr(self.spec.checksum(data)) * arg
+        return payload
+
+    def hexToRAW(self, hexCode):
+        """Convert a HEX code (payload bytes, see codeToHex) to pulse pairs, with spec trailer, empty list if bad format."""
+        try :
+            payload = binascii.unhexlify(hexCode)
+        except (TypeError, ValueError) :
+            payload = None
+        if payload is None or len(payload) != self.payloadSize() :
+            log.debug("Bad HEX %s code %s", self.spec.name, hexCode)
+            return []
+        return self.payloadToRAW(payload)
+
+    def payloadSize(self):
+        return sum(f[1] for f in self.spec.fields if f[0] != SYMBOL)
+
+    def parseCode(self, code):
+        """Return (payload bytes, trailer) of a frame symbols string (header, fields and trailer symbols), (None, None) if not a frame.
+           Checksum is not validated, code is emitted as given."""
+        if not isinstance(code, basestring) or len(code) < self._lenF or not code.startswith(self.spec.header) : return None, None
+        o = self._lenH
+        for kind, arg in self.spec.fields :
+            if kind == SYMBOL :
+                if code[o] != arg : return None, None
+                o += 1
+            else : o += 8 * arg
+        trailer = code[self._lenF:]
+        for c in trailer :
+            if c not in self._pairs : return None, None
+        payload = self._payload(code, False)
+        if payload is None : return None, None
+        return payload, trailer
+
+    def codeToHex(self, code):
+        """Return HEX code (payload bytes) of a symbols string code, "" if not a frame."""
+        payload, trailer = self.parseCode(code)
+        return binascii.hexlify(payload) if payload is not None else ""
+
+    # Decoding
+
+    def findTiming(self, pair,  outTol = False ):
+        id = self._index.find(pair)
+        if (id == -1) and (outTol) :
+            id = self._lIndex.find(pair)
+            if id != -1 : return {"id": id, "largeTol" : True}
+        return {"id": id, "largeTol" : False}
+
+    def isStartPulse(self, pair):
+        """Return True if pair is the long pulse start bit."""
+        start = self.spec.startPulse
+        return start is not None and (pair[0] <= start[0] + self.tol) and (pair[1] >= start[1] - self.tol)
+
+    def _classifyPairs(self, pulsePairs):
+        """Classify pulse pairs one by one, return (symbols string, number of pairs in large tolerance)."""
+        symbols = []
+        largeTol = True
+        outTol = 0
+        find, lFind = self._index.find, self._lIndex.find
+        for pair in pulsePairs:
+            id = find(pair)
+            if (id == -1) and largeTol :
+                id = lFind(pair)
+                if id != -1 :
+                    outTol += 1
+                    if outTol > self.maxOut : largeTol = False
+            if id >= 0 : symbols.append(self._symbols[id])
+            else : symbols.append("E")
+        return "".join(symbols),  outTol
+
+    def _classifyArray(self, pairs, outTol = 0):
+        """Classify a (N,2) pulse pairs array against all timings at once, return same as _classifyPairs.
+           outTol : pairs already in large tolerance before this array (stream decoding)."""
+        diff = numpy.abs(pairs[:, numpy.newaxis, :] - self._npTimings[numpy.newaxis, :, :])    # (N, timings, 2)
+        inTol = (diff <= self.tol).all(axis=2)
+        inLTol = (diff <= self.lTol).all(axis=2)
+        nbIn = inTol.sum(axis=1)
+        nbLIn = inLTol.sum(axis=1)
+        err = len(self._npSymbols) - 1     # index of "E" symbol
+        ids = numpy.where(nbIn == 1, inTol.argmax(axis=1), err)
+        # Large tolerance is used until maxOut is exceeded, the pair exceeding is still counted.
+        large = (nbIn == 0) & (nbLIn > 0)
+        large &= numpy.cumsum(large) + outTol <= self.maxOut + 1
+        ids = numpy.where(large, numpy.where(nbLIn == 1, inLTol.argmax(axis=1), err), ids)
+        return "".join(self._npSymbols[ids].tolist()),  outTol + int(large.sum())
+
+    def rawArrayToIRCode(self,  pulsePairs):
+        """Decode a whole capture given as (N,2) array or list of pulse pairs in one pass.
+           Return same result as rawToIRCode, fall back to pure python if NumPy is not installed."""
+        codeIR, error, payload = self._decodeArray(pulsePairs)
+        return self._result(codeIR, error, payload)
+
+    def rawToIRCode(self,  pulsePairs):
+        """Decode pulse pairs capture, use vectorized path if NumPy is available."""
+        if self.useNumpy : return self.rawArrayToIRCode(pulsePairs)
+        codeIR, error, payload = self._decode(pulsePairs, self._classifyPairs)
+        return self._result(codeIR, error, payload)
+
+    def _result(self, codeIR, error, payload):
+        """Return decoding result dict of symbols string, error and payload bytes (None if not a valid frame).
+           Protocols with a frame type add it as 'frame' key (see DaikinCode), not serializable, for server internal use."""
+        return {"code": codeIR,  "error": error}
+
+    def rawToPayload(self,  pulsePairs):
+        """Decode pulse pairs capture, return payload bytes of a valid frame or None."""
+        if self.useNumpy : codeIR, error, payload = self._decodeArray(pulsePairs)
+        else : codeIR, error, payload = self._decode(pulsePairs, self._classifyPairs)
+        return payload
+
+    def _decodeArray(self,  pulsePairs):
+        if numpy is None : return self._decode(pulsePairs, self._classifyPairs)
+        return self._decode(self._asArray(pulsePairs), self._classifyArray)
+
+    def _asArray(self, pulsePairs):
+        """Return (N,2) float array of pulse pairs."""
+        if isinstance(pulsePairs, PulsePairs) :    # flat array, read as buffer
+            return numpy.frombuffer(pulsePairs.flat, dtype = pulsePairs.flat.typecode).astype(numpy.float64).reshape(-1, 2)
+        return numpy.asarray(pulsePairs, dtype=numpy.float64).reshape(-1, 2)
+
+    def streamDecoder(self):
+        """Return a new StreamDecoder of this protocol."""
+        return StreamDecoder(self)
+
+    def _payload(self, codeIR, check = True):
+        """Return payload bytes of bytes fields of frame symbols, None if bad bits or checksum (if check)."""
+        if len(codeIR) < self._lenF : return None
+        payload = b""
+        data = b""
+        checksums = []
+        try :
+            for o, n, isChecksum in self._bytesFields :
+                b = bitsToBytes(codeIR[o:o + 8 * n])
+                payload += b
+                if isChecksum : checksums.append(b)
+                else : data += b
+        except (ValueError, TypeError) :
+            return None
+        if check and checksums and checksums[0] != chr(self.spec.checksum(data)) * len(checksums[0]) : return None
+        return payload
+
+    def _decode(self,  pulsePairs, classify):
+        """Decode pulse pairs with classify function, return (symbols string, error, payload bytes or None).
+           Plan : skip start pulse, classify, then check header, code part and checksum regions."""
+        error = ""
+        payload = None
+        if self.isStartPulse(pulsePairs[0]) :  # a long pulse for start bit detected
+            log.debug("long pulse start bit detected")
+            pulsePairs = pulsePairs[1:]
+        codeIR, outTol = classify(pulsePairs)
+        if outTol :
+            log.debug("%d pairs in large tolerance", outTol)
+            if outTol > self.maxOut :
+                error = "Error, to much Large tolerance"
+        if codeIR :
+            if codeIR[:self._lenH] == self.spec.header :
+                if codeIR.find("E", self._lenH, self._lenCode) >= 0 :
+                    error = "Code part error"
+                else :
+                    payload = self._payload(codeIR)
+                    if payload is None : error = "Invalide Checksum"
+                    else : codeIR = codeIR[:self._lenF]
+            else :  error = self._headerError
+        elif not error : error = self._headerError     # no symbol, not a frame
+        if error : log.debug("Decoding error : %s, %s", error, codeIR)
+        return codeIR,  error,  payload
+
+class StreamDecoder(object):
+    """Incremental decoder of an IRProtocol, consumes pairs as they are captured and rejects a frame as soon as
+       header or code part diverges (see rejectedAt).
+       Results of a frame not rejected are the same as IRProtocol.rawToIRCode, a rejected frame gives the same error
+       with the symbols decoded until rejection."""
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.reset()
+
+    def reset(self):
+        self.pairs = 0          # pairs consumed, start pulse included
+        self.rejectedAt = 0     # pairs consumed at rejection, 0 if not rejected
+        self.error = ""
+        self.payload = None
+        self._symbols = []
+        self._outTol = 0
+        self._checked = 0       # symbols checked by plan
+
+    def feed(self, pair):
+        """Consume one pair, return False if frame is rejected."""
+        if self.rejectedAt : return False
+        p = self.protocol
+        self.pairs += 1
+        if self.pairs == 1 and p.isStartPulse(pair) : return True
+        id = p._index.find(pair)
+        if (id == -1) and self._outTol <= p.maxOut :
+            id = p._lIndex.find(pair)
+            if id != -1 : self._outTol += 1
+        self._symbols.append(p._symbols[id] if id >= 0 else "E")
+        return self._check()
+
+    def feedPairs(self, pulsePairs):
+        """Consume pairs, first header pairs one by one (noise and foreign codes are rejected there) then others in one NumPy pass
+           if available. Return False if frame is rejected."""
+        p = self.protocol
+        n = len(pulsePairs)
+        i = 0
+        while i < n and (len(self._symbols) < min(p._lenH, STREAMPREFIX) or not p.useNumpy) :
+            if not self.feed(pulsePairs[i]) : return False
+            i += 1
+        if i < n and not self.rejectedAt :
+            if self.pairs == 0 and p.isStartPulse(pulsePairs[i]) :     # no header
+                self.pairs, i = 1, i + 1
+            symbols, self._outTol = p._classifyArray(p._asArray(pulsePairs[i:]), self._outTol)
+            self._symbols.extend(symbols)
+            self.pairs += n - i
+            return self._check()
+        return not self.rejectedAt
+
+    def feedPrefix(self, pulsePairs):
+        """Consume first header pairs of capture one by one (STREAMPREFIX symbols at most), return False if frame is rejected there.
+           Screens captures before a whole capture decoding (see RpiIRTrans.rawToIRCode)."""
+        p = self.protocol
+        prefix = min(p._lenH, STREAMPREFIX)
+        for pair in pulsePairs :
+            if len(self._symbols) >= prefix : break
+            if not self.feed(pair) : return False
+        return True
+
+    def _reject(self, error, k):
+        """Reject frame on symbol k."""
+        self.error = error
+        self.rejectedAt = self.pairs - len(self._symbols) + k + 1
+        del self._symbols[k + 1:]
+        return False
+
+    def _check(self):
+        """Check new symbols against protocol plan : header, then code part, then checksum at frame end."""
+        p = self.protocol
+        symbols = self._symbols
+        n = len(symbols)
+        i = self._checked
+        if i >= p._lenF :
+            self._checked = n
+            return True
+        header = p.spec.header
+        while i < min(n, p._lenH) :
+            if symbols[i] != header[i] : return self._reject(p._headerError, i)
+            i += 1
+        end = min(n, p._lenCode)
+        if i < end :
+            k = "".join(symbols[i:end]).find("E")
+            if k >= 0 : return self._reject("Code part error", i + k)
+        if n >= p._lenF :
+            self.payload = p._payload("".join(symbols[:p._lenF]))
+            if self.payload is None : return self._reject("Invalide Checksum", p._lenF - 1)
+        self._checked = n
+        return True
+
+    def isComplete(self):
+        """True if a valid frame is decoded, following pairs only count for large tolerance."""
+        return self.payload is not None
+
+    def result(self):
+        """Return decoding result (same as IRProtocol.rawToIRCode), 'rejected' : pairs consumed at rejection."""
+        p = self.protocol
+        codeIR = "".join(self._symbols)
+        error = self.error
+        if not self.rejectedAt :
+            if self._outTol > p.maxOut : error = "Error, to much Large tolerance"
+            if codeIR :
+                if len(codeIR) < p._lenH : error = p._headerError
+                elif self.payload is None : error = "Invalide Checksum"
+                else : codeIR = codeIR[:p._lenF]
+            elif not error : error = p._headerError     # no symbol, not a frame
+        r = p._result(codeIR, error, self.payload if not error else None)
+        r["rejected"] = self.rejectedAt
+        return r
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of DAIKIN PAC Controler project $
+
+License
+=======
+
+B(Rpi_IR_Transceiver} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Rpi_IR_Transceiver} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Program purpose
+==============
+
+Asynchronous IR send queue.
+
+Implements
+==========
+
+Send jobs are queued and executed in order by a single worker thread, the only one using the IR emitter
+hardware. Requesting thread (WebSocket) is never blocked by emission and ack waiting.
+"""
+
+import Queue
+import threading
+import itertools
+import time
+
+from lib.logqueue import getLogger
+
+log = getLogger("queue")
+
+QUEUESIZE = 64  # Max number of waiting jobs
+CLOSETIMEOUT = 2.0  # Max time (s) waiting worker end at close
+
+class IRSendJob(object):
+    """A queued send : function and arguments, called by worker, result and timings."""
+    __slots__ = ('id', 'fn', 'args', 'callback', 'context', 'tQueued', 'tStart', 'tDone', 'result', 'status')
+
+    def __init__(self, id, fn, args, callback, context):
+        self.id = id
+        self.fn = fn
+        self.args = args
+        self.callback = callback
+        self.context = context
+        self.tQueued = time.time()
+        self.tStart = 0
+        self.tDone = 0
+        self.result = None
+        self.status = 'queued'
+
+class IRSendQueue(object):
+    """Job queue in front of IR emitter with one worker thread.
+       A job result is a dict with 'error' key, job status becomes 'sent' if no error else 'failed'."""
+
+    def __init__(self, maxSize = QUEUESIZE, name = "th_IR_send_worker"):
+        self._queue = Queue.Queue(maxSize)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.current = None
+        self.submitted = 0
+        self.sent = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self._closed = False
+        self.maxDepth = 0
+        self.lastWait = 0.0
+        self.maxWait = 0.0
+        self.totalWait = 0.0
+        self._worker = threading.Thread(None, self._run, name, (), {})
+        self._worker.daemon = True
+        self._worker.start()
+
+    def submit(self, fn, args, callback = None, context = None):
+        """Queue call fn(*args), callback(job) is called by worker when done. Return job or None if queue is full or closed."""
+        with self._lock :
+            if self._closed :
+                self.rejected += 1
+                return None
+            job = IRSendJob(next(self._ids), fn, args, callback, context)
+            try :
+                self._queue.put_nowait(job)
+            except Queue.Full :
+                self.rejected += 1
+                return None
+            self.submitted += 1
+            self.maxDepth = max(self.maxDepth, self._queue.qsize())
+        return job
+
+    def _run(self):
+        while True :
+            job = self._queue.get()
+            if job is None : break
+            if self._closed :
+                self._cancel(job)
+                continue
+            job.tStart = time.time()
+            wait = job.tStart - job.tQueued
+            self.current = job
+            self.lastWait = wait
+            self.maxWait = max(self.maxWait, wait)
+            self.totalWait += wait
+            try :
+                job.result = job.fn(*job.args)
+            except Exception as e :
+                job.result = {'error': "Send job {0} exception : {1}".format(job.id, e)}
+            job.tDone = time.time()
+            if job.result.get('error', '') == '' :
+                job.status = 'sent'
+                self.sent += 1
+            else :
+                job.status = 'failed'
+                self.failed += 1
+            self.current = None
+            self._done(job)
+
+    def _done(self, job):
+        if job.callback :
+            try :
+                job.callback(job)
+            except Exception as e :
+                log.error("Send job %d callback error : %s", job.id, e)
+
+    def _cancel(self, job):
+        job.tDone = time.time()
+        job.result = {'error': "Send job {0} cancelled, send queue closed".format(job.id)}
+        job.status = 'cancelled'
+        self.cancelled += 1
+        self._done(job)
+
+    def getState(self):
+        """Return queue depth, counters and wait times (s)."""
+        done = self.sent + self.failed + (1 if self.current else 0)
+        return {'error': '', 'depth': self._queue.qsize(), 'maxdepth': self.maxDepth, 'current': self.current.id if self.current else 0,
+                'submitted': self.submitted, 'sent': self.sent, 'failed': self.failed, 'rejected': self.rejected,
+                'cancelled': self.cancelled,
+                'wait': {'last': self.lastWait, 'max': self.maxWait, 'avg': self.totalWait / done if done else 0.0}}
+
+    def close(self, timeout = CLOSETIMEOUT):
+        """Stop worker after current job, waiting jobs are cancelled. Never blocks more than timeout (s) on worker."""
+        with self._lock :
+            if self._closed : return
+            self._closed = True
+        while True :
+            try :
+                job = self._queue.get_nowait()
+            except Queue.Empty :
+                break
+            if job is not None : self._cancel(job)
+        try :
+            self._queue.put_nowait(None)
+        except Queue.Full :
+            pass    # worker checks closed flag
+        self._worker.join(timeout)
+        if self._worker.is_alive() :
+            log.warning("Send worker %s still busy after %.1fs, not waited", self._worker.name, timeout)
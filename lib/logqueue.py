@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of DAIKIN PAC Controler project $
+
+License
+=======
+
+B(Rpi_IR_Transceiver} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Rpi_IR_Transceiver} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Program purpose
+==============
+
+Asynchronous logging for GPIO and WebSocket threads.
+
+Implements
+==========
+
+Loggers of the project are named under LOGNAME ("irtrans.trans", "irtrans.daikin", ...).
+Their records are put in a queue by a QueueHandler and written (console, files) by a QueueListener thread,
+so no output I/O is done in GPIO callback, decoder or WebSocket threads.
+QueueHandler/QueueListener come from logging.handlers (python >= 3.2), with same implementation for python 2.
+Levels can be changed at runtime with setLogLevel (WS request 'setLogLevel').
+"""
+
+import logging
+import threading
+import sys
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+LOGNAME = "irtrans"
+LOGFORMAT = "[%(asctime)s] %(levelname)s %(name)s %(message)s"
+LOGLEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    class QueueHandler(logging.Handler):
+        """Handler putting records in a queue, message is formated by caller thread."""
+
+        def __init__(self, queue):
+            logging.Handler.__init__(self)
+            self.queue = queue
+
+        def prepare(self, record):
+            msg = self.format(record)
+            record.message = msg
+            record.msg = msg
+            record.args = None
+            record.exc_info = None
+            return record
+
+        def emit(self, record):
+            try:
+                self.queue.put_nowait(self.prepare(record))
+            except Exception:
+                self.handleError(record)
+
+    class QueueListener(object):
+        """Thread getting records from a queue and passing them to handlers."""
+        _sentinel = None
+
+        def __init__(self, queue, *handlers, **kwargs):
+            self.queue = queue
+            self.handlers = handlers
+            self.respect_handler_level = kwargs.get('respect_handler_level', False)
+            self._thread = None
+
+        def start(self):
+            self._thread = threading.Thread(None, self._monitor, "th_log_listener", (), {})
+            self._thread.daemon = True
+            self._thread.start()
+
+        def handle(self, record):
+            for handler in self.handlers:
+                if not self.respect_handler_level or record.levelno >= handler.level:
+                    handler.handle(record)
+
+        def _monitor(self):
+            while True:
+                record = self.queue.get()
+                if record is self._sentinel: break
+                self.handle(record)
+
+        def enqueue_sentinel(self):
+            self.queue.put_nowait(self._sentinel)
+
+        def stop(self):
+            self.enqueue_sentinel()
+            self._thread.join()
+            self._thread = None
+
+_listeners = []
+
+def getLogger(name):
+    """Return project logger LOGNAME.name."""
+    return logging.getLogger("{0}.{1}".format(LOGNAME, name))
+
+def queueHandlers(logger, handlers):
+    """Replace handlers direct output of logger by a queue written by a listener thread, return listener."""
+    q = queue.Queue(-1)
+    listener = QueueListener(q, *handlers, respect_handler_level = True)
+    logger.addHandler(QueueHandler(q))
+    listener.start()
+    _listeners.append(listener)
+    return listener
+
+def startLogging(level = logging.INFO, handlers = None):
+    """Configure project loggers with level, output by default on console (stdout)."""
+    if handlers is None :
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(LOGFORMAT))
+        handlers = [handler]
+    logger = logging.getLogger(LOGNAME)
+    logger.setLevel(level)
+    logger.propagate = False
+    return queueHandlers(logger, handlers)
+
+def stopLogging():
+    """Flush and stop all listeners."""
+    while _listeners :
+        _listeners.pop().stop()
+
+def setLogLevel(level, name = LOGNAME):
+    """Set level (name as "DEBUG") of logger name, project ones are under LOGNAME, "ws4py" for WebSocket lib."""
+    level = str(level).upper()
+    if level not in LOGLEVELS :
+        return {'error': "Unknown log level : {0}".format(level), 'logger': name}
+    logging.getLogger(name).setLevel(getattr(logging, level))
+    return {'error': '', 'logger': name, 'level': level}
+
+def getLogLevels():
+    """Return effective level of project loggers and ws4py."""
+    manager = logging.Logger.manager
+    names = [LOGNAME, "ws4py"] + sorted(n for n in manager.loggerDict if n.startswith(LOGNAME + "."))
+    return {'error': '', 'levels': dict((n, logging.getLevelName(logging.getLogger(n).getEffectiveLevel())) for n in names)}
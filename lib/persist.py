@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of DAIKIN PAC Controler project $
+
+License
+=======
+
+B(Rpi_IR_Transceiver} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Rpi_IR_Transceiver} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Program purpose
+==============
+
+Persistence of last IR code (backup file, default /var/local/irtranslast.txt).
+
+Implements
+==========
+
+Saves are debounced by a writer thread : the last code saved during delay window is written once.
+File is written atomically (temp file, fsync, rename), a power cut leaves the old or the new file, never a torn one.
+File format is unchanged :
+    [LASTCODE]
+    <code>
+    [ENCODER]
+    <encoder>
+"""
+
+import threading
+import time
+import os
+
+from lib.logqueue import getLogger
+
+log = getLogger("persist")
+
+PERSISTDELAY = 2.0     # Debounce window (s) of backup file writes
+
+def formatCode(code):
+    return "[LASTCODE]\n{0}\n[ENCODER]\n{1}\n".format(code['code'], code['encoder'])
+
+def parseCode(text):
+    """Return code dict {'error', 'code', 'encoder'} of backup file content, None if bad format."""
+    lines = text.split("\n")
+    if len(lines) < 4 or lines[0] != "[LASTCODE]" or lines[2] != "[ENCODER]" : return None
+    return {'error': "", 'code': lines[1], 'encoder': lines[3]}
+
+class CodePersist(object):
+    """Debounced atomic writer of last IR code file."""
+
+    def __init__(self, fileName, delay = PERSISTDELAY):
+        self.fileName = fileName
+        self.delay = delay
+        self._pending = None
+        self._tDue = 0
+        self._cond = threading.Condition()
+        self._writeLock = threading.Lock()
+        self._closed = False
+        self.saved = 0      # save requests
+        self.written = 0    # file writes
+        self.errors = 0
+        self._writer = threading.Thread(None, self._run, "th_persist_writer", (), {})
+        self._writer.daemon = True
+        self._writer.start()
+
+    def load(self):
+        """Read code from file in one read, return code dict or None."""
+        try :
+            with open(self.fileName, "r") as f :
+                text = f.read()
+        except IOError as e :
+            log.info("file %s not readable (%s), no code memorised at last", self.fileName, e)
+            return None
+        code = parseCode(text)
+        if code is None : log.warning("Bad format of code file %s", self.fileName)
+        return code
+
+    def save(self, code):
+        """Request write of code, done by writer thread at end of debounce window."""
+        with self._cond :
+            self.saved += 1
+            if self._pending is None : self._tDue = time.time() + self.delay
+            self._pending = dict(code)
+            self._cond.notify()
+
+    def flush(self):
+        """Write pending code now, in caller thread."""
+        with self._cond :
+            code, self._pending = self._pending, None
+        if code is not None : self._write(code)
+
+    def _run(self):
+        while True :
+            with self._cond :
+                while self._pending is None and not self._closed : self._cond.wait()
+                if self._closed : return
+                wait = self._tDue - time.time()
+                if wait > 0 :
+                    self._cond.wait(wait)
+                    continue
+                code, self._pending = self._pending, None
+            self._write(code)
+
+    def _write(self, code):
+        """Write code in temp file, then rename it on file (atomic on same file system)."""
+        tmp = self.fileName + ".tmp"
+        with self._writeLock :
+            try :
+                with open(tmp, "w") as f :
+                    f.write(formatCode(code))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.rename(tmp, self.fileName)
+            except (IOError, OSError) as e :
+                self.errors += 1
+                log.error("error writing code file %s : %s", self.fileName, e)
+            else :
+                self.written += 1
+                log.debug("Code Saved")
+
+    def close(self):
+        """Stop writer and write pending code."""
+        with self._cond :
+            self._closed = True
+            self._cond.notify()
+        self._writer.join(1.0)
+        self.flush()
+
+    def getStats(self):
+        return {'error': '', 'saved': self.saved, 'written': self.written, 'errors': self.errors, 'pending': self._pending is not None}
@@ -28,14 +28,19 @@ Implements
 
 
 """
-try:
-    import RPi.GPIO as GPIO
-except RuntimeError:
-    print("Error importing RPi.GPIO!  This is probably because you need superuser privileges.  You can achieve this by using 'sudo' to run your script")
-
 import time
 import threading
-import os
+import collections
+import logging
+
+from lib.capture import PulseRingBuffer, CaptureFilter
+from lib.irbackend import GPIOBackend
+from lib.persist import CodePersist, PERSISTDELAY
+from lib.history import IRHistory, historyOrigin, HISTORYSIZE
+from lib.logqueue import getLogger
+from lib.stats import STATS
+
+log = getLogger("trans")
 
 class RpiIRTransException(Exception):
     """"Rpi Transceiver generic exception class.
@@ -52,21 +57,133 @@ class RpiIRTransException(Exception):
 
 FREQUENCIES = {38000:{"PWMClock": 2 , "PWMRange" : 252,  "DutyCycle"  : 50}}   # Parameters for 38kHz PWMClock = 2, PWMRange = 252 , DutyCycle % range for pulse to frequency
 
+ACKTIMEOUT = 1.0       # Max time (s) waiting hardware ack after emission
+RXACKTIMEOUT = 3.5    # Max time (s) waiting hardware ack after a received code
+
 DataTypes = ["RAW", "BinTimings", "HEX"]
 RAWCode = 0
 BinTCode = 1
 HEXCode = 2
-    
+
+BATCHMAX = 16       # Max codes by sendIRCodes
+BATCHMAXGAP = 5.0   # Max gap (s) before a code of sendIRCodes
+
+CACHESIZE = 32  # Max number of encoded pulse pairs trains in cache
+FPQUANTUM = 7   # Leader pulse buckets of 2**FPQUANTUM us for encoders fingerprint index
+REJECTBOUNDS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)     # Pairs buckets of stream decoding rejection index
+
+class EncoderIndex:
+    """Index of registered encoders by fingerprint (see DaikinCode.fingerprint), give candidate encoders of a capture.
+       Encoders without fingerprint are always candidates, after indexed ones."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.fingerprints = {}
+        self.others = []
+        self.maxPreamble = 0
+
+    def add(self, name, encoder):
+        self.remove(name)
+        fp = encoder.fingerprint() if hasattr(encoder, 'fingerprint') else None
+        if not fp :
+            self.others.append(name)
+            return
+        self.fingerprints[name] = fp
+        leader, tol = fp['leader'], fp['tol']
+        for b in range(int(leader[0] - tol) >> FPQUANTUM, (int(leader[0] + tol) >> FPQUANTUM) + 1) :
+            self.buckets.setdefault(b, []).append(name)
+        self.maxPreamble = max(self.maxPreamble, fp.get('preamble', 0))
+
+    def remove(self, name):
+        if name in self.others : self.others.remove(name)
+        if name in self.fingerprints :
+            del self.fingerprints[name]
+            for b in self.buckets.keys() :
+                if name in self.buckets[b] : self.buckets[b].remove(name)
+                if not self.buckets[b] : del self.buckets[b]
+            self.maxPreamble = max([fp.get('preamble', 0) for fp in self.fingerprints.values()] + [0])
+
+    def _match(self, fp, codeIR, offset):
+        tol = fp['tol']
+        if offset > fp.get('preamble', 0) : return False
+        nbPairs = len(codeIR) - offset
+        if nbPairs < fp['minPairs'] or (fp.get('maxPairs') is not None and nbPairs > fp['maxPairs']) : return False
+        for ref, pair in zip([fp['leader']] + fp['header'], codeIR[offset:]) :
+            if abs(pair[0] - ref[0]) > tol or abs(pair[1] - ref[1]) > tol : return False
+        return True
+
+    def candidates(self, codeIR):
+        """Return encoders names that can decode capture codeIR."""
+        found = []
+        for offset in range(min(self.maxPreamble + 1, len(codeIR))) :
+            for name in self.buckets.get(int(codeIR[offset][0]) >> FPQUANTUM, ()) :
+                if name not in found and self._match(self.fingerprints[name], codeIR, offset) : found.append(name)
+        return found + self.others
+
+class RawCodeCache:
+    """Bounded LRU cache of encoded pulse pairs trains (tuple), keyed by (encoder, encoder revision, datatype, code)."""
+
+    def __init__(self, maxSize = CACHESIZE):
+        self.maxSize = maxSize
+        self._trains = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock :
+            train = self._trains.pop(key, None)
+            if train is None :
+                self.misses += 1
+            else :
+                self._trains[key] = train   # move to most recent
+                self.hits += 1
+            return train
+
+    def put(self, key, train):
+        with self._lock :
+            self._trains.pop(key, None)
+            self._trains[key] = train
+            while len(self._trains) > self.maxSize :
+                self._trains.popitem(last = False)
+                self.evictions += 1
+
+    def invalidate(self, encoder = None):
+        """Remove trains of encoder, all if None."""
+        with self._lock :
+            for key in self._trains.keys() :
+                if encoder is None or key[0] == encoder : del self._trains[key]
+
+    def getStats(self):
+        with self._lock :
+            return {'error': '', 'size': len(self._trains), 'maxsize': self.maxSize,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
 class RpiIRTrans:
     '''Represente un émeteur/recepteur de signaux infrarouge RAW'''
     
-    def __init__(self, manager,  pinIREmitter = 18,  pinIRReceiver = 25, pinIRAck = 17, freq = 38000,  usePWM = True,  useGPIOIn = True):
+    def __init__(self, manager,  pinIREmitter = 18,  pinIRReceiver = 25, pinIRAck = 17, freq = 38000,  usePWM = True,  useGPIOIn = True,
+                        ackTimeout = ACKTIMEOUT,  rxAckTimeout = RXACKTIMEOUT,  backend = None,
+                        fileBackup = "/var/local/irtranslast.txt",  persistDelay = PERSISTDELAY,
+                        historySize = HISTORYSIZE,  historyFile = None,  channel = "main",  pwmChannel = 0):
         '''Initialise le transmetteur
         @param pinIREmitter: Id GPIO du pin Emetteur (output) defaut GPIO 18)
-        @param pinIRReceiver: Id GPIO du pin recepteur (intput) defaut GPIO 25)
-        @param pinIRAck: Id GPIO du pin for ack send (intput) defaut GPIO 17)
+        @param pinIRReceiver: Id GPIO du pin recepteur (intput) defaut GPIO 25), 0 for emitter only channel
+        @param pinIRAck: Id GPIO du pin for ack send (intput) defaut GPIO 17), 0 for no ack
+        @param ackTimeout: Max time (s) waiting ack after emission
+        @param rxAckTimeout: Max time (s) waiting ack after a received code
+        @param backend: hardware backend (see irbackend.py), GPIOBackend by default
+        @param fileBackup: last code file
+        @param persistDelay: debounce window (s) of last code file writes
+        @param historySize: number of IR events kept in history
+        @param historyFile: memory mapped file of history, None for memory only
+        @param channel: channel name (see channels.py), added to published codes
+        @param pwmChannel: hardware PWM channel of emitter pin (0 or 1)
         '''
         self._manager = manager
+        self.channel = channel
+        self.backend = backend if backend is not None else GPIOBackend()
         self.irEmitter = pinIREmitter
         self.pwmEmitter = None
         self.irReceiver = pinIRReceiver
@@ -74,49 +191,74 @@ class RpiIRTrans:
         self.irAck = pinIRAck
         self.useGPIO = useGPIOIn
         self.lockRecv = False
+        self._batch = False     # receiver stay locked between codes of sendIRCodes
         self.pwmClock = 0
         self.pwmRange = 0
         self.dutyCycle = 0;
         self.setFrequency(freq)
         self.encoders = {}
+        self._encoderIndex = EncoderIndex()
+        self._rawCache = RawCodeCache()
         self._MemIRCode = None
         self.ackState = 0
         self.tLastAck = time.time()
         self.waitAck = 0
-        self._fileBackup = "/var/local/irtranslast.txt"
-        print "GPIO Board rev : {0}".format(GPIO.RPI_REVISION)
-        print "GPIO version : {0}".format(GPIO.VERSION)
-        GPIO.BCMInit()
+        self._ackCond = threading.Condition()
+        self._ackSeq = 0        # Incremented on each hardware ack edge
+        self.ackTimeout = ackTimeout
+        self.rxAckTimeout = rxAckTimeout
+        self._fileBackup = fileBackup
+        self._persist = CodePersist(fileBackup, persistDelay)
+        self.history = IRHistory(historySize, historyFile)
+        self._capture = PulseRingBuffer()
+        self._filter = CaptureFilter()
+        self._stFiltered = STATS.counter("capture.filtered")
+        self._stEmit = STATS.histogram("emit.duration")
+        self._stAck = STATS.histogram("ack.latency")
+        self._stAckTimeouts = STATS.counter("ack.timeouts")
+        self._stRetries = STATS.counter("emit.retries")
+        self._stCaptureWait = STATS.histogram("capture.todecode")
+        self._stDecode = {}     # decode duration histogram by encoder
+        self._stRejected = {}   # stream decoding rejection index histogram by encoder
+        self.decoded = 0
+        self._decoder = threading.Thread(None, self._decodeCaptures, "th_IR_decoder_" + channel, (), {})
+        self._decoder.daemon = True
+        self._decoder.start()
+        log.info("GPIO Board rev : %s", self.backend.revision)
+        log.info("GPIO version : %s", self.backend.version)
+        self.backend.open()
+        self.backend.bindAck(self.irEmitter, self.irAck)
+        if self.irReceiver :
+            self.backend.bindAck(self.irReceiver, self.irAck)
+            self.backend.bindReceiver(self.irEmitter, self.irReceiver)
         if self.useGPIO :
-            GPIO.setmode(GPIO.BCM) 
-            GPIO.setup(self.irReceiver, GPIO.IN)
-            GPIO.add_event_detect(self.irReceiver, GPIO.BOTH)
-            GPIO.add_event_callback(self.irReceiver, self.callback_gpioEvent)
-            print "GPIO {0} Input IR receiver ready\n".format(self.irReceiver)           
-            GPIO.setup(self.irAck, GPIO.IN, pull_up_down= GPIO.PUD_DOWN)
-            GPIO.add_event_detect(self.irAck, GPIO.RISING)#, bouncetime = 200)
-            GPIO.add_event_callback(self.irAck, self.callback_gpioAck)
-            self.ackState = GPIO.input(self.irAck)
-            print "GPIO {0} Input ACK ready, state : {1}\n".format(self.irAck, self.ackState)         
-        else :
-            print "BCM {0} Input ready\n".format(self.irReceiver)
-            GPIO.BCMsetModeGPIO(self.irReceiver, 0)
-            th = threading.Thread(None, self.waitingEventBCM, "th_wait_for_gpio_event", (), {})
+            if self.irReceiver :
+                self.backend.setupReceiver(self.irReceiver, self.callback_gpioEvent)
+                log.info("GPIO %d Input IR receiver ready", self.irReceiver)
+            if self.irAck :
+                self.ackState = self.backend.setupAck(self.irAck, self.callback_gpioAck)
+                log.info("GPIO %d Input ACK ready, state : %s", self.irAck, self.ackState)
+        elif self.irReceiver :
+            log.info("BCM %d Input ready", self.irReceiver)
+            self.backend.setModeGPIO(self.irReceiver, 0)
+            th = threading.Thread(None, self.waitingEventBCM, "th_wait_for_gpio_event_" + channel, (), {})
             th.daemon = True
             th.start()
         if usePWM : 
-            self.pwmEmitter = GPIO.PWM2835(0, self.irEmitter, self.pwmClock, self.pwmRange)
+            self.pwmEmitter = self.backend.createPWM(pwmChannel, self.irEmitter, self.pwmClock, self.pwmRange)
         else :
-            GPIO.BCMsetModeGPIO(self.irEmitter, 1)
+            self.backend.setModeGPIO(self.irEmitter, 1)
         self.readIRCodeFile()
             
     def __del__(self):
-        GPIO.BCMClose()
-        if self.useGPIO: GPIO.cleanup()
+        if not self._capture.closed : self.backend.close()
         
     def close(self):
-        GPIO.BCMClose()
-        if self.useGPIO: GPIO.cleanup()   
+        self._capture.close()
+        self._decoder.join(1.0)
+        self._persist.close()
+        self.history.close()
+        self.backend.close()
    
     def setFrequency(self, freq):
         if freq in FREQUENCIES :
@@ -131,219 +273,384 @@ class RpiIRTrans:
         
     def register_Encoder(self,  name, encoder):
         self.encoders[name] = encoder
+        self._stDecode[name] = STATS.histogram("decode." + name)
+        self._stRejected[name] = STATS.histogram("decode." + name + ".rejectat", REJECTBOUNDS)
+        self._encoderIndex.add(name, encoder)
+        self._rawCache.invalidate(name)
     
     def getEncoder(self, name):
         if name in self.encoders :
             return self.encoders[name]
         else : return None
         
-    def sendIRCode(self,  encoderName, type,  irCode):
+    def sendIRCode(self,  encoderName, type,  irCode, origin = 0, persist = True):
+        """Emit irCode, origin is the requesting WS client id for history, persist False to not save it as last code.
+           BinTimings and HEX irCode can also be a frame of encoder (see DaikinCode.toFrame)."""
+        origin = historyOrigin(origin)
+        code = irCode.toString() if hasattr(irCode, 'toString') else irCode    # legacy string of error results
         encoder = self.getEncoder(encoderName)
         if encoder :
             if type == DataTypes[RAWCode] :
                 result = self.emitRAWIRcode(irCode, 5)
-            elif type == DataTypes[BinTCode] :
-                pulsePairs = encoder.irCodeToRAW(irCode)
-                if pulsePairs != [] :
-                    result = self.emitRAWIRcode(encoder.irCodeToRAW(irCode),  5)
-                    if result['error'] == '': 
+                self.addHistory('sent', result, origin)
+            elif type in (DataTypes[BinTCode], DataTypes[HEXCode]) :
+                if type == DataTypes[HEXCode] and not hasattr(encoder, 'hexToRAW') :
+                    log.warning("Coder %s has no HEX format", encoderName)
+                    return {"error" : "Coder {0} has no HEX format".format(encoderName),  "code": code, "encoder": ""}
+                pulsePairs = self.encodeIRCode(encoderName, type, irCode)
+                if pulsePairs :
+                    result = self.emitRAWIRcode(list(pulsePairs),  5)
+                    self.addHistory('sent', result, origin)
+                    if result['error'] == '' and persist :
                         self._MemIRCode = result
                         self.writeIRCodeFile()
                 else :
-                    print("IR code format error type {0} not respected.".format(type))
-                    result = {"error" : "IR code format error type {0} not respected.".format(type),  "code": irCode, "encoder": ""}
+                    log.warning("IR code format error type %s not respected.", type)
+                    result = {"error" : "IR code format error type {0} not respected.".format(type),  "code": code, "encoder": ""}
             else :
-                print("Code type {0} unknown".format(type))
-                result = {"error" : "Code type {0} unknown".format(type),  "code": irCode, "encoder": ""}
+                log.warning("Code type %s unknown", type)
+                result = {"error" : "Code type {0} unknown".format(type),  "code": code, "encoder": ""}
         else :
-            print("Coder {0} not registered".format(encoderName))
-            result = {"error" : "Coder {0} not registered".format(encoderName),  "code": irCode, "encoder": ""}
+            log.warning("Coder %s not registered", encoderName)
+            result = {"error" : "Coder {0} not registered".format(encoderName),  "code": code, "encoder": ""}
         return result
             
+    def sendIRCodes(self, codes, origin = 0):
+        """Emit a list of codes {"encoder", "datatype", "code", "gap" (optional ms before code)} in one hardware session,
+           receiver stay locked between codes and last sent code is saved once. Return per code results."""
+        if not isinstance(codes, list) or not codes :
+            return {'error': 'Codes list empty or bad format.', 'results': []}
+        if len(codes) > BATCHMAX :
+            return {'error': 'Too many codes, max {0}.'.format(BATCHMAX), 'results': []}
+        results = []
+        last = None
+        self._batch = True
+        try :
+            for item in codes :
+                try :
+                    gap = float(item.get('gap', 0)) / 1000
+                    encoderName, type, irCode = item['encoder'], item['datatype'], item['code']
+                except (AttributeError, KeyError, TypeError, ValueError) :
+                    results.append({'error': 'Code item bad format.', 'code': '', 'encoder': ''})
+                    continue
+                if gap > 0 : time.sleep(min(gap, BATCHMAXGAP))
+                result = self.sendIRCode(encoderName, type, irCode, origin, False)
+                if result['error'] == '' and type != DataTypes[RAWCode] : last = result
+                results.append(result)
+        finally :
+            self._batch = False
+            self.lockRecv = False
+        if last is not None :
+            self._MemIRCode = last
+            self.writeIRCodeFile()
+        failed = len([r for r in results if r['error'] != ''])
+        return {'error': "{0}/{1} codes failed.".format(failed, len(results)) if failed else '', 'results': results,
+                'sent': len(results) - failed, 'failed': failed}
+
+    def encodeIRCode(self, encoderName, type, irCode):
+        """Return pulse pairs train (tuple) of irCode, from cache if already encoded, empty tuple if bad format.
+           Codes of an encoder with frames are converted once to frame, frames are cached whatever the code format."""
+        encoder = self.encoders[encoderName]
+        frame = encoder.toFrame(irCode, type == DataTypes[HEXCode]) if hasattr(encoder, 'toFrame') else None
+        if frame is not None :
+            toRAW, irCode = encoder.frameToRAW, frame
+            key = (encoderName, getattr(encoder, 'revision', 0), 'frame', frame)
+        else :
+            toRAW = encoder.hexToRAW if type == DataTypes[HEXCode] else encoder.irCodeToRAW
+            key = (encoderName, getattr(encoder, 'revision', 0), type, irCode)
+        try :
+            train = self._rawCache.get(key)
+        except TypeError :  # code not hashable, no cache
+            return tuple(toRAW(irCode))
+        if train is None :
+            train = tuple(toRAW(irCode))
+            if train : self._rawCache.put(key, train)
+        return train
+
+    def getCacheStats(self):
+        return self._rawCache.getStats()
+
+    def armAck(self):
+        """Start waiting a hardware ack, return ack sequence to pass to waitForAck."""
+        with self._ackCond :
+            self.waitAck = time.time()
+            return self._ackSeq
+
+    def waitForAck(self, ackSeq, timeout):
+        """Wait a hardware ack edge after armAck returned ackSeq, wake up as soon as it arrives.
+           Return True if acked, False on timeout."""
+        deadline = time.time() + timeout
+        with self._ackCond :
+            while self._ackSeq == ackSeq :
+                remaining = deadline - time.time()
+                if remaining <= 0 :
+                    self.waitAck = 0
+                    return False
+                self._ackCond.wait(remaining)
+            return True
+
+    def setAckTimeouts(self, timeouts):
+        try :
+            ackTimeout = float(timeouts.get('emit', self.ackTimeout))
+            rxAckTimeout = float(timeouts.get('receive', self.rxAckTimeout))
+        except :
+            return {'error': 'Bad ack timeouts format.'}
+        self.ackTimeout = ackTimeout
+        self.rxAckTimeout = rxAckTimeout
+        return {'error' : ""}
+
+    def getAckTimeouts(self):
+        return {'error' : "", 'timeouts': {'emit': self.ackTimeout, 'receive': self.rxAckTimeout}}
+
     def emitRAWIRcode(self,  pulsePairs, maxRepeat = 1):
         if self.irAck : repeat = 1
         else : repeat = maxRepeat
         while repeat <= maxRepeat :
             self.lockRecv = True
+            if self.irAck : ackSeq = self.armAck()
             code = []
             codeIR = []
+            if repeat > 1 : self._stRetries.incr()
+            t = time.time()
             if self.pwmEmitter : 
-                print "Hardware pwm emit {0} try, {1} pairs, freq : {2} Hz, clock {3}, range {4}, duty cycle :{5}%".format(repeat, len(pulsePairs), self.pwmEmitter.GetFrequence(), self.pwmClock, self.pwmRange, self.dutyCycle)
+                if log.isEnabledFor(logging.DEBUG) :
+                    log.debug("Hardware pwm emit %d try, %d pairs, freq : %s Hz, clock %s, range %s, duty cycle :%s%%",
+                                    repeat, len(pulsePairs), self.pwmEmitter.GetFrequence(), self.pwmClock, self.pwmRange, self.dutyCycle)
                 codeIR = self.pwmEmitter.SendPulsePairs(pulsePairs, self.dutyCycle)
             else :
-                print "Emit {0} try, pulse pairs for ir code {1} pairs with software freq : 38 kHz".format(repeat, len(pulsePairs))
-                codeIR = GPIO.BCMPulsePairsGPIO(pulsePairs, pOut)
-            self.lockRecv = False
-            self.waitAck = time.time()
+                log.debug("Emit %d try, pulse pairs for ir code %d pairs with software freq : 38 kHz", repeat, len(pulsePairs))
+                codeIR = self.backend.pulsePairsGPIO(pulsePairs, self.irEmitter)
+            if not self._batch : self.lockRecv = False
+            tEmit = time.time()
+            self._stEmit.observe((tEmit - t) * 1000)
             for p in codeIR : code.append([int(p[0]), int(p[1])])
             result = self.rawToIRCode(code)
-            time.sleep(1)
-            if not self.waitAck :
-                print "((((((( good ack )))))))"
+            if not self.irAck : break   # No ack capability
+            if self.waitForAck(ackSeq, self.ackTimeout) :
+                self._stAck.observe((time.time() - tEmit) * 1000)
+                log.debug("Emission hardware ack received")
                 result = self.rawToIRCode(pulsePairs)
-                repeat = maxRepeat
-            elif self.irAck :
-                print "!!!!! no ack !!!!!"
-                if result["error"] == "" :
-                    result["error"]  = "No hardware ack."
+                break
+            log.debug("No emission hardware ack, try %d", repeat)
+            self._stAckTimeouts.incr()
+            if result["error"] == "" :
+                result["error"]  = "No hardware ack."
             repeat += 1
         if result["error"] == "" :
-            print ("code DAIKIN sended :)")
+            log.info("Code %s sended : %s", result["encoder"], result["code"])
         else :
-            print ("Error sending code : {0}".format(result["error"]))
-        print (result["code"])
+            log.warning("Error sending code : %s, %s", result["error"], result["code"])
         return result
     
     def rawToIRCode(self, codeIR):
-        result = {"error" : "No encoder registered",  "code": ""}
-        r = {"error" : "",  "code": "", "encoder": ""}
-        for encoder in self.encoders :
-            r = self.encoders[encoder].rawToIRCode(codeIR)
+        """Decode capture with candidate encoders from fingerprint index, stop on first identified code.
+           Capture is decoded as a whole (NumPy path), candidates without fingerprint (header already checked by index)
+           with stream decoder (see irprotocol.py) first screen header pairs, a capture rejected there is not decoded."""
+        if not self.encoders : return {"error" : "No encoder registered",  "code": "", "encoder": ""}
+        r = None
+        for encoder in self._encoderIndex.candidates(codeIR) :
+            t = time.time()
+            coder = self.encoders[encoder]
+            stream = None
+            if encoder not in self._encoderIndex.fingerprints and hasattr(coder, 'streamDecoder') : stream = coder.streamDecoder()
+            if stream is None or stream.feedPrefix(codeIR) :
+                r = coder.rawToIRCode(codeIR)
+            else :
+                r = stream.result()
+                del r['rejected']
+                self._stRejected[encoder].observe(stream.rejectedAt)
+                log.debug("Code %s rejected at pair %d/%d : %s", encoder, stream.rejectedAt, len(codeIR), r["error"])
+            self._stDecode[encoder].observe((time.time() - t) * 1000)
+            frame = r.pop("frame", None)
             if r["error"] == "" :
                 r["encoder"] = encoder
-                print ("code Identified {0} :)".format(encoder))
-        if r["error"] != "" :
-            result = {"error" : "No encoder finded",  "code": r["code"],   "encoder": ""}
-        else : result = r
-        return result
+                self.addHex(r, frame)
+                log.debug("Code identified %s", encoder)
+                return r
+        return {"error" : "No encoder finded",  "code": r["code"] if r else "",   "encoder": ""}
     
-    def receiveRAWIRCode(self, codeIR):
-        code = []
-        for p in codeIR : code.append([int(p[0]), int(p[1])])
-        print "Decoding code : {0} pairs".format(len(code))
-#        print code
-        result = self.rawToIRCode(code)
+    def receiveRAWIRCode(self, codeIR, ackSeq):
+        """Decode received code (PulsePairs of capture ring) and publish it if hardware ack arrives after armAck returned ackSeq.
+           Raw pulse pairs are published as 'rawcapture' for clients subscribed to it."""
+        log.debug("Decoding code : %d pairs", len(codeIR))
+        result = self.rawToIRCode(codeIR)
+        self._manager.sendToWSClients('rawcapture', dict(result, channel = self.channel, pulses = codeIR))
         if result["error"] == "" :
-            print ("code Identified :)")
+            log.info("Code %s received : %s", result["encoder"], result["code"])
         else :
-            print ("Error in code : {0}".format(result["error"]))
-        print (result["code"])
+            log.info("Error in code received : %s, %s", result["error"], result["code"])
         hardAck = True
-        while self.waitAck:
-            if time.time() - self.waitAck > 3.5:
-                self.waitAck = 0
-                hardAck = False
-            else : time.sleep(0.1)
+        if self.irAck : hardAck = self.waitForAck(ackSeq, self.rxAckTimeout)
         if hardAck:
-            print "======= Ack receiver OK ======"
+            log.debug("Receiver hardware ack OK")
+            self.addHistory('received', result)
             self._MemIRCode = result
             self.writeIRCodeFile()
-            self._manager.sendToWSClients('codereceived',  result)
+            self._manager.sendToWSClients('codereceived',  dict(result, channel = self.channel))
             if result["error"] != "" : # Code n'est pas identifié, mais envoi l'état (ackState) si disponible.
                 data = self.getState()
                 if data['error'] == "":
+                    data['channel'] = self.channel
                     self._manager.sendToWSClients('hardState',  data)
         else :
-            print "---- No hard Ack receiver for code received ----"
+            log.info("No hard Ack receiver for code received")
     
-    def getMemIRcode(self):
-        if self._MemIRCode : return self._MemIRCode
-        else : return {'error' : 'Unknown status', 'code': '', 'encoder': ''}
+    def _decodeCaptures(self):
+        """Decoder thread, drain captures ring buffer in capture order."""
+        while True :
+            capture = self._capture.get()
+            if capture is None :
+                if self._capture.closed : break
+                continue
+            pulsePairs, ackSeq, tCapture = capture
+            self._stCaptureWait.observe((time.time() - tCapture) * 1000)
+            pulsePairs = self._filter.clean(pulsePairs)
+            if pulsePairs is None :
+                self._stFiltered.incr()
+                continue
+            try :
+                self.receiveRAWIRCode(pulsePairs, ackSeq)
+            except Exception as e :
+                log.exception("Error decoding capture : %s", e)
+            self.decoded += 1
+
+    def getCaptureStats(self):
+        stats = self._capture.getStats()
+        stats['decoded'] = self.decoded
+        stats['filter'] = self._filter.getStats()
+        return stats
+
+    def setCaptureFilter(self, params):
+        return self._filter.configure(params)
+
+    def getCaptureFilter(self):
+        return {'error': "", 'filter': self._filter.getConfig()}
+
+    def getHistory(self, since = 0, limit = 100, encoder = None):
+        try :
+            since, limit = float(since), int(limit)
+        except (TypeError, ValueError) :
+            return {'error': 'Bad history parameters.', 'events': []}
+        return self.history.query(since, limit, encoder)
+
+    def addHistory(self, kind, result, origin = 0):
+        """Add event to history, a history failure is logged and never fails the send or receive."""
+        try :
+            self.history.add(kind, result, origin, self.ackState)
+        except Exception as e :
+            log.error("Error adding %s event to history : %s", kind, e)
+
+    def getPersistStats(self):
+        return self._persist.getStats()
+
+    def addHex(self, result, frame = None):
+        """Add 'hex' alternate code to result of an encoder with HEX format (sent to clients preferring HEX, see wsserver.py),
+           from decoded frame if given."""
+        encoder = self.encoders.get(result.get('encoder'))
+        if frame is None and hasattr(encoder, 'toFrame') : frame = encoder.toFrame(result['code'])
+        if frame is not None :
+            result['hex'] = frame.toHex()
+        elif encoder is not None and hasattr(encoder, 'codeToHex') :
+            hexCode = encoder.codeToHex(result['code'])
+            if hexCode : result['hex'] = hexCode
+        return result
+
+    def getMemIRcode(self, datatype = None):
+        """Return last code, in HEX format if datatype is "HEX"."""
+        if not self._MemIRCode : return {'error' : 'Unknown status', 'code': '', 'encoder': ''}
+        if datatype != DataTypes[HEXCode] : return self._MemIRCode
+        result = self.addHex(dict(self._MemIRCode))
+        if 'hex' not in result : return {'error' : 'No HEX format for code', 'code': result['code'], 'encoder': result['encoder']}
+        result['code'], result['datatype'] = result.pop('hex'), DataTypes[HEXCode]
+        return result
 
     def readIRCodeFile(self):
         """lit le code sauvergarder d'un fichier type txt"""
-        if not os.path.isfile(self._fileBackup) : 
-            print("file {0} not exist, no code memorised at last".format(self._fileBackup))
-            return False
-        else :
-            try:
-                fich = open(self._fileBackup, "r")
-            except :
-                print 'error openning file : ', self._fileBackup
-                return False
-            else :
-                if fich.readline() =="[LASTCODE]\n" :
-                    code = {'error' :""}
-                    code['code'], f = fich.readline().split("\n")
-                    if fich.readline() == "[ENCODER]\n" :
-                        code['encoder'], f = fich.readline().split("\n")
-                        self._MemIRCode = code
-                        retval = True
-                        print "Code read from file : {0}".format(self._MemIRCode)
-                    else: retval = False
-                else: retval = False
-                fich.close()
-                return retval
+        code = self._persist.load()
+        if code is None : return False
+        self._MemIRCode = self.addHex(code)
+        log.info("Code read from file : %s", self._MemIRCode)
+        return True
 
     def writeIRCodeFile(self):
-        """Ecrit le code sauvergarder d'un fichier type txt"""
+        """Ecrit le code sauvergarder d'un fichier type txt, debounced and atomic (see persist.py)"""
         if self._MemIRCode :
-            try:
-                fich = open(self._fileBackup, "w")
-            except :
-                print 'error creating file : ', self._fileBackup
-            else :
-                fich.write("[LASTCODE]\n")
-                fich.write("{0}\n".format(self._MemIRCode['code']))
-                fich.write("[ENCODER]\n")
-                fich.write("{0}\n".format(self._MemIRCode['encoder']))
-                fich.close()
-                print("Code Saved")
-        else: print("no code to save.")
+            self._persist.save(self._MemIRCode)
+        else: log.debug("no code to save.")
 
     def getState(self):
         """Renvoi le status du pin self.irAck qui corresponds à l'état de marche/arret."""
         if self.irAck:
-            self.ackState = GPIO.input(self.irAck)
-            print "GPIO {0} Input ACK, state : {1}\n".format(self.irAck, self.ackState)
+            self.ackState = self.backend.input(self.irAck)
+            log.debug("GPIO %d Input ACK, state : %s", self.irAck, self.ackState)
             return {'error': "", 'state': self.ackState}
         else:
-            print "No pin ack defined, can't get status."
+            log.debug("No pin ack defined, can't get status.")
             return {'error': "No pin ack defined, can't get status.",  'state': 0}
 
 
     def setTolerances(self, encoder,  tolerances):
         if self.encoders.has_key(encoder) :
-            return self.encoders[encoder].setTolerances(tolerances)
+            result = self.encoders[encoder].setTolerances(tolerances)
+            self._encoderIndex.add(encoder, self.encoders[encoder])
+            return result
         else :
+            log.warning("Can't set tolerances,unknown encoder : %s", encoder)
             return {'error' : "Can't set tolerances,unknown encoder : {0}".format(encoder)}
-            print "Can't set tolerances,unknown encoder : {0}".format(encoder)
         
     def getTolerances(self, encoder):
         if self.encoders.has_key(encoder) :
             return {'error' :'',  'tolerances': self.encoders[encoder].getTolerances()}
         else :
+            log.warning("Can't get tolerances,unknown encoder : %s", encoder)
             return {'error' : "Can't get tolerances,unknown encoder : {0}".format(encoder),  'tolerances' : {}}
-            print "Can't get tolerances,unknown encoder : {0}".format(encoder)
 
-    def waitingEventBCM( *args,  **kwargs):
+    def waitingEventBCM(self):
         while True :
             if not self.lockRecv :
-                self.waitAck = time.time()
-                codeIR = GPIO.BCMWatchPulsePairsGPIO(self.irReceiver)
-                if codeIR : self.receiveRAWIRCode(codeIR)
+                ackSeq = self.armAck()
+                codeIR = self.backend.watchPulsePairs(self.irReceiver)
+                if codeIR :
+                    if self._filter.accept(codeIR) : self._capture.put(codeIR, ackSeq)
+                    else : self._stFiltered.incr()
                 time.sleep(0.01)
             else : time.sleep(0.5)
     
     def callback_gpioEvent(self,  GPIOPin):
         if GPIOPin == self.irReceiver :
-#            print"IR Receiver Event ..."
-            self.waitAck = time.time()
-            codeIR = GPIO.BCMWatchPulsePairsGPIO(self.irReceiver)
-            if codeIR : self.receiveRAWIRCode(codeIR)
+            ackSeq = self.armAck()
+            codeIR = self.backend.watchPulsePairs(self.irReceiver)
+            if not codeIR : return
+            if not self._filter.accept(codeIR) :
+                self._stFiltered.incr()
+            elif not self._capture.put(codeIR, ackSeq) :
+                log.warning("Capture buffer full, code dropped (%d pairs)", len(codeIR))
         else :
-            print "IR Receiver Event on bad pin : {0}".format(GPIOPin)
+            log.warning("IR Receiver Event on bad pin : %s", GPIOPin)
 
     def callback_gpioAck(self,  GPIOPin):
         if GPIOPin == self.irAck :
-            state = GPIO.input(GPIOPin)
+            state = self.backend.input(GPIOPin)
             t = time.time()
             tdiff = t - self.tLastAck 
-            print "********************* Callback: state {0}, time step {1} ************".format(state, tdiff)
+            log.debug("Ack callback: state %s, time step %.3f", state, tdiff)
             if self.ackState != state :
                 if state and (tdiff > 0.01): 
-                    if self.waitAck :
-                        if t - self.waitAck < 0.4:
-                            print"********* IR Receiver Ack on pin {0}, time : {1} *********\n".format(GPIOPin, tdiff)
-                        else:
-                            print"........ IR Receiver to long Ack on pin {0}, time : {1} ........\n".format(GPIOPin, tdiff)
-                        self.waitAck = 0
-                    else :
-                        print"***** IR Receiver Ack on pin {0} without waiting ack, time : {1}\n".format(GPIOPin, tdiff)
+                    with self._ackCond :
+                        if self.waitAck :
+                            if t - self.waitAck < 0.4:
+                                log.debug("IR Receiver Ack on pin %d, time : %.3f", GPIOPin, tdiff)
+                            else:
+                                log.debug("IR Receiver to long Ack on pin %d, time : %.3f", GPIOPin, tdiff)
+                            self.waitAck = 0
+                        else :
+                            log.debug("IR Receiver Ack on pin %d without waiting ack, time : %.3f", GPIOPin, tdiff)
+                        self._ackSeq += 1
+                        self._ackCond.notify_all()
                 self.tLastAck = t
                 self.ackState = state
-            else : print"----- Ack Pin {0}, no change state : {1}".format(GPIOPin, state)
+            else : log.debug("Ack Pin %d, no change state : %s", GPIOPin, state)
         else :
-            print "***** IR Receiver Ack on bad pin : {0}\n".format(GPIOPin)
+            log.warning("IR Receiver Ack on bad pin : %s", GPIOPin)
 
 
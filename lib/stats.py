@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of DAIKIN PAC Controler project $
+
+License
+=======
+
+B(Rpi_IR_Transceiver} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Rpi_IR_Transceiver} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Program purpose
+==============
+
+Latency and throughput metrics of transceiver (request 'getStats', pub 'stats').
+
+Implements
+==========
+
+Counters and fixed buckets histograms, created once at startup and updated in place, an event never allocates.
+Durations are in ms, histogram report gives count, min, max, avg and p50/p95/p99 estimated from buckets upper bound.
+Metrics are registered in module STATS registry, shared by all modules.
+"""
+
+import threading
+import bisect
+import time
+from array import array
+
+LATENCYBOUNDS = (0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)    # ms buckets upper bounds
+
+class Histogram(object):
+    """Fixed buckets histogram, last bucket counts values over last bound."""
+
+    def __init__(self, bounds = LATENCYBOUNDS):
+        self.bounds = tuple(bounds)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock :
+            self.counts = array('l', [0]) * (len(self.bounds) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.min = 0.0
+            self.max = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock :
+            self.counts[i] += 1
+            if not self.count or value < self.min : self.min = value
+            if value > self.max : self.max = value
+            self.count += 1
+            self.total += value
+
+    def percentile(self, p):
+        """Return upper bound of bucket holding percentile p (0-100), max for last bucket."""
+        if not self.count : return 0.0
+        rank = self.count * p / 100.0
+        n = 0
+        for i, c in enumerate(self.counts) :
+            n += c
+            if n >= rank and c :
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def getReport(self):
+        with self._lock :
+            return {'count': self.count, 'min': self.min, 'max': self.max, 'avg': self.total / self.count if self.count else 0.0,
+                    'p50': self.percentile(50), 'p95': self.percentile(95), 'p99': self.percentile(99),
+                    'bounds': list(self.bounds), 'buckets': self.counts.tolist()}
+
+class Counter(object):
+    """Thread safe incremented counter."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def incr(self, n = 1):
+        with self._lock :
+            self.value += n
+
+    def reset(self):
+        with self._lock :
+            self.value = 0
+
+class StatsRegistry(object):
+    """Named counters and histograms, getters create metric at first call, keep returned object for hot paths."""
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self.tStart = time.time()
+
+    def counter(self, name):
+        with self._lock :
+            if name not in self._counters : self._counters[name] = Counter()
+            return self._counters[name]
+
+    def histogram(self, name, bounds = LATENCYBOUNDS):
+        with self._lock :
+            if name not in self._histograms : self._histograms[name] = Histogram(bounds)
+            return self._histograms[name]
+
+    def reset(self):
+        with self._lock :
+            for m in self._counters.values() + self._histograms.values() : m.reset()
+            self.tStart = time.time()
+
+    def getStats(self):
+        with self._lock :
+            counters = dict((name, c.value) for name, c in self._counters.items())
+            histograms = self._histograms.items()
+        return {'error': '', 'uptime': time.time() - self.tStart, 'counters': counters,
+                'histograms': dict((name, h.getReport()) for name, h in histograms)}
+
+STATS = StatsRegistry()
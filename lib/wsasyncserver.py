@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of DAIKIN PAC Controler project $
+
+License
+=======
+
+B(Rpi_IR_Transceiver} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Rpi_IR_Transceiver} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Program purpose
+==============
+
+asyncio backend of WebSocket BroadcastServer.
+
+Implements
+==========
+
+All websockets are served by one asyncio event loop thread, without thread by client.
+The handshake is done by the protocol, then frames are parsed by ws4py WebSocketsHandler (same JSON header
+protocol as wsgiref backend, see wsserver.py). Client messages are passed to callback in an executor,
+so blocking transceiver calls never stall the event loop.
+Use asyncio module, or trollius backport with python 2.
+"""
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+import hashlib
+import base64
+
+from lib.wsserver import BroadcastServer, WebSocketsHandler, __ctrlServer__
+
+WSGUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAXHANDSHAKE = 8192     # Max size of handshake request
+
+class TransportSocket(object):
+    """Socket like wrapper of an asyncio transport, used as sock by ws4py WebSocket.
+       Writes from other threads than event loop one are forwarded to the loop."""
+
+    def __init__(self, server, transport):
+        self._server = server
+        self._transport = transport
+
+    def sendall(self, data):
+        if self._server.loopThread is threading.current_thread() : self._transport.write(data)
+        else : self._server.loop.call_soon_threadsafe(self._transport.write, data)
+
+    def getsockname(self):
+        return self._transport.get_extra_info('sockname')[:2]
+
+    def getpeername(self):
+        return self._transport.get_extra_info('peername')[:2]
+
+    def shutdown(self, how):
+        pass
+
+    def close(self):
+        self._server.loop.call_soon_threadsafe(self._transport.close)
+
+class WebSocketProtocol(asyncio.Protocol):
+    """One protocol instance by client connection, do handshake then feed ws4py handler."""
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.ws = None
+        self._buffer = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self._buffer += data
+        if self.ws is None :
+            if b"\r\n\r\n" not in self._buffer :
+                if len(self._buffer) > MAXHANDSHAKE : self._reject("413 Request Entity Too Large")
+                return
+            request, self._buffer = self._buffer.split(b"\r\n\r\n", 1)
+            if not self._handshake(request) : return
+        self._feed()
+
+    def _reject(self, status):
+        self.transport.write("HTTP/1.1 {0}\r\nConnection: close\r\n\r\n".format(status).encode('ascii'))
+        self.transport.close()
+
+    def _handshake(self, request):
+        """Check upgrade request, send accept response and open the websocket handler."""
+        lines = request.decode('latin-1').split("\r\n")
+        headers = {}
+        for line in lines[1:] :
+            if ":" in line :
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        if not lines[0].startswith("GET ") or headers.get('upgrade', '').lower() != 'websocket' or \
+                'sec-websocket-key' not in headers or headers.get('sec-websocket-version') != '13' :
+            self._reject("400 Bad Request")
+            return False
+        accept = base64.b64encode(hashlib.sha1((headers['sec-websocket-key'] + WSGUID).encode('ascii')).digest())
+        self.transport.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n" +
+                                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        self.ws = WebSocketsHandler(TransportSocket(self.server, self.transport))
+        self.ws.opened()
+        return True
+
+    def _feed(self):
+        """Feed ws4py stream, at most reading_buffer_size bytes at a time as it expects."""
+        while self._buffer and self.ws.stream is not None :
+            n = self.ws.reading_buffer_size
+            chunk, self._buffer = self._buffer[:n], self._buffer[n:]
+            if not self.ws.process(chunk) :
+                self._terminate()
+                break
+
+    def _terminate(self):
+        if self.ws is not None and self.ws.stream is not None :
+            self.ws.terminate()
+
+    def connection_lost(self, exc):
+        self._terminate()
+
+class AsyncBroadcastServer(BroadcastServer):
+    """BroadcastServer on asyncio event loop, same JSON protocol as wsgiref backend.
+       @param maxWorkers: number of executor threads for callback, 1 keeps client requests serialized."""
+
+    def __init__(self,  port=5570,  cb_recept = None,  log = None,  logLevel = logging.INFO,  sharedHeader = False,  maxWorkers = 1):
+        self.loop = None
+        self.loopThread = None
+        self._executor = ThreadPoolExecutor(max_workers = maxWorkers)
+        BroadcastServer.__init__(self, port, cb_recept, log, logLevel, sharedHeader)
+
+    def _createServer(self):
+        """Create event loop and listening server, loop is run by run thread."""
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(self.loop.create_server(lambda: WebSocketProtocol(self), '', self.port))
+
+    def dispatch(self, msg):
+        """Pass client message to callback in executor, event loop is never blocked."""
+        if self.cb_recept :
+            future = self.loop.run_in_executor(self._executor, self.cb_recept, msg)
+            future.add_done_callback(self._dispatchDone)
+
+    def _dispatchDone(self, future):
+        if future.exception() is not None :
+            self.logMsg("error", "WebSocket callback error : %s", future.exception())
+
+    def run(self):
+        """Run event loop forever, calling by thread start."""
+        self.logMsg("info", "Starting asyncio WebSocket server forever on port : %d", self.port)
+        asyncio.set_event_loop(self.loop)
+        self.loopThread = threading.current_thread()
+        self.running = True
+        self.loop.run_forever()
+        self.running = False
+
+    def _stop(self):
+        self.server.close()
+        for ws in self._getWebsockets() :
+            try :
+                ws.close(1001, "Server shutdown")
+            except Exception :
+                pass
+        self.loop.stop()
+
+    def close(self):
+        """Closing server"""
+        if self.loop.is_running() : self.loop.call_soon_threadsafe(self._stop)
+        self._executor.shutdown(wait = False)
+        self.logMsg("info",  "WebSocket server forever on port : %d closed", self.port)
+
+    def __del__(self):
+        """Close server and Destroy class."""
+        self.running = False
+        if __ctrlServer__ and __ctrlServer__.get(self.port) is self : del __ctrlServer__[self.port]
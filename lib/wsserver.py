@@ -40,10 +40,25 @@ All message have an header JSON with keys :
                                 -'idws' : peer_adresss, id that the client keeps for identification.
         -'ack-connect' : Internal server type to confirm that client have recept first confirmation ('confirm-connect').
                               The client must send this message type to finalized connection. See UI client part.
+                              With header key 'binary': true the client negotiates binary frames for pulse trains (see binframe.py),
+                              server confirms with 'binary': true and 'binversion' in 'confirm-connect' header :
+                                - client can send 'RAW' sendIRCode as a binary frame, meta is the request without 'code'.
+                                - 'rawcapture' pubs are sent to it as binary frames, meta is the pub without data 'pulses'.
+                              Other messages stay JSON text.
+                              With header key 'datatype': "HEX" the client receives codes of pubs and acks in HEX format
+                              when the encoder has one ("datatype": "HEX" is then added to data), server confirms with 'datatype'.
                               
         -'server-hbeat' : Internal server type for client check server running.
                                server send automaticly an confirmation message. See UI client part if you implement it.
                                
+        -'req' or 'req-ack' with 'request' 'subscribe' / 'unsubscribe' : handled by server, not passed to callback.
+                              A client receives all pubs until it subscribes, then only pubs matching one of its topics.
+                              A topic is a filter dict on pub 'type' and 'data' 'encoder' and 'channel', missing key matches all.
+                              Pub types of EXPLICITTOPICS ('rawcapture') are only sent to clients subscribed with this type.
+                                -'subscribe' : {"topics": [{"type": "codereceived", "encoder": "DAIKIN", "channel": "main"}, {"type": "hardState"}]}
+                                -'unsubscribe' : {"topics": [...]}, without "topics" remove all, client then receives no pub.
+                              Ack data : {"topics": [current topics], "all": true if client receives all pubs, "error": ""}
+
     - 'idws' : Identify resquesting client. See UI client part.
     - 'idmsg: Identify of individual resquet. See UI client part.
     - 'ip' : Identify resquesting IP client. 
@@ -60,14 +75,30 @@ from wsgiref.simple_server import make_server
 from ws4py.server.wsgirefserver import WSGIServer, WebSocketWSGIRequestHandler
 from ws4py.server.wsgiutils import WebSocketWSGIApplication
 from ws4py.websocket import WebSocket
+from ws4py.messaging import TextMessage, BinaryMessage
 from ws4py import configure_logger as wsServer_logger
 import threading
+import sys
 import json
 import time
 import os
 
+from lib.logqueue import getLogger, queueHandlers
+from lib.binframe import PulsePairs, packFrame, unpackFrame, BinFrameException, BINVERSION
+from lib.stats import STATS
+
+log = getLogger("wsserver")
+_stBroadcast = STATS.histogram("broadcast.duration")
+_stBroadcastSent = STATS.counter("broadcast.sent")
+_stBroadcastFailed = STATS.counter("broadcast.failed")
+_stBroadcastFiltered = STATS.counter("broadcast.filtered")
+TOPICKEYS = ('type', 'encoder', 'channel')    # pub type, data encoder, data channel
+SUBSCRIPTIONS = ('subscribe', 'unsubscribe')
+EXPLICITTOPICS = ('rawcapture', )   # pub types not sent to clients without subscription
+LOGLEVELS = {'debug': logging.DEBUG, 'info': logging.INFO, 'warning': logging.WARNING, 'error': logging.ERROR, 'critical': logging.CRITICAL}
+
 
-__ctrlServer__ = []  # tab servers for websockets recover
+__ctrlServer__ = {}  # servers by port for websockets recover
 
 class WsUIServerException(Exception):
     """"Websocket server generic exception class.
@@ -82,9 +113,43 @@ class WsUIServerException(Exception):
         """String format objet"""
         return repr(self.msg + ' ' + self.value)
         
+def topicKey(topic):
+    """Return index key (type, encoder, channel) of topic filter dict, None for any value. Raise ValueError if bad format."""
+    if not isinstance(topic, dict) or set(topic) - set(TOPICKEYS) :
+        raise ValueError("Bad topic {0}, keys are {1}".format(topic, TOPICKEYS))
+    key = tuple(topic.get(k) for k in TOPICKEYS)
+    for v in key :
+        if v is not None and not isinstance(v, basestring) : raise ValueError("Bad topic {0}, values are strings".format(topic))
+    return key
+
+def messageKeys(msg):
+    """Return topic keys matching pub msg."""
+    data = msg.get('data')
+    if not isinstance(data, dict) : data = {}
+    values = [(v, None) if v else (None, ) for v in (msg.get('type'), data.get('encoder'), data.get('channel'))]
+    if msg.get('type') in EXPLICITTOPICS : values[0] = (msg['type'], )
+    return [(t, e, c) for t in values[0] for e in values[1] for c in values[2]]
+
+def codeVariant(data, useHex):
+    """Return data for client code format : 'hex' alternate code (see RpiIRTrans.addHex) replaces 'code' for
+       client preferring HEX, else it's removed. Items of 'results' list (sendIRCodes) are done too."""
+    if not isinstance(data, dict) : return data
+    if 'hex' in data :
+        data = data.copy()
+        hexCode = data.pop('hex')
+        if useHex : data['code'], data['datatype'] = hexCode, "HEX"
+    if isinstance(data.get('results'), list) :
+        data = dict(data, results = [codeVariant(r, useHex) for r in data['results']])
+    return data
+
+def spliceHeader(header, body):
+    """Return JSON message of already serialized body (a JSON object) with header key in first."""
+    if body == "{}" : return '{"header": ' + json.dumps(header) + '}'
+    return '{"header": ' + json.dumps(header) + ', ' + body[1:]
+
 class BroadcastServer(object):
     """Class de gestion du server websocket pour dialogue plugin UI"""
-    def __init__(self,  port=5570,  cb_recept = None,  log = None,  logLevel = logging.INFO):
+    def __init__(self,  port=5570,  cb_recept = None,  log = None,  logLevel = logging.INFO,  sharedHeader = False):
         fName = "//var//log//wsserver.log"
         self.log = log
         if self.log :
@@ -93,182 +158,338 @@ class BroadcastServer(object):
                     fName = os.path.dirname(h.baseFilename) + "/wsserver.log"
                     break
             logLevel = self.log.getEffectiveLevel()
-        self._wsLogws = wsServer_logger(level = logLevel)
+        self._wsLogws = wsServer_logger(stdout = False, level = logLevel)
         logfmt = logging.Formatter("[%(asctime)s] %(levelname)s %(message)s")
-        handler = logging.handlers.RotatingFileHandler(fName, maxBytes=2097152, backupCount=5)
-        handler.setLevel(logLevel)
-        handler.setFormatter(logfmt)
-        self._wsLogws.addHandler(handler)
-        self.logMsg("info", "Log WS Server level {0} on : {1}".format(logLevel , fName))
+        handlers = [logging.StreamHandler(sys.stdout), logging.handlers.RotatingFileHandler(fName, maxBytes=2097152, backupCount=5)]
+        for handler in handlers : handler.setFormatter(logfmt)
+        # Console and file are written by listener thread, level is set on logger (see logqueue.setLogLevel).
+        self._logListener = queueHandlers(self._wsLogws, handlers)
+        self.logMsg("info", "Log WS Server level %s on : %s", logLevel , fName)
 
         global __ctrlServer__
         # check free port
-        for s in __ctrlServer__ :
-            if s.port == port :
-                self.logMsg("error", "Creating WS server error, port %d allready used."  % port)
-                raise WsUIServerException ("Creating WS server error, port %d allready used."  % port)
+        if port in __ctrlServer__ :
+            self.logMsg("error", "Creating WS server error, port %d allready used.", port)
+            raise WsUIServerException ("Creating WS server error, port %d allready used."  % port)
         self.logMsg("debug", "Initializing WebSocket server plugin.....")
         self.buffer = []
-        self.clients = set()
+        self.clients = {}   # connected websockets by idws
+        self._clientsLock = threading.Lock()
+        self._topics = {}   # subscribed websockets by topic key, see topicKey()
+        self._allTopics = set()     # websockets without subscription, receive all pubs
         self.fail_clients = set()
         self.running = False
         self.port = port
         self.cb_recept = cb_recept
+        self.sharedHeader = sharedHeader
         self.server = None
-        self.server = make_server('', port, server_class=WSGIServer,
-                     handler_class=WebSocketWSGIRequestHandler,
-                     app=WebSocketWSGIApplication(handler_cls=WebSocketsHandler))
+        self._createServer()
         if not self.server : raise WsUIServerException('Error websocket server creation, check if there is any other running plugin instance.')
-        self.server.initialize_websockets_manager()
-        __ctrlServer__.append(self)
+        __ctrlServer__[port] = self
         servUI = threading.Thread(None, self.run, "th_WSserv_msg_to_ui", (), {} )
         servUI.start()
         time.sleep(0.1)
-        self.logMsg("info", "WebSocket server started on port : %d" %self.port)
-        print "**************** WebSocket server is started on port %d ********************" %self.port
+        self.logMsg("info", "WebSocket server started on port : %d", self.port)
         
+    def _createServer(self):
+        """Create wsgiref server with ws4py websockets manager."""
+        self.server = make_server('', self.port, server_class=WSGIServer,
+                     handler_class=WebSocketWSGIRequestHandler,
+                     app=WebSocketWSGIApplication(handler_cls=WebSocketsHandler))
+        if self.server : self.server.initialize_websockets_manager()
+
+    def registerClient(self, ws):
+        """Add websocket to clients registry, call at client openning."""
+        with self._clientsLock :
+            self.clients[ws.peer_address[1]] = ws
+            ws.topics = None
+            ws.binary = False
+            ws.datatype = None
+            self._allTopics.add(ws)
+
+    def unregisterClient(self, ws):
+        """Remove websocket from clients registry, call at client closing."""
+        with self._clientsLock :
+            if self.clients.get(ws.peer_address[1]) is ws : del self.clients[ws.peer_address[1]]
+            self._setTopics(ws, None)
+            self._allTopics.discard(ws)
+
+    def _setTopics(self, ws, topics):
+        """Replace topic keys of ws in index, None for all pubs. Call with clients lock."""
+        for key in ws.topics or () :
+            subscribers = self._topics.get(key)
+            if subscribers is not None :
+                subscribers.discard(ws)
+                if not subscribers : del self._topics[key]
+        ws.topics = topics
+        if topics is None :
+            self._allTopics.add(ws)
+        else :
+            self._allTopics.discard(ws)
+            for key in topics : self._topics.setdefault(key, set()).add(ws)
+
+    def subscribe(self, ws, topics):
+        """Add topic filters (list of dict) to client ws, it then receives only matching pubs."""
+        if not topics : raise ValueError("No topics to subscribe")
+        keys = set(topicKey(t) for t in topics)
+        with self._clientsLock :
+            self._setTopics(ws, (ws.topics or set()) | keys)
+
+    def unsubscribe(self, ws, topics = None):
+        """Remove topic filters of client ws, all if topics is None."""
+        keys = set(topicKey(t) for t in topics) if topics is not None else None
+        with self._clientsLock :
+            self._setTopics(ws, (ws.topics or set()) - keys if keys is not None else set())
+
+    def getTopics(self, ws):
+        """Return topic filters of client ws and True if it receives all pubs."""
+        if ws.topics is None : return [], True
+        return [dict((k, v) for k, v in zip(TOPICKEYS, key) if v is not None) for key in sorted(ws.topics)], False
+
+    def _getSubscribers(self, msg):
+        """Return websockets to which pub msg is sent, from topic index."""
+        with self._clientsLock :
+            subscribers = set(self._allTopics) if msg.get('type') not in EXPLICITTOPICS else set()
+            for key in messageKeys(msg) :
+                if key in self._topics : subscribers.update(self._topics[key])
+        return subscribers
+
+    def getClient(self, idws):
+        """Return websocket of client idws or None."""
+        return self.clients.get(idws)
+
+    def _getWebsockets(self):
+        """Return a list of connected websockets."""
+        with self._clientsLock :
+            return self.clients.values()
+
+    def dispatch(self, msg):
+        """Pass client message to callback, in websockets manager thread."""
+        if self.cb_recept : self.cb_recept(msg)
+
     def run(self):
         """Starting server in forever mode , calling by thread start.""" 
         # TODO : Ajouter la gestion d'une exception en cas d'erreur sur le server
-        print "**************** Starting WebSocket server forever **************"
-        self.logMsg("info", "Starting WebSocket server forever on port : %d" %self.port)
+        self.logMsg("info", "Starting WebSocket server forever on port : %d", self.port)
         self.running = True
         self.server.serve_forever()
     
     def close(self):
         """Closing server"""
         self.server.server_close()
-        self.logMsg("info",  "WebSocket server forever on port : %d closed" %self.port)
+        self.logMsg("info",  "WebSocket server forever on port : %d closed", self.port)
         
     def __del__(self):
         """Close server and Destroy class."""
-        print ('server stopped')
         self.running = False
         if  self.server : self.server.server_close()
-        if __ctrlServer__ : __ctrlServer__.remove(self)
-        self.logMsg("info",  "WebSocket server forever on port : %d Destroyed" %self.port)
+        if __ctrlServer__ and __ctrlServer__.get(self.port) is self : del __ctrlServer__[self.port]
+        self.logMsg("info",  "WebSocket server forever on port : %d Destroyed", self.port)
 
-    def broadcastMessage(self, msg):
-        """broadcast Message to all clients"""
+    def broadcastMessage(self, msg, sharedHeader = None):
+        """broadcast Message to clients subscribed to it (see subscribe), message body is serialized once, only if needed.
+           By default only the small client header (idws, ip, timestamp) is formated by client and spliced
+           in the body. In shared header mode the same websocket frame (header idws 'for each') is encoded once
+           and written to every client."""
+        if sharedHeader is None : sharedHeader = self.sharedHeader
+        t = time.time()
+        websockets = self._getSubscribers(msg)
+        _stBroadcastFiltered.incr(len(self.clients) - len(websockets))
+        if not websockets :
+            log.debug("Server broadcasting %s, no subscribed client", msg.get('type', ''))
+            return
         message = msg.copy()  # copy dict to ensure a memory change during process
-        header = {'type':'pub',  'idws' : 'for each' , 'ip' : '0.0.0.0',  'timestamp' : long(time.time()*100)}
-        message['header'] = header
-        # It's a copy of ws4py part lib (ws4py/manager.py  def broadcast(self, message, binary=False):) to add individual header infos. For python 3 
-        # TODO : For python 3 compatibility check code : ws_iter = websockets.itervalues() must be ws_iter = iter(websockets.values())
-        with self.server.manager.lock: # to prevent some change in websocket list client
-            websockets = self.server.manager.websockets.copy()
-            ws_iter = websockets.itervalues()
-        for ws in ws_iter:
+        message.pop('header', None)
+        timestamp = long(time.time()*100)
+        nb = 0
+        data = message.get('data')
+        if isinstance(data, dict) and ('hex' in data or 'results' in data) :    # code variant by client datatype
+            hexWebsockets = [ws for ws in websockets if ws.datatype == "HEX"]
+            if hexWebsockets :
+                nb += self._broadcast(hexWebsockets, dict(message, data = codeVariant(data, True)), sharedHeader, timestamp)
+                websockets = [ws for ws in websockets if ws.datatype != "HEX"]
+            message['data'] = codeVariant(data, False)
+        nb += self._broadcast(websockets, message, sharedHeader, timestamp)
+        _stBroadcastSent.incr(nb)
+        _stBroadcast.observe((time.time() - t) * 1000)
+        log.debug("Server broadcasting %s sended to %d clients", msg.get('type', ''), nb)
+
+    def _broadcast(self, websockets, message, sharedHeader, timestamp):
+        """Send message (without header) to websockets, return number of sent."""
+        nb = 0
+        if not websockets : return nb
+        pulses = message['data'].get('pulses') if isinstance(message.get('data'), dict) else None
+        if isinstance(pulses, PulsePairs) :
+            message['data'] = message['data'].copy()
+            del message['data']['pulses']
+            binary = [ws for ws in websockets if ws.binary]
+            if binary :
+                nb += self._broadcastBinary(binary, message, pulses, timestamp)
+                websockets = [ws for ws in websockets if not ws.binary]
+                if not websockets : return nb
+            message['data']['pulses'] = pulses.toList()
+        body = json.dumps(message)
+        if sharedHeader :
+            frame = TextMessage(spliceHeader({'type':'pub',  'idws' : 'for each' , 'ip' : '0.0.0.0',  'timestamp' : timestamp}, body)).single(mask = False)
+        else :
+            body = ", " + body[1:] if body != "{}" else "}"
+        # It's a copy of ws4py part lib (ws4py/manager.py  def broadcast(self, message, binary=False):) to add individual header infos.
+        for ws in websockets:
             if not ws.terminated:                
                 try:
-                    message['header']  = {'type':'pub', 'idws' : ws.peer_address[1] , 'ip' : ws.peer_address[0],  'timestamp' : long(time.time()*100)}
-                    ws.send(json.dumps(message))
-                    print "Server broadcasting sended to : ",  message['header']['idws']
-                    print message
-              #      self.logMsg("debug", "Server broadcasting sended to : {0}".format(message['header']['idws']))
+                    if sharedHeader :
+                        ws._write(frame)
+                    else :
+                        ws.send(ws.pubHeader % timestamp + body)
+                    nb += 1
+                except Exception:
+                    _stBroadcastFailed.incr()
+                    self.logMsg("warning",  "Failed sockets : %s:%s", ws.peer_address[0], ws.peer_address[1])
+        return nb
+
+    def _broadcastBinary(self, websockets, message, pulses, timestamp):
+        """Send message with pulse train as one binary frame, encoded once, to websockets. Return number of sent."""
+        message['header'] = {'type':'pub',  'idws' : 'for each' , 'ip' : '0.0.0.0',  'timestamp' : timestamp}
+        frame = BinaryMessage(packFrame(message, pulses)).single(mask = False)
+        del message['header']
+        nb = 0
+        for ws in websockets :
+            if not ws.terminated :
+                try :
+                    ws._write(frame)
+                    nb += 1
                 except Exception:
-                    self.logMsg("warning",  "Failed sockets : {0}:{1}".format(ws.peer_address[0], ws.peer_address[1]))
-                    pass
+                    _stBroadcastFailed.incr()
+                    self.logMsg("warning",  "Failed sockets : %s:%s", ws.peer_address[0], ws.peer_address[1])
+        return nb
 
     def sendAck(self, ackMessage):
         """Send a confirmation message  'Ack'  to client"""
         ackMsg = ackMessage.copy()  # copy dict to ensure a memory change during process
         if ackMsg['header'] :
-            # TODO : For python 3 compatibility check code : ws_iter = websockets.itervalues() must be ws_iter = iter(websockets.values())
-            with self.server.manager.lock: # to prevent some change in websocket list client
-                websockets = self.server.manager.websockets.copy()
-                ws_iter = websockets.itervalues()
-            for ws in ws_iter :
-                if not ws.terminated:                
-                    if ws.peer_address[1] == ackMsg['header']['idws'] :
-                        try :
-                            ws.send(json.dumps(ackMsg))
-                            info = {}
-                            for k in ackMsg :
-                                if k != "data" and k != "header":  info[k] = ackMsg[k]
-                            self.logMsg("debug", "Ack sended to WebSocket client : {0}:{1} => {2}".format(ackMsg['header']['ip'], ackMsg['header']['idws'],  info))
-                        except Exception:
-                            self.logMsg("warning",  "Failed sockets : {0}:{1}".format(ws.peer_address[0], ws.peer_address[1]))
-                            pass
-
-    def logMsg(self, type = "info", msg =""):
-        """Log msg in plugin and wsuiserver"""
+            ws = self.getClient(ackMsg['header']['idws'])
+            if ws is not None and not ws.terminated:                
+                if 'data' in ackMsg : ackMsg['data'] = codeVariant(ackMsg['data'], ws.datatype == "HEX")
+                try :
+                    ws.send(json.dumps(ackMsg))
+                    if self._wsLogws.isEnabledFor(logging.DEBUG) :
+                        info = {}
+                        for k in ackMsg :
+                            if k != "data" and k != "header":  info[k] = ackMsg[k]
+                        self.logMsg("debug", "Ack sended to WebSocket client : %s:%s => %s", ackMsg['header']['ip'], ackMsg['header']['idws'],  info)
+                except Exception:
+                    self.logMsg("warning",  "Failed sockets : %s:%s", ws.peer_address[0], ws.peer_address[1])
+
+    def logMsg(self, type = "info", msg ="", *args):
+        """Log msg in plugin and wsuiserver, msg % args is formated only if level is enabled."""
         if msg !="":
-            if type =='info' : 
-                if self.log : self.log.info(msg)
-                self._wsLogws.info(msg)
-            elif type == 'debug' :
-                if self.log : self.log.debug(msg)
-                self._wsLogws.debug(msg)
-            elif type == 'error' :
-                if self.log : self.log.error(msg)
-                self._wsLogws.error(msg)
-            elif type == 'warning' :
-                if self.log : self.log.warning(msg)
-                self._wsLogws.warning(msg)
-            elif type == 'critical' :
-                if self.log : self.log.critical(msg)
-                self._wsLogws.critical(msg)
+            level = LOGLEVELS.get(type)
+            if level is None : return
+            if self.log : self.log.log(level, msg, *args)
+            self._wsLogws.log(level, msg, *args)
            
             
 class WebSocketsHandler(WebSocket):
     """One Client Class par client, create by server, inherited from WebSocket class ."""
+
+    @property
+    def pubHeader(self):
+        """Start of 'pub' message with client header, a format string waiting timestamp, to complete with body keys."""
+        try :
+            return self._pubHeader
+        except AttributeError :
+            header = json.dumps({'type':'pub', 'idws' : self.peer_address[1] , 'ip' : self.peer_address[0],  'timestamp' : 0})
+            self._pubHeader = '{"header": ' + header.replace("%", "%%").replace('"timestamp": 0', '"timestamp": %d')
+            return self._pubHeader
+
     def opened(self):
         """Call at client openning."""
-        global __ctrlServer__
         port = self.sock.getsockname()[1]
-        self.server = None
-        for s in __ctrlServer__ :  # Find conresponding server object
-            if s.port == port : self.server = s
+        self.server = getServerOnPort(port)
         if not self.server :
             raise WsUIServerException ("Openning WS client error, port %d not find in server list."  % port)
-        print 'New WebSocket client detected ',  self.peer_address
-        self.server.logMsg("info",  "A new WebSocket client connected : %s:%s"  % (self.peer_address[0], self.peer_address[1]))
+        self.server.registerClient(self)
+        self.server.logMsg("info",  "A new WebSocket client connected : %s:%s", self.peer_address[0], self.peer_address[1])
         self.send(json.dumps({'header': {'type' : 'confirm-connect', 'id' : 'ws_serverUI',  'idws': self.peer_address[1]}}))
-        print 'WebSockect Message confirmation send from open to client',  self.peer_address[1] 
+        log.debug("WebSockect Message confirmation send from open to client %s", self.peer_address[1])
         self.confirmed = False
 
     def closed(self, code,  status):
         """Call at client closing or lost"""
-        print 'Client WebSocket supprimer',  code,  status,  self.connection
-        self.server.logMsg("info",  "WebSocket client disconnected : %s" % self.connection )
+        if self.server : self.server.unregisterClient(self)
+        self.server.logMsg("info",  "WebSocket client disconnected : %s, code %s, %s", self.connection, code, status)
 
         
     def received_message(self, message):
         """Callback from recept client message, handle return confirmation message (Ack)."""
-        print '  Recept from client, transfer to handler: ',  message
-#        session = self.environ.get('REMOTE_ADDR')
-#        print '    Recept websocket message, session on : ',  session,  ' client : ',  self.peer_address[1]
+        if message.is_binary :
+            self.receivedBinary(message.data)
+            return
+        log.debug("Recept from client, transfer to handler: %s", message)
         try :
             msg = json.loads(str(message))
             header = msg['header'] 
         except TypeError as e :
-            print '   Error parsing websocket msg :',  e
-            self.server.logMsg("debug",  "WebSocket client error parsing msg : %s , Message : %s" % (e, str(message)))
+            self.server.logMsg("debug",  "WebSocket client error parsing msg : %s , Message : %s", e, message)
         else :
       #      self.server.logMsg("debug",  "client received msg : {0}".format(header))
             if header['type']  == 'ack-connect':
                 self.confirmed = True
-                self.send(json.dumps({'header': {'type' : 'confirm-connect', 'id' : 'ws_serverUI',  'idws': self.peer_address[1]}}))
-                self.server.logMsg("debug", 'WebSockect client connection confirmed by received, send client identity : {0}'.format(self.peer_address[1]))
+                confirm = {'type' : 'confirm-connect', 'id' : 'ws_serverUI',  'idws': self.peer_address[1]}
+                if header.get('binary') :
+                    self.binary = True
+                    confirm.update({'binary': True, 'binversion': BINVERSION})
+                if header.get('datatype') == "HEX" :
+                    self.datatype = "HEX"
+                    confirm['datatype'] = "HEX"
+                self.send(json.dumps({'header': confirm}))
+                self.server.logMsg("debug", 'WebSockect client connection confirmed by received, send client identity : %s', self.peer_address[1])
             elif header['type']  == 'server-hbeat':
                 self.sendAck(msg)
+            elif self.confirmed == True and header['type'] in ('req', 'req-ack') and msg.get('request') in SUBSCRIPTIONS :
+                self.handleSubscription(msg)
             elif self.confirmed == True :
-                print '   Send to callback'
-                if self.server.cb_recept : self.server.cb_recept(msg)
+                self.server.dispatch(msg)
             if header['type'] == "ack" : self.sendAck({'msg':msg})
-        print '++++++++++  End Websocket reception  +++++++++++'
         
+    def receivedBinary(self, data):
+        """Binary frame from client (see binframe.py), meta is the request and pulse train its 'code'."""
+        if not (self.confirmed and getattr(self, 'binary', False)) :
+            self.server.logMsg("warning",  "Binary frame from client %s without binary negotiation, ignored", self.peer_address[1])
+            return
+        try :
+            msg, pulses = unpackFrame(data)
+            msg['header']
+        except (BinFrameException, KeyError) as e :
+            self.server.logMsg("debug",  "WebSocket client error parsing binary frame : %s", e)
+            return
+        log.debug("Binary frame from client %s, %d pairs, transfer to handler: %s", self.peer_address[1], len(pulses), msg)
+        msg['code'] = pulses
+        self.server.dispatch(msg)
+
+    def handleSubscription(self, msg):
+        """Do 'subscribe' or 'unsubscribe' request, ack it for 'req-ack'."""
+        report = {'error': ''}
+        topics = msg.get('topics')
+        try :
+            if topics is not None and not isinstance(topics, list) : raise ValueError("topics must be a list")
+            if msg['request'] == 'subscribe' : self.server.subscribe(self, topics)
+            else : self.server.unsubscribe(self, topics)
+        except ValueError as e :
+            report['error'] = str(e)
+        report['topics'], report['all'] = self.server.getTopics(self)
+        log.debug("Client %s %s, topics : %s", self.peer_address[1], msg['request'], report['topics'])
+        if msg['header']['type'] == 'req-ack' :
+            ack = {'header': {'type': 'ack', 'idws': self.peer_address[1], 'idmsg': msg['header'].get('idmsg'),
+                                     'ip': self.peer_address[0], 'timestamp': long(time.time()*100)},
+                       'request': msg['request'], 'error': report['error'], 'data': report}
+            self.send(json.dumps(ack))
+
     def sendAck(self, msg):
         """Send return confirmation message (Ack)."""
         msg.update({'header': {'type':'ack', 'idws' : self.peer_address[1] , 'ip' : self.peer_address[0],  'timestamp' : long(time.time()*100)}})
         self.send(json.dumps(msg))
-        self.server.logMsg("debug",  "WebSocket Client have send Ack : {0}".format(msg))
+        self.server.logMsg("debug",  "WebSocket Client have send Ack : %s", msg)
 
 def getServerOnPort(port):
-    server = None
-    for s in __ctrlServer__ :  # Find conresponding server object
-        if s.port == port : 
-            server = s
-            break
-    return server
+    return __ctrlServer__.get(port)
@@ -43,6 +43,9 @@ setup(
           'ws4py >= 0.3.2',
           'wsgiref >= 0.1.2',
 	      ],
+    extras_require = {
+        'asyncio': ['trollius >= 2.0', 'futures >= 3.0'],
+        },
     zip_safe = False,
     license = 'GPL v3',
     #include_package_data = True,
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+""" Benchmark of BroadcastServer.broadcastMessage fan-out, without network.
+
+Clients are ws4py WebSocketsHandler on fake sockets, so websocket framing cost is included.
+A 'codereceived' pub is broadcast to each clients number, per client cost is reported for :
+    - legacy : header build and json.dumps of whole message by client (old broadcastMessage).
+    - client-header : body serialized once, client header spliced.
+    - shared-header : one frame for all clients.
+    - subscribed : client-header, 1 client of 10 subscribed to pub encoder, others to another encoder (topic index).
+
+    python tests/broadcast_bench.py --clients 10 100 200 500 --repeat 20
+"""
+
+import sys
+import os
+import time
+import json
+import argparse
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.wsserver import BroadcastServer, WebSocketsHandler
+
+CODE = "2100010000101101111100100000011110000000000000000000000000100000032100010000101101111100100000000000000000010000010000101000000000011110101000000000000000000000000000000000000000000000000000000110000000000000000010101110"
+
+class FakeSock(object):
+    """Socket counting sent bytes."""
+    def __init__(self, port):
+        self.port = port
+        self.sent = 0
+
+    def sendall(self, data):
+        self.sent += len(data)
+
+    def getpeername(self):
+        return ('192.168.0.10', self.port)
+
+    def getsockname(self):
+        return ('0.0.0.0', 5590)
+
+class FakeBroadcastServer(BroadcastServer):
+    """BroadcastServer without network server, clients are given websockets."""
+    def __init__(self, websockets):
+        self.log = None
+        self.sharedHeader = False
+        self.websockets = websockets
+        self.clients = {}
+        self._clientsLock = threading.Lock()
+        self._topics = {}
+        self._allTopics = set()
+        for ws in websockets : self.registerClient(ws)
+
+    def __del__(self):
+        pass
+
+    def _getWebsockets(self):
+        return list(self.websockets)
+
+    def logMsg(self, type = "info", msg ="", *args):
+        pass
+
+def legacyBroadcast(server, msg):
+    """Old broadcastMessage loop, whole message serialized by client."""
+    message = msg.copy()
+    for ws in server._getWebsockets():
+        if not ws.terminated:
+            message['header']  = {'type':'pub', 'idws' : ws.peer_address[1] , 'ip' : ws.peer_address[0],  'timestamp' : long(time.time()*100)}
+            ws.send(json.dumps(message))
+
+def makeClients(nb):
+    return [WebSocketsHandler(FakeSock(40000 + i)) for i in range(nb)]
+
+def benchBroadcast(nbClients, repeat):
+    """Return per client cost in us of each broadcast mode for nbClients."""
+    server = FakeBroadcastServer(makeClients(nbClients))
+    msg = {"host": "rpi", "type": "codereceived", "data": {"encoder": "DAIKIN", "code": CODE, "error": ""}}
+    modes = [('legacy', lambda: legacyBroadcast(server, msg)),
+                    ('client-header', lambda: server.broadcastMessage(msg, False)),
+                    ('shared-header', lambda: server.broadcastMessage(msg, True))]
+    server.subscribed = FakeBroadcastServer(makeClients(nbClients))
+    for i, ws in enumerate(server.subscribed.websockets) :
+        server.subscribed.subscribe(ws, [{'type': 'codereceived', 'encoder': 'DAIKIN' if i % 10 == 0 else 'RC5'}])
+    modes.append(('subscribed', lambda: server.subscribed.broadcastMessage(msg, False)))
+    result = {}
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try :
+        for name, fn in modes :
+            t = time.time()
+            for i in range(repeat) : fn()
+            result[name] = (time.time() - t) * 1e6 / (repeat * nbClients)
+    finally :
+        sys.stdout.close()
+        sys.stdout = stdout
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "BroadcastServer fan-out benchmark.")
+    parser.add_argument("--clients", type = int, nargs = "+", default = [10, 100, 200, 500])
+    parser.add_argument("--repeat", type = int, default = 20)
+    args = parser.parse_args()
+    print "{0:>8} {1:>14} {2:>14} {3:>14} {4:>14}   (us by client)".format("clients", "legacy", "client-header", "shared-header", "subscribed")
+    for nb in args.clients :
+        r = benchBroadcast(nb, args.repeat)
+        print "{0:>8} {1:>14.1f} {2:>14.1f} {3:>14.1f} {4:>14.1f}".format(nb, r['legacy'], r['client-header'], r['shared-header'], r['subscribed'])
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+""" Check of PulseRingBuffer (capture.py) producers / consumer, without Raspberry.
+
+    - bad capture : a put with bad pairs raises, next puts must not block (slot of bad capture committed empty)
+      and consumer must skip it.
+    - producers : N producer threads put captures while one consumer gets them, each capture must be read once.
+
+Exit status is 1 if a check fails.
+
+    python tests/capture_ring.py --producers 6 --captures 200
+"""
+
+import sys
+import os
+import threading
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.capture import PulseRingBuffer
+
+TIMEOUT = 5.0   # Max time (s) of a check thread
+
+def runThread(fn, args = (), timeout = TIMEOUT):
+    """Run fn(*args) in a thread, return False if it is still running after timeout (s)."""
+    th = threading.Thread(None, fn, "th_check", args, {})
+    th.daemon = True
+    th.start()
+    th.join(timeout)
+    return not th.is_alive()
+
+def checkBadCapture():
+    """Return error string, empty if ok."""
+    ring = PulseRingBuffer(slots = 4, maxPairs = 8)
+    try :
+        ring.put([[1, 2], ['x', 3]])
+        return "bad capture not raised"
+    except ValueError :
+        pass
+    if not runThread(ring.put, ([[1, 2]], 7)) : return "put blocked after bad capture"
+    capture = ring.get(0.1)
+    if capture is None or capture[0].toList() != [[1, 2]] or capture[1] != 7 : return "bad capture not skipped : {0}".format(capture)
+    if ring.get(0.01) is not None : return "ring not empty"
+    if ring.getStats()['invalid'] != 1 : return "invalid captures not counted"
+    return ""
+
+def checkProducers(producers, captures):
+    """Return error string, empty if ok."""
+    ring = PulseRingBuffer(slots = 16, maxPairs = 4)
+    read = []
+    def produce(n):
+        for i in range(captures) :
+            while not ring.put([[n, i]]) : pass     # ring full, retry
+    def consume():
+        while len(read) < producers * captures :
+            capture = ring.get(0.5)
+            if capture is None : return
+            read.append(tuple(capture[0].toList()[0]))
+    consumer = threading.Thread(None, consume, "th_consumer", (), {})
+    consumer.daemon = True
+    consumer.start()
+    threads = [threading.Thread(None, produce, "th_producer", (n, ), {}) for n in range(producers)]
+    for th in threads : th.daemon = True; th.start()
+    for th in threads : th.join(TIMEOUT)
+    consumer.join(TIMEOUT)
+    if len(read) != producers * captures or len(set(read)) != len(read) :
+        return "{0} captures read, {1} unique, {2} expected".format(len(read), len(set(read)), producers * captures)
+    return ""
+
+def main():
+    parser = argparse.ArgumentParser(description = "Capture ring producers / consumer check.")
+    parser.add_argument("--producers", type = int, default = 6)
+    parser.add_argument("--captures", type = int, default = 200)
+    args = parser.parse_args()
+    status = 0
+    for label, fn, fnArgs in (("bad capture", checkBadCapture, ()), ("producers", checkProducers, (args.producers, args.captures))) :
+        result = []
+        if not runThread(lambda: result.append(fn(*fnArgs)), timeout = 4 * TIMEOUT) : result = ["blocked"]
+        print "{0} : {1}".format(label, result[0] or "ok")
+        if result[0] : status = 1
+    sys.exit(status)
+
+if __name__ == '__main__':
+    main()
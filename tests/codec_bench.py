@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+""" Microbenchmarks of codec and broadcast hot paths, without Raspberry nor network.
+
+    - DaikinCode : irCodeToRAW, frameToRAW, hexToRAW, validateChecksum, rawToIRCode (python and numpy classify)
+      on synthetic captures with jitter, foreign remote and noise captures, and stream decoder on the same captures.
+    - RpiIRTrans.rawToIRCode with N registered encoders, on simulated backend (irbackend.py).
+    - Pulse train transport : binary frame (binframe.py) pack/unpack against JSON dumps/loads.
+    - BroadcastServer.broadcastMessage with M fake clients (see broadcast_bench.py).
+
+Results (us by operation) are printed and can be saved in JSON to follow regressions between releases :
+
+    python tests/codec_bench.py --json bench-0.2.json
+    python tests/codec_bench.py --encoders 1 4 8 --clients 10 100 --repeat 200
+"""
+
+import sys
+import os
+import time
+import json
+import random
+import platform
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.daikincode import DaikinCode, DaikinFrame, DAIKINTIMINGS, DAIKINHEADER, DAIKINCODELENGHT
+from lib.irprotocol import numpy
+from lib.rpi_irtrans import RpiIRTrans
+from lib.irbackend import SimulatedBackend
+from lib.binframe import PulsePairs, packFrame, unpackFrame
+from irsynth import randomCode, codeToPulses, foreignPulses, noisePulses
+from broadcast_bench import benchBroadcast
+
+def timeIt(fn, args, repeat):
+    """Return mean time in us of fn(*args) on repeat calls, best of 3 runs."""
+    best = None
+    for run in range(3) :
+        t = time.time()
+        for i in xrange(repeat) : fn(*args)
+        t = (time.time() - t) * 1e6 / repeat
+        if best is None or t < best : best = t
+    return best
+
+def benchCodec(repeat, jitter, rnd):
+    """Return {bench name: us} of DaikinCode methods."""
+    results = {}
+    codes = [randomCode(rnd) for i in range(8)]
+    captures = [codeToPulses(c, jitter = jitter, rnd = rnd) for c in codes]
+    lenH = len(DAIKINHEADER)
+    code = codes[0][lenH:lenH + DAIKINCODELENGHT]
+    checksum = codes[0][lenH + DAIKINCODELENGHT:lenH + DAIKINCODELENGHT + 8]
+    for useNumpy in ([False, True] if numpy is not None else [False]) :
+        encoder = DaikinCode(useNumpy = useNumpy)
+        name = "numpy" if useNumpy else "python"
+        results['daikin.rawToIRCode.' + name] = timeIt(lambda: [encoder.rawToIRCode(c) for c in captures], (), repeat) / len(captures)
+        foreign = [foreignPulses(rnd) for i in range(8)]
+        results['daikin.rawToIRCode.foreign.' + name] = timeIt(lambda: [encoder.rawToIRCode(c) for c in foreign], (), repeat) / len(foreign)
+        noise = [noisePulses(rnd) for i in range(8)]
+        results['daikin.rawToIRCode.noise.' + name] = timeIt(lambda: [encoder.rawToIRCode(c) for c in noise], (), repeat) / len(noise)
+    encoder = DaikinCode()
+    def stream(pulsePairs):
+        decoder = encoder.streamDecoder()
+        decoder.feedPairs(pulsePairs)
+        return decoder.result()
+    for name, pulses in (("", captures), (".foreign", foreign), (".noise", noise)) :
+        results['daikin.stream' + name] = timeIt(lambda: [stream(c) for c in pulses], (), repeat) / len(pulses)
+    frame = DaikinFrame.fromString(codes[0])
+    results['daikin.irCodeToRAW'] = timeIt(encoder.irCodeToRAW, (codes[0], ), repeat)
+    results['daikin.frameToRAW'] = timeIt(encoder.frameToRAW, (frame, ), repeat)
+    results['daikin.hexToRAW'] = timeIt(encoder.hexToRAW, (frame.toHex(), ), repeat)
+    results['daikin.validateChecksum'] = timeIt(encoder.validateChecksum, (code, checksum), repeat)
+    return results
+
+def benchFrames(repeat, jitter, rnd):
+    """Return {bench name: us} of a capture transport, binary frame against JSON."""
+    from array import array
+    results = {}
+    pulses = PulsePairs(array('i', [v for p in codeToPulses(randomCode(rnd), jitter = jitter, rnd = rnd) for v in p]))
+    meta = {'header': {'type': 'pub', 'idws': 'for each', 'ip': '0.0.0.0', 'timestamp': 0}, 'type': 'rawcapture',
+            'data': {'encoder': 'DAIKIN', 'code': '', 'error': ''}}
+    frame = packFrame(meta, pulses)
+    message = dict(meta, data = dict(meta['data'], pulses = pulses.toList()))
+    text = json.dumps(message)
+    results['frame.pack'] = timeIt(packFrame, (meta, pulses), repeat)
+    results['frame.unpack'] = timeIt(unpackFrame, (frame, ), repeat)
+    results['frame.json.dumps'] = timeIt(lambda: json.dumps(dict(meta, data = dict(meta['data'], pulses = pulses.toList()))), (), repeat)
+    results['frame.json.loads'] = timeIt(json.loads, (text, ), repeat)
+    print "Capture of {0} pairs : binary frame {1} bytes, JSON {2} bytes".format(len(pulses), len(frame), len(text))
+    return results
+
+class BenchManager(object):
+    """Manager of bench RpiIRTrans, published messages are ignored."""
+
+    def sendToWSClients(self, type, message):
+        pass
+
+def makeTrans(nbEncoders):
+    """Return a RpiIRTrans on simulated backend, with nbEncoders Daikin like encoders (timings scaled by encoder)."""
+    trans = RpiIRTrans(BenchManager(), backend = SimulatedBackend(loopback = False),
+                       fileBackup = os.path.join(tempfile.gettempdir(), "codec_bench_irtranslast.txt"))
+    for i in range(nbEncoders - 1, -1, -1) :
+        k = 1 + 0.3 * i
+        timings = dict((s, [int(p * k), int(q * k)]) for s, (p, q) in DAIKINTIMINGS.items())
+        trans.register_Encoder("DAIKIN" if i == 0 else "DAIKIN{0}".format(i), DaikinCode(timings))
+    return trans
+
+def benchTrans(encoders, repeat, jitter, rnd):
+    """Return {bench name: us} of RpiIRTrans.rawToIRCode for each encoders number."""
+    results = {}
+    capture = codeToPulses(randomCode(rnd), jitter = jitter, rnd = rnd)
+    foreign = foreignPulses(rnd)
+    for nb in encoders :
+        trans = makeTrans(nb)
+        try :
+            results['trans.rawToIRCode.{0}'.format(nb)] = timeIt(trans.rawToIRCode, (capture, ), repeat)
+            results['trans.rawToIRCode.foreign.{0}'.format(nb)] = timeIt(trans.rawToIRCode, (foreign, ), repeat)
+        finally :
+            trans.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description = "Codec and broadcast microbenchmarks.")
+    parser.add_argument("--repeat", type = int, default = 100)
+    parser.add_argument("--jitter", type = int, default = 80, help = "Max +- us on synthetic pulses and pauses.")
+    parser.add_argument("--encoders", type = int, nargs = "+", default = [1, 4, 8])
+    parser.add_argument("--clients", type = int, nargs = "+", default = [10, 100])
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--json", help = "Save results in this JSON file.")
+    args = parser.parse_args()
+    rnd = random.Random(args.seed)
+    results = benchCodec(args.repeat, args.jitter, rnd)
+    results.update(benchFrames(args.repeat, args.jitter, rnd))
+    results.update(benchTrans(args.encoders, args.repeat, args.jitter, rnd))
+    for nb in args.clients :
+        for mode, us in benchBroadcast(nb, max(1, args.repeat / 10)).items() :
+            results['broadcast.{0}.{1}'.format(mode, nb)] = us * nb
+    for name in sorted(results) :
+        print "{0:<40} {1:>12.1f} us".format(name, results[name])
+    if args.json :
+        report = {'date': time.strftime("%Y-%m-%dT%H:%M:%S"), 'python': platform.python_version(), 'machine': platform.machine(),
+                  'numpy': numpy.__version__ if numpy is not None else None, 'params': vars(args), 'results': results}
+        with open(args.json, "w") as f :
+            json.dump(report, f, indent = 2, sort_keys = True)
+        print "Results saved in {0}".format(args.json)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+""" Daikin decoder and encoder equivalence test against reference results, without Raspberry.
+
+Fixed captures are synthesized by irsynth.py from a seed (clean, jitter, glitches, truncated, corrupted header,
+foreign remote and noise captures) and fixed codes are encoded. Results of DaikinCode (python and NumPy classify,
+stream decoder) must be the same as the reference file, saved from the Daikin decoder before the protocol
+engine (irprotocol.py). Exit status is 1 if a result differs.
+
+    python tests/daikin_equivalence.py
+    python tests/daikin_equivalence.py --save tests/daikin_reference.json   (new reference, from current DaikinCode)
+"""
+
+import sys
+import os
+import json
+import random
+import hashlib
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.daikincode import DaikinCode
+from lib.irprotocol import numpy
+from irsynth import randomCode, codeToPulses, foreignPulses, noisePulses
+
+REFERENCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "daikin_reference.json")
+SEED = 2014
+NBCASES = 40
+
+def makeCaptures(rnd):
+    """Return list of (case name, pulse pairs) of fixed captures."""
+    captures = []
+    for i in range(NBCASES) :
+        code = randomCode(rnd)
+        captures.append(("clean.{0}".format(i), codeToPulses(code, rnd = rnd, startPulse = i % 4 != 0)))
+        captures.append(("jitter.{0}".format(i), codeToPulses(code, jitter = [80, 150, 220, 300][i % 4], rnd = rnd)))
+        captures.append(("glitch.{0}".format(i), codeToPulses(code, jitter = 50, noise = 0.01, rnd = rnd)))
+        pulses = codeToPulses(code, jitter = 50, rnd = rnd)
+        captures.append(("truncated.{0}".format(i), pulses[:rnd.randint(1, len(pulses))]))
+        pulses = codeToPulses(code, jitter = 50, rnd = rnd)
+        pulses[rnd.randint(2, 60)] = [rnd.randint(300, 3000), rnd.randint(300, 3000)]
+        captures.append(("header.{0}".format(i), pulses))
+        captures.append(("foreign.{0}".format(i), foreignPulses(rnd)))
+        captures.append(("noise.{0}".format(i), noisePulses(rnd)))
+    return captures
+
+def pulsesDigest(pulsePairs):
+    return hashlib.md5(json.dumps([[int(p[0]), int(p[1])] for p in pulsePairs])).hexdigest()
+
+def buildResults(encoderClass, stream = False):
+    """Return {case name: result} of encoderClass on fixed captures and codes, stream : decode with stream decoder."""
+    rnd = random.Random(SEED)
+    results = {}
+    for useNumpy in ([False, True] if numpy is not None else [False]) :
+        encoder = encoderClass(useNumpy = useNumpy)
+        path = "numpy" if useNumpy else "python"
+        for name, pulses in makeCaptures(random.Random(SEED)) :
+            if stream :
+                decoder = encoder.streamDecoder()
+                decoder.feedPairs(pulses)
+                r = decoder.result()
+            else : r = encoder.rawToIRCode(pulses)
+            results["decode.{0}.{1}".format(path, name)] = [r['error'], r['code']] + ([r['rejected']] if stream else [])
+    encoder = encoderClass()
+    for i in range(NBCASES) :
+        code = randomCode(rnd)
+        hexCode = encoder.codeToHex(code)
+        results["encode.{0}".format(i)] = [pulsesDigest(encoder.irCodeToRAW(code)), hexCode, pulsesDigest(encoder.hexToRAW(hexCode))]
+    results["encode.bad"] = [pulsesDigest(encoder.irCodeToRAW(code[:50] + "7" + code[51:])), encoder.codeToHex(code[:-9]),
+                             pulsesDigest(encoder.hexToRAW("zz"))]
+    return results
+
+def compare(results, reference):
+    """Return names of cases differing from reference, stream results (rejected index) may give a decoded prefix.
+       A capture without symbol gave no error in reference, it is now a header error."""
+    failed = []
+    for name in sorted(reference) :
+        r, ref = results.get(name), reference[name]
+        if name.startswith("decode.") and ref == ["", ""] : ref = [DaikinCode()._headerError, ""]
+        if r is None :
+            if not (numpy is None and name.startswith("decode.numpy.")) : failed.append(name)
+        elif len(r) == 3 :
+            if r[0] != ref[0] or not ref[1].startswith(r[1]) or (not r[2] and r[1] != ref[1]) : failed.append(name)
+        elif r != ref : failed.append(name)
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description = "Daikin decoder and encoder equivalence test.")
+    parser.add_argument("--reference", default = REFERENCE)
+    parser.add_argument("--save", help = "Save current DaikinCode results as reference in this file.")
+    args = parser.parse_args()
+    if args.save :
+        with open(args.save, "w") as f :
+            json.dump(buildResults(DaikinCode), f, indent = 0, sort_keys = True)
+        print "Reference saved in {0}".format(args.save)
+        return
+    with open(args.reference) as f :
+        reference = json.load(f)
+    status = 0
+    for label, stream in (("rawToIRCode", False), ("stream", True)) :
+        failed = compare(buildResults(DaikinCode, stream), reference)
+        print "{0} : {1} cases, {2} differ {3}".format(label, len(reference), len(failed), " ".join(failed[:10]))
+        if failed : status = 1
+    sys.exit(status)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+""" Synthetic IR captures for benchmarks and tests, without Raspberry.
+
+Daikin pulse trains are built from DAIKINTIMINGS symbols like a BCMWatchPulsePairsGPIO capture (start pulse
+then frame pairs), with random jitter on each pulse/pause and optional glitches.
+Foreign remote (NEC like TV remote) and noise bursts captures are also provided.
+
+    from irsynth import randomCode, codeToPulses
+    code = randomCode(rnd)
+    pulsePairs = codeToPulses(code, jitter = 80, noise = 0.01, rnd = rnd)
+"""
+
+import sys
+import os
+import random
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.daikincode import DaikinCode, DaikinFrame, DAIKINTIMINGS, DAIKINDATALENGHT
+
+NECTIMINGS = {'leader': [9000, 4500], 0: [560, 560], 1: [560, 1690], 'end': [560, 40000]}
+
+def randomFrame(rnd = random, trailer = "0"):
+    """Return a valid DaikinFrame with random data bytes."""
+    return DaikinFrame(bytearray(rnd.randint(0, 255) for i in range(DAIKINDATALENGHT)), trailer = trailer)
+
+def randomCode(rnd = random, trailer = "0"):
+    """Return symbols string of a valid random Daikin frame."""
+    return randomFrame(rnd, trailer).toString()
+
+def codeToPulses(code, timings = DAIKINTIMINGS, jitter = 0, noise = 0.0, rnd = random, startPulse = True):
+    """Return pulse pairs of symbols string code.
+       @param jitter: max +- us added to each pulse and pause.
+       @param noise: probability of each pair to be replaced by a glitch (short random pair)."""
+    pulsePairs = [list(DaikinCode.STARTPULSE)] if startPulse else []
+    for c in code :
+        p = timings[int(c)]
+        if noise and rnd.random() < noise :
+            pulsePairs.append([rnd.randint(20, 200), rnd.randint(20, 2000)])
+        elif jitter :
+            pulsePairs.append([p[0] + rnd.randint(-jitter, jitter), p[1] + rnd.randint(-jitter, jitter)])
+        else :
+            pulsePairs.append([p[0], p[1]])
+    return pulsePairs
+
+def foreignPulses(rnd = random, jitter = 50):
+    """Return pulse pairs of a NEC like TV remote frame (leader, 32 bits, end)."""
+    pulsePairs = [NECTIMINGS['leader']] + [NECTIMINGS[rnd.randint(0, 1)] for i in range(32)] + [NECTIMINGS['end']]
+    return [[p + rnd.randint(-jitter, jitter), s + rnd.randint(-jitter, jitter)] for p, s in pulsePairs]
+
+def noisePulses(rnd = random, nbPairs = None):
+    """Return pulse pairs of a light noise burst, short random pulses."""
+    if nbPairs is None : nbPairs = rnd.randint(1, 40)
+    return [[rnd.randint(5, 150), rnd.randint(5, 3000)] for i in range(nbPairs)]
+
+if __name__ == '__main__':
+    rnd = random.Random(0)
+    code = randomCode(rnd)
+    print code
+    print DaikinCode().rawToIRCode(codeToPulses(code, jitter = 80, rnd = rnd))
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+""" End to end load test of a running IR transceiver server.
+
+N ws4py clients speak the wsclient_test.py protocol (ack-connect, 'req-ack' requests) and each sends its
+requests one after the other. Latency of the first ack and of the final ack ('sendIRCode' is acked when
+queued, then when sent) are reported in percentiles, with throughput, errors and timeouts.
+Run it without Raspberry against a server started on simulated backend :
+
+    python bin/ir_transceiver.py --simulate --ws-backend asyncio --port 5590
+    python tests/load_harness.py --clients 200 --requests 5 --request getState
+    python tests/load_harness.py --clients 20 --requests 3 --request sendIRCode --json load.json
+    python bin/ir_transceiver.py --simulate --ws-backend asyncio --channel main:18:25:17 --channel bed:23:0:24:gpio
+    python tests/load_harness.py --clients 20 --requests 3 --request sendIRCode --channels main bed
+"""
+
+import time
+import json
+import random
+import threading
+import argparse
+
+from ws4py.client.threadedclient import WebSocketClient
+
+from irsynth import randomCode
+
+REQUESTS = ["sendIRCode", "sendIRCodes", "getState", "getMemIRCode", "getHistory", "server-hbeat", "getStats"]
+
+class LoadClient(WebSocketClient):
+    """Client sending requests in sequence, a request is done at its final ack."""
+
+    def __init__(self, url, **kwargs):
+        WebSocketClient.__init__(self, url, **kwargs)
+        self.idws = None
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self.idmsg = 0
+        self.tSent = 0
+        self.ackLatencies = []
+        self.doneLatencies = []
+        self.errors = 0
+        self.timeouts = 0   # updated by runClient thread only, summed after join
+
+    def opened(self):
+        self.send(json.dumps({'header':{'type': 'ack-connect', 'idws':'request'}}))
+
+    def closed(self, code, reason=None):
+        self.done.set()
+
+    def received_message(self, message):
+        msg = json.loads(str(message))
+        header = msg['header']
+        if header['type'] == 'confirm-connect' :
+            self.idws = header['idws']
+            self.ready.set()
+        elif header['type'] == 'ack' and header.get('idmsg') == self.idmsg and not self.done.is_set() :
+            t = time.time() - self.tSent
+            data = msg.get('data', {})
+            if data.get('status') == 'queued' :
+                self.ackLatencies.append(t)   # queued, wait final ack
+                return
+            if not self.ackLatencies or len(self.ackLatencies) <= len(self.doneLatencies) : self.ackLatencies.append(t)
+            self.doneLatencies.append(t)
+            if msg.get('error', '') != '' : self.errors += 1
+            self.done.set()
+
+    def request(self, message, timeout):
+        """Send request, return False if no final ack before timeout."""
+        self.idmsg += 1
+        self.done.clear()
+        message['header'] = {'type': 'req-ack', 'idws': self.idws, 'idmsg': self.idmsg, 'ip': '127.0.0.1', 'timestamp': time.time()}
+        self.tSent = time.time()
+        self.send(json.dumps(message))
+        return self.done.wait(timeout) and not self.terminated
+
+def makeRequest(request, rnd, channel = None):
+    message = {'request': request}
+    if channel : message['channel'] = channel
+    if request == 'sendIRCode' :
+        message.update({'encoder': 'DAIKIN', 'datatype': 'BinTimings', 'code': randomCode(rnd)})
+    elif request == 'sendIRCodes' :
+        message['codes'] = [{'encoder': 'DAIKIN', 'datatype': 'BinTimings', 'code': randomCode(rnd)} for i in range(3)]
+    return message
+
+def percentiles(values):
+    """Return count, p50, p90, p99, max in ms of latencies (s)."""
+    if not values : return {'count': 0}
+    v = sorted(values)
+    pick = lambda p: v[min(len(v) - 1, int(len(v) * p / 100.0))] * 1000
+    return {'count': len(v), 'p50': pick(50), 'p90': pick(90), 'p99': pick(99), 'max': v[-1] * 1000}
+
+def runClient(client, args, seed):
+    rnd = random.Random(seed)
+    channel = args.channels[seed % len(args.channels)] if args.channels else None
+    for i in range(args.requests) :
+        if not client.request(makeRequest(args.request, rnd, channel), args.timeout) : client.timeouts += 1
+
+def main():
+    parser = argparse.ArgumentParser(description = "IR transceiver WebSocket server load harness.")
+    parser.add_argument("--url", default = "ws://localhost:5590/")
+    parser.add_argument("--clients", type = int, default = 100)
+    parser.add_argument("--requests", type = int, default = 5, help = "Requests by client.")
+    parser.add_argument("--request", choices = REQUESTS, default = "getState")
+    parser.add_argument("--timeout", type = float, default = 30.0, help = "Max time (s) waiting final ack of a request.")
+    parser.add_argument("--channels", nargs = "+", help = "IR channels of requests, spread over clients (default channel if missing).")
+    parser.add_argument("--json", help = "Save report in this JSON file.")
+    args = parser.parse_args()
+
+    t = time.time()
+    clients = []
+    for i in range(args.clients) :
+        client = LoadClient(args.url, protocols=['http-only', 'chat'])
+        client.connect()
+        clients.append(client)
+    for client in clients : client.ready.wait(args.timeout)
+    tConnect = time.time() - t
+    connected = [c for c in clients if c.ready.is_set()]
+
+    workers = [threading.Thread(None, runClient, "th_load_{0}".format(i), (c, args, i), {}) for i, c in enumerate(connected)]
+    t = time.time()
+    for w in workers : w.start()
+    for w in workers : w.join()
+    elapsed = time.time() - t
+    for client in clients : client.close()
+    for client in clients : client.run_forever()   # wait client thread end
+
+    done = sum(len(c.doneLatencies) for c in connected)
+    report = {'request': args.request, 'channels': args.channels, 'clients': args.clients, 'connected': len(connected), 'connect': tConnect,
+              'elapsed': elapsed, 'done': done, 'throughput': done / elapsed if elapsed else 0.0,
+              'errors': sum(c.errors for c in connected), 'timeouts': sum(c.timeouts for c in connected),
+              'ack': percentiles([l for c in connected for l in c.ackLatencies]),
+              'final': percentiles([l for c in connected for l in c.doneLatencies])}
+    print "{0} clients ({1} connected in {2:.2f} s), {3} x '{4}'".format(args.clients, len(connected), tConnect, args.requests, args.request)
+    print "done {0} in {1:.2f} s, {2:.1f} req/s, errors {3}, timeouts {4}".format(done, elapsed, report['throughput'], report['errors'], report['timeouts'])
+    for k in ('ack', 'final') :
+        p = report[k]
+        if p['count'] : print "{0:>6} latency ms : p50 {1:.1f}  p90 {2:.1f}  p99 {3:.1f}  max {4:.1f}".format(k, p['p50'], p['p90'], p['p99'], p['max'])
+    if args.json :
+        with open(args.json, "w") as f :
+            json.dump(report, f, indent = 2, sort_keys = True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+""" Raw captures client, for IR code learning.
+
+Connects with binary frames negotiated (see lib/binframe.py), subscribes to 'rawcapture' pubs and prints
+each received capture (decoded code if any, pairs number). Captures can be saved as JSON lines :
+
+    python tests/rawcapture_client.py --url ws://192.168.0.10:5590/ --channel main --save captures.jsonl
+"""
+
+import sys
+import os
+import json
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ws4py.client.threadedclient import WebSocketClient
+
+from lib.binframe import unpackFrame
+
+class RawCaptureClient(WebSocketClient):
+
+    def __init__(self, url, channel = None, save = None, **kwargs):
+        WebSocketClient.__init__(self, url, **kwargs)
+        self.channel = channel
+        self.save = open(save, "a") if save else None
+        self.captures = 0
+
+    def opened(self):
+        self.send(json.dumps({'header':{'type': 'ack-connect', 'idws':'request', 'binary': True}}))
+
+    def closed(self, code, reason=None):
+        if self.save : self.save.close()
+        print "Closed {0} {1}, {2} captures".format(code, reason, self.captures)
+
+    def received_message(self, message):
+        if message.is_binary :
+            meta, pulses = unpackFrame(message.data)
+            data = meta['data']
+            self.captures += 1
+            print "{0} {1} : {2} pairs, {3} {4}".format(data.get('channel', ''), meta['type'], len(pulses),
+                                                              data.get('encoder') or data.get('error', ''), data.get('code', ''))
+            if self.save :
+                self.save.write(json.dumps({'time': time.time(), 'data': data, 'pulses': pulses.toList()}) + "\n")
+                self.save.flush()
+            return
+        msg = json.loads(str(message))
+        header = msg['header']
+        if header['type'] == 'confirm-connect' and header.get('binary') :
+            topic = {'type': 'rawcapture'}
+            if self.channel : topic['channel'] = self.channel
+            self.send(json.dumps({'header': {'type': 'req-ack', 'idws': header['idws'], 'idmsg': 1, 'ip': '', 'timestamp': time.time()},
+                                  'request': 'subscribe', 'topics': [topic]}))
+        elif header['type'] == 'ack' :
+            print "Subscribed : {0} {1}".format(msg['data'].get('topics'), msg['error'])
+
+def main():
+    parser = argparse.ArgumentParser(description = "IR transceiver raw captures client.")
+    parser.add_argument("--url", default = "ws://localhost:5590/")
+    parser.add_argument("--channel", help = "Only captures of this channel.")
+    parser.add_argument("--save", help = "Append captures to this JSON lines file.")
+    args = parser.parse_args()
+    client = RawCaptureClient(args.url, args.channel, args.save, protocols=['http-only', 'chat'])
+    client.connect()
+    try :
+        client.run_forever()
+    except KeyboardInterrupt :
+        client.close()
+
+if __name__ == '__main__':
+    main()